@@ -41,6 +41,8 @@ class TaskSerializer(serializers.ModelSerializer):
     assigned_employees = UserShortSerializer(many=True)
     project = ProjectMiniSerializer()
     subtasks = SubtaskSerializer(many=True, read_only=True)
+    # "Has a DeliveredTask", as before: Task.is_delivered now copies that row's own flag
+    is_delivered = serializers.SerializerMethodField()
 
     class Meta:
         model = Task
@@ -50,7 +52,10 @@ class TaskSerializer(serializers.ModelSerializer):
             'currency', 'task_priority', 'paid_status', 'status',
             'job_due_date', 'is_delivered', 'subtasks', 'created_at'
         ]
-        
+
+    def get_is_delivered(self, obj):
+        return obj.delivered_at is not None
+
 
 class TaskCreateSerializer(serializers.ModelSerializer):
     assigned_employees = serializers.PrimaryKeyRelatedField(
@@ -59,6 +64,7 @@ class TaskCreateSerializer(serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(
         queryset=User.objects.all()
     )
+    is_delivered = serializers.SerializerMethodField()
 
     class Meta:
         model = Task
@@ -77,3 +83,6 @@ class TaskCreateSerializer(serializers.ModelSerializer):
         task = Task.objects.create(**validated_data)
         task.assigned_employees.set(assigned_employees)
         return task
+
+    def get_is_delivered(self, obj):
+        return obj.delivered_at is not None
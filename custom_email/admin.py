@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Email, Attachment, EmailUserStatus, OutgoingEmail, Mailbox, UserEmailAccount, FetchStatus
+from .models import Email, Attachment, EmailUserStatus, OutgoingEmail, Mailbox, UserEmailAccount, FetchStatus, FolderSyncState
 
 
 @admin.register(FetchStatus)
@@ -9,6 +9,12 @@ class EmailAdmin(admin.ModelAdmin):
     search_fields = ('mailbox', 'message')
 
 
+@admin.register(FolderSyncState)
+class FolderSyncStateAdmin(admin.ModelAdmin):
+    list_display = ('mailbox', 'folder', 'uidvalidity', 'uidnext', 'highestmodseq', 'last_synced_at')
+    list_filter = ('mailbox',)
+
+
 @admin.register(Email)
 class EmailAdmin(admin.ModelAdmin):
     list_display = ('id', 'subject', 'sender', 'date_received', 'folder', 'assigned_to', 'status')
@@ -29,7 +35,8 @@ class OutgoingEmailAdmin(admin.ModelAdmin):
 
 @admin.register(Mailbox)
 class MailboxAdmin(admin.ModelAdmin):
-    list_display = ('name', 'imap_username', 'smtp_host')
+    list_display = ('name', 'imap_username', 'smtp_host', 'skipped_attachments', 'skipped_attachment_bytes')
+    readonly_fields = ('skipped_attachments', 'skipped_attachment_bytes')
 
     def save_model(self, request, obj, form, change):
         super().save_model(request, obj, form, change)
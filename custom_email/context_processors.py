@@ -1,38 +1,75 @@
 from collections import defaultdict
+from functools import cache as memoize
+
+from django.core.cache import cache
 from .models import Mailbox, Email, UserEmailAccount
 
+# Cleared when the user's mailbox links change or a mailbox gets a new folder. The
+# fetch runs in the Celery worker: the clear reaches the web workers through the shared
+# cache (settings.CACHES), and the short timeout bounds anything no clear covers
+MAILBOX_CACHE_TIMEOUT = 60 * 5
+
+
+def mailbox_cache_key(user_id):
+    return f'email_sidebar:{user_id}'
+
+
+def clear_mailbox_cache(*user_ids):
+    cache.delete_many([mailbox_cache_key(user_id) for user_id in user_ids])
+
+
+def clear_mailbox_cache_for(mailbox_id):
+    clear_mailbox_cache(*UserEmailAccount.objects.filter(mailbox_id=mailbox_id).values_list('user_id', flat=True))
+
+
+def get_mailbox_summary(user):
+    """
+    The user's mailboxes and the folders of each, in two queries, cached per user.
+    Returns: {'mailboxes': [Mailbox], 'folders': {mailbox id: [folder]}}
+    """
+    key = mailbox_cache_key(user.pk)
+    summary = cache.get(key)
+    if summary is None:
+        mailboxes = list(Mailbox.objects.filter(useremailaccount__user=user))
+
+        # DEFAULT_FOLDERS = ['inbox', 'sent', 'outbox']
+        DEFAULT_FOLDERS = [choice[0] for choice in Email._meta.get_field('folder').choices]
+
+        found = defaultdict(set)
+        folders = Email.objects.filter(mailbox__in=mailboxes).values_list('mailbox_id', 'folder').distinct()
+        for mailbox_id, folder in folders:
+            found[mailbox_id].add(folder)
+
+        summary = {
+            'mailboxes': mailboxes,
+            'folders': {mailbox.id: sorted(found[mailbox.id]) or DEFAULT_FOLDERS for mailbox in mailboxes},
+        }
+        cache.set(key, summary, MAILBOX_CACHE_TIMEOUT)
+    return summary
+
+
 def user_mailboxes(request):
     if request.user.is_authenticated:
-        mailboxes = UserEmailAccount.objects.filter(user=request.user).select_related('mailbox')
-        return {'user_mailboxes': [link.mailbox for link in mailboxes]}
+        summary = memoize(lambda: get_mailbox_summary(request.user))
+        return {'user_mailboxes': lambda: summary()['mailboxes']}
     return {'user_mailboxes': []}
 
+
 def email_sidebar_context(request):
     if not request.user.is_authenticated:
         return {}
 
-    user_mailboxes = Mailbox.objects.filter(useremailaccount__user=request.user)
-
+    # Templates call callables: nothing is queried unless the page shows the mailboxes
+    summary = memoize(lambda: get_mailbox_summary(request.user))
     mailbox_id = request.GET.get('mailbox')
-    folder = request.GET.get('folder', 'inbox')
-    selected_mailbox = user_mailboxes.filter(id=mailbox_id).first() or user_mailboxes.first()
-
-    # DEFAULT_FOLDERS = ['inbox', 'sent', 'outbox']
-    DEFAULT_FOLDERS = [choice[0] for choice in Email._meta.get_field('folder').choices]
 
-    mailbox_folders = defaultdict(list)
-
-    for mailbox in user_mailboxes:
-        folders = Email.objects.filter(mailbox=mailbox).values_list('folder', flat=True).distinct()
-        folder_list = sorted(set(folders)) if folders else DEFAULT_FOLDERS
-        if not folder_list:
-            folder_list = DEFAULT_FOLDERS
-        mailbox_folders[mailbox.id] = folder_list
+    def selected_mailbox():
+        mailboxes = summary()['mailboxes']
+        return next((mailbox for mailbox in mailboxes if str(mailbox.id) == mailbox_id), None) or next(iter(mailboxes), None)
 
     return {
-        'user_mailboxes': user_mailboxes,
-        'selected_mailbox': selected_mailbox,
-        'mailbox_folders': dict(mailbox_folders),
-        'folder': folder,
+        'user_mailboxes': lambda: summary()['mailboxes'],
+        'selected_mailbox': memoize(selected_mailbox),
+        'mailbox_folders': lambda: summary()['folders'],
+        'folder': request.GET.get('folder', 'inbox'),
     }
-
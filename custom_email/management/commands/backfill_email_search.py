@@ -0,0 +1,34 @@
+import time
+from django.core.management.base import BaseCommand
+from custom_email.models import Email
+
+
+class Command(BaseCommand):
+    help = 'Fill the stored search vector of emails fetched before it existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help='Emails updated per UPDATE statement')
+        parser.add_argument('--all', action='store_true', help='Recompute every email, not only the missing vectors')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        started = time.perf_counter()
+
+        emails = Email.objects.all() if options['all'] else Email.objects.filter(search_vector__isnull=True)
+        total = emails.count()
+        self.stdout.write(f"Found {total} emails to index")
+
+        # Walk the primary key in ranges: short transactions, and no OFFSET scans
+        updated = 0
+        last_id = 0
+        while True:
+            ids = list(emails.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            updated += Email.update_search_vectors(Email.objects.filter(id__in=ids))
+            last_id = ids[-1]
+            self.stdout.write(f"  {updated}/{total} emails indexed")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Indexed {updated} emails in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,103 @@
+import time
+from django.core.management.base import BaseCommand
+from django.core.files.storage import default_storage
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from custom_email.models import Attachment, AttachmentBlob
+from tasks.models import Task
+
+
+class Command(BaseCommand):
+    help = 'Move existing attachments into the SHA-256 blob store and delete duplicate files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be deduplicated without changing anything')
+        parser.add_argument('--gc', action='store_true', help='Also delete blobs no attachment or task uses anymore')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        started = time.perf_counter()
+
+        attachments = Attachment.objects.exclude(file='').filter(blob__isnull=True).only('id', 'file', 'filename')
+        total = attachments.count()
+        self.stdout.write(f"Found {total} attachments outside the blob store")
+
+        blobs = {}
+        duplicate_files = set()
+        processed = missing = duplicate_bytes = 0
+
+        for attachment in attachments.iterator(chunk_size=500):
+            processed += 1
+            if processed % 500 == 0:
+                self.stdout.write(f"  {processed}/{total} attachments hashed")
+
+            name = attachment.file.name
+            if not default_storage.exists(name):
+                missing += 1
+                self.stdout.write(self.style.WARNING(f"Missing: {name}"))
+                continue
+
+            with default_storage.open(name, 'rb') as f:
+                sha256, size = AttachmentBlob.digest(f)
+
+            blob = blobs.get(sha256) or AttachmentBlob.objects.filter(sha256=sha256).first()
+            if blob is None:
+                # First copy of this payload: it becomes the blob as is, no copy needed
+                blob = AttachmentBlob(sha256=sha256, size=size)
+                blob.file.name = name
+                if not dry_run:
+                    blob.save()
+            elif blob.file.name != name:
+                duplicate_files.add(name)
+                duplicate_bytes += size
+            blobs[sha256] = blob
+
+            if not dry_run:
+                attachment.blob = blob
+                attachment.file.name = blob.file.name
+                attachment.size = size
+                attachment.save(update_fields=['blob', 'file', 'size'])
+
+        deleted = 0
+        if not dry_run:
+            for name in sorted(duplicate_files):
+                # Tasks created from emails may still point at the old copy
+                if Attachment.objects.filter(file=name).exists() or Task.objects.filter(file_name=name).exists():
+                    continue
+                default_storage.delete(name)
+                deleted += 1
+
+            AttachmentBlob.objects.update(ref_count=Coalesce(
+                Subquery(
+                    Attachment.objects.filter(blob=OuterRef('pk')).values('blob').annotate(total=Count('id')).values('total')
+                ),
+                Value(0),
+            ))
+
+        self.stdout.write(
+            f"{len(blobs)} distinct payloads, {len(duplicate_files)} duplicate files "
+            f"({duplicate_bytes / 1024 / 1024:.1f} MB), {missing} missing"
+        )
+
+        if options['gc']:
+            self.collect_garbage(dry_run)
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING("Dry run: nothing was changed"))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ Deduplicated {processed} attachments, deleted {deleted} duplicate files "
+                f"in {time.perf_counter() - started:.1f}s"
+            ))
+
+    def collect_garbage(self, dry_run):
+        unused = AttachmentBlob.objects.filter(ref_count=0)
+        removed = 0
+        for blob in unused:
+            if Attachment.objects.filter(blob=blob).exists() or Task.objects.filter(file_name=blob.file.name).exists():
+                continue
+            removed += 1
+            if not dry_run:
+                blob.file.delete(save=False)
+                blob.delete()
+        self.stdout.write(f"🧹 {removed} unused blobs {'would be ' if dry_run else ''}deleted")
@@ -11,7 +11,8 @@ class Command(BaseCommand):
         moved = 0
         skipped = 0
 
-        for attachment in Attachment.objects.select_related('email__mailbox'):
+        # Blob-store files are shared between attachments and must stay where they are
+        for attachment in Attachment.objects.exclude(file='').filter(blob__isnull=True).select_related('email__mailbox'):
             old_path = attachment.file.path
             if not os.path.exists(old_path):
                 self.stdout.write(self.style.WARNING(f"Missing: {old_path}"))
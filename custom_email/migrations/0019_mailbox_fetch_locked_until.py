@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('custom_email', '0018_alter_mailbox_imap_port'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mailbox',
+            name='fetch_locked_until',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
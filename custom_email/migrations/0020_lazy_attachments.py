@@ -0,0 +1,44 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:25
+
+import custom_email.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('custom_email', '0019_mailbox_fetch_locked_until'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachment',
+            name='encoding',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='part',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='size',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='email',
+            name='imap_folder',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='mailbox',
+            name='lazy_attachments',
+            field=models.BooleanField(default=True, help_text='Only download headers and the text body while fetching; attachments are downloaded when the email is opened or turned into a task'),
+        ),
+        migrations.AlterField(
+            model_name='attachment',
+            name='file',
+            field=models.FileField(blank=True, upload_to=custom_email.models.mailbox_attachment_path),
+        ),
+    ]
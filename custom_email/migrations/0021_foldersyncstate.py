@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('custom_email', '0020_lazy_attachments'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FolderSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('folder', models.CharField(help_text='Folder name on the IMAP server', max_length=255)),
+                ('uidvalidity', models.BigIntegerField(blank=True, null=True)),
+                ('uidnext', models.BigIntegerField(blank=True, null=True)),
+                ('highestmodseq', models.BigIntegerField(blank=True, null=True)),
+                ('last_synced_at', models.DateTimeField(auto_now=True)),
+                ('mailbox', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sync_states', to='custom_email.mailbox')),
+            ],
+            options={
+                'unique_together': {('mailbox', 'folder')},
+            },
+        ),
+    ]
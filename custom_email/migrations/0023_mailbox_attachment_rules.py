@@ -0,0 +1,43 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('custom_email', '0022_attachmentblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mailbox',
+            name='ignored_attachment_names',
+            field=models.TextField(blank=True, default='logo.png\nlogo.jpg\nlogo.jpeg\nsignature.png\nspacer.gif\nimage*.png\nimage*.jpg\nimage*.jpeg\nimage*.gif', help_text='One filename pattern per line, case-insensitive (* and ? wildcards)'),
+        ),
+        migrations.AddField(
+            model_name='mailbox',
+            name='ignored_attachment_types',
+            field=models.TextField(blank=True, default='application/pkcs7-signature\napplication/x-pkcs7-signature', help_text='One content type pattern per line, e.g. image/gif or application/pkcs7-*'),
+        ),
+        migrations.AddField(
+            model_name='mailbox',
+            name='min_attachment_size',
+            field=models.PositiveIntegerField(default=5120, help_text='Skip attachments smaller than this many bytes (0 keeps them all)'),
+        ),
+        migrations.AddField(
+            model_name='mailbox',
+            name='skip_inline_images',
+            field=models.BooleanField(default=True, help_text='Skip images embedded in the message body (Content-ID or inline disposition), such as logos and signatures'),
+        ),
+        migrations.AddField(
+            model_name='mailbox',
+            name='skipped_attachment_bytes',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='mailbox',
+            name='skipped_attachments',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
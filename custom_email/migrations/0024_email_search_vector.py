@@ -0,0 +1,40 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:34
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('custom_email', '0023_mailbox_attachment_rules'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='email',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='email',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='email_search_vector_gin'),
+        ),
+        # Replaced by the stored vector: the inbox search never matched this expression
+        migrations.RunSQL(
+            sql="DROP INDEX IF EXISTS email_search_vector_idx;",
+            reverse_sql="""
+                CREATE INDEX email_search_vector_idx ON custom_email_email
+                USING GIN (
+                    to_tsvector('english',
+                        left(subject, 1000) || ' ' ||
+                        left(sender, 1000) || ' ' ||
+                        left(body, 5000)
+                    )
+                );
+            """,
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('custom_email', '0024_email_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachment',
+            name='downloading_until',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:22
+
+from django.db import migrations, models
+
+
+def turn_off_size_filter(apps, schema_editor):
+    # 0023 gave every mailbox the old 5 KB default: filtering is now opted into per mailbox
+    Mailbox = apps.get_model('custom_email', 'Mailbox')
+    Mailbox.objects.filter(min_attachment_size=5 * 1024).update(min_attachment_size=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('custom_email', '0025_attachment_downloading_until'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mailbox',
+            name='min_attachment_size',
+            field=models.PositiveIntegerField(default=0, help_text='Skip attachments smaller than this many bytes (0 keeps them all)'),
+        ),
+        migrations.RunPython(turn_off_size_filter, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,17 @@
 from django.db import models
-from django.contrib.postgres.search import SearchVectorField
+from django.contrib.postgres.search import SearchQuery, SearchVector, SearchVectorField
 from django.contrib.postgres.indexes import GinIndex
 from django.utils import timezone
 from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest, Substr
+from django.utils.functional import cached_property
+from collections import Counter
+import fnmatch
+import hashlib
 import os
 
 
@@ -16,6 +25,37 @@ class FetchStatus(models.Model):
     success = models.BooleanField(default=False)
     message = models.TextField(blank=True)
 
+class FolderSyncState(models.Model):
+    """
+    What the last fetch saw of one IMAP folder, from its STATUS response.
+    An unchanged UIDVALIDITY and UIDNEXT means there is nothing new to fetch.
+    """
+    mailbox = models.ForeignKey('Mailbox', on_delete=models.CASCADE, related_name='sync_states')
+    folder = models.CharField(max_length=255, help_text="Folder name on the IMAP server")
+    uidvalidity = models.BigIntegerField(null=True, blank=True)
+    # First UID not fetched yet
+    uidnext = models.BigIntegerField(null=True, blank=True)
+    # Only reported by servers with CONDSTORE
+    highestmodseq = models.BigIntegerField(null=True, blank=True)
+    last_synced_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('mailbox', 'folder')
+
+    def __str__(self):
+        return f"{self.mailbox} / {self.folder}"
+
+# Default ingest rules, the same files tasks.utils.is_useless_attachment() leaves out of zips
+DEFAULT_IGNORED_ATTACHMENT_NAMES = "\n".join([
+    'logo.png', 'logo.jpg', 'logo.jpeg',
+    'signature.png', 'spacer.gif',
+    'image*.png', 'image*.jpg', 'image*.jpeg', 'image*.gif',
+])
+DEFAULT_IGNORED_ATTACHMENT_TYPES = "\n".join([
+    'application/pkcs7-signature', 'application/x-pkcs7-signature',
+])
+
+
 class Mailbox(models.Model):
     name = models.CharField(max_length=100, help_text="Label for this mailbox")
     
@@ -33,8 +73,68 @@ class Mailbox(models.Model):
     smtp_password = models.CharField(max_length=255)
     smtp_use_tls = models.BooleanField(default=True)
 
+    lazy_attachments = models.BooleanField(
+        default=True,
+        help_text="Only download headers and the text body while fetching; "
+                  "attachments are downloaded when the email is opened or turned into a task",
+    )
+
+    # Attachments matching these rules are dropped while fetching, before anything is downloaded or stored
+    skip_inline_images = models.BooleanField(
+        default=True,
+        help_text="Skip images embedded in the message body (Content-ID or inline disposition), "
+                  "such as logos and signatures",
+    )
+    min_attachment_size = models.PositiveIntegerField(
+        default=0,
+        help_text="Skip attachments smaller than this many bytes (0 keeps them all)",
+    )
+    ignored_attachment_names = models.TextField(
+        blank=True, default=DEFAULT_IGNORED_ATTACHMENT_NAMES,
+        help_text="One filename pattern per line, case-insensitive (* and ? wildcards)",
+    )
+    ignored_attachment_types = models.TextField(
+        blank=True, default=DEFAULT_IGNORED_ATTACHMENT_TYPES,
+        help_text="One content type pattern per line, e.g. image/gif or application/pkcs7-*",
+    )
+    skipped_attachments = models.PositiveIntegerField(default=0, editable=False)
+    skipped_attachment_bytes = models.BigIntegerField(default=0, editable=False)
+
+    # Lease held by the fetch task so one mailbox is never fetched twice at once
+    fetch_locked_until = models.DateTimeField(null=True, blank=True, editable=False)
+
     def __str__(self):
         return f"{self.name} ({self.imap_username})"
+
+    @cached_property
+    def _ignored_attachment_patterns(self):
+        def patterns(value):
+            return [line.strip().lower() for line in (value or '').splitlines() if line.strip()]
+        return patterns(self.ignored_attachment_names), patterns(self.ignored_attachment_types)
+
+    def ignores_attachment(self, filename, content_type='', size=None, inline=False):
+        """
+        Whether the ingest rules of this mailbox drop an attachment, judged
+        from its MIME headers and size only.
+        """
+        names, types = self._ignored_attachment_patterns
+        content_type = (content_type or '').lower()
+        if self.skip_inline_images and inline and content_type.startswith('image/'):
+            return True
+        if size is not None and size < self.min_attachment_size:
+            return True
+        filename = (filename or '').lower()
+        return (
+            any(fnmatch.fnmatchcase(filename, pattern) for pattern in names)
+            or any(fnmatch.fnmatchcase(content_type, pattern) for pattern in types)
+        )
+
+    def record_skipped_attachments(self, count, size):
+        if count:
+            Mailbox.objects.filter(pk=self.pk).update(
+                skipped_attachments=F('skipped_attachments') + count,
+                skipped_attachment_bytes=F('skipped_attachment_bytes') + size,
+            )
     
 
 class UserEmailAccount(models.Model):
@@ -51,6 +151,12 @@ STATUS_CHOICES = [
     ('resolved', 'Resolved'),
 ]
 
+# Text search configuration of Email.search_vector, queries must use the same one
+EMAIL_SEARCH_CONFIG = 'english'
+# A tsvector is limited to 1MB: only the start of very long bodies is indexed
+EMAIL_SEARCH_BODY_CHARS = 100000
+
+
 class Email(models.Model):
     mailbox = models.ForeignKey('Mailbox', on_delete=models.CASCADE)
     sender = models.CharField(max_length=512)
@@ -65,9 +171,14 @@ class Email(models.Model):
     is_read = models.BooleanField(default=False)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='new')
     uid = models.BigIntegerField(null=True, blank=True, db_index=True)
+    # Folder name on the IMAP server (`folder` is normalized), used to download attachments later
+    imap_folder = models.CharField(max_length=255, blank=True)
+    # Subject (weight A), sender (B) and body (C), filled by update_search_vectors()
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         indexes = [
+            GinIndex(fields=['search_vector'], name='email_search_vector_gin'),
             models.Index(fields=['mailbox', 'folder', 'is_read', 'date_received']),
             models.Index(fields=['mailbox', 'folder', 'status', 'date_received']),
             models.Index(fields=['mailbox', 'folder', 'date_received']),
@@ -81,18 +192,114 @@ class Email(models.Model):
     def __str__(self):
         return f"{self.subject} from {self.sender}"
 
+    @staticmethod
+    def search_vector_expression():
+        return (
+            SearchVector('subject', weight='A', config=EMAIL_SEARCH_CONFIG)
+            + SearchVector('sender', weight='B', config=EMAIL_SEARCH_CONFIG)
+            + SearchVector(Substr('body', 1, EMAIL_SEARCH_BODY_CHARS), weight='C', config=EMAIL_SEARCH_CONFIG)
+        )
+
+    @staticmethod
+    def search_query(text):
+        return SearchQuery(text, config=EMAIL_SEARCH_CONFIG, search_type='websearch')
+
+    @classmethod
+    def update_search_vectors(cls, queryset):
+        """
+        Computes the search vector of the emails in the queryset with one UPDATE.
+        Returns: int number of emails updated.
+        """
+        return queryset.update(search_vector=cls.search_vector_expression())
+
 def mailbox_attachment_path(instance, filename):
     mailbox_name = instance.email.mailbox.name.replace(" ", "_")
     return f"attachments/{mailbox_name}/{filename}"
 
+
+def attachment_blob_path(instance, filename):
+    extension = os.path.splitext(filename)[1].lower()[:10]
+    return f"attachments/blobs/{instance.sha256[:2]}/{instance.sha256}{extension}"
+
+
+BLOB_CHUNK_SIZE = 1024 * 1024
+
+
+class AttachmentBlob(models.Model):
+    """
+    One stored copy of an attachment payload, shared by every Attachment
+    with the same SHA-256. ref_count is the number of attachments using it.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to=attachment_blob_path, max_length=255)
+    size = models.BigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.ref_count} refs)"
+
+    @staticmethod
+    def digest(content):
+        """
+        Returns (sha256 hex, size) of bytes or a file object, read in chunks.
+        """
+        if isinstance(content, bytes):
+            return hashlib.sha256(content).hexdigest(), len(content)
+        sha256 = hashlib.sha256()
+        size = 0
+        content.seek(0)
+        for chunk in iter(lambda: content.read(BLOB_CHUNK_SIZE), b''):
+            sha256.update(chunk)
+            size += len(chunk)
+        content.seek(0)
+        return sha256.hexdigest(), size
+
+    @classmethod
+    def store(cls, content, filename):
+        """
+        Returns the blob holding `content` (bytes or a file object). The payload is
+        only written if its SHA-256 is new. The reference is only counted once the
+        attachment row is saved (see Attachment.save_contents).
+        """
+        sha256, size = cls.digest(content)
+        blob = cls.objects.filter(sha256=sha256).first()
+        if blob is None:
+            blob = cls(sha256=sha256, size=size)
+            blob.file.save(filename, ContentFile(content) if isinstance(content, bytes) else File(content), save=False)
+            try:
+                with transaction.atomic():
+                    blob.save()
+            except IntegrityError:
+                # Stored by a concurrent fetch in the meantime
+                blob.file.delete(save=False)
+                blob = cls.objects.get(sha256=sha256)
+        return blob
+
+    @classmethod
+    def change_references(cls, deltas):
+        """
+        Applies {blob id: delta} to ref_count, one UPDATE per blob.
+        """
+        for blob_id, delta in deltas.items():
+            if blob_id and delta:
+                cls.objects.filter(pk=blob_id).update(ref_count=Greatest(F('ref_count') + delta, 0))
+
 class Attachment(models.Model):
     email = models.ForeignKey(
         Email, 
         on_delete=models.CASCADE,
         db_index=True  # Added index to foreign key
     )
-    file = models.FileField(upload_to=mailbox_attachment_path)
+    file = models.FileField(upload_to=mailbox_attachment_path, blank=True, max_length=255)
     filename = models.CharField(max_length=255)
+    blob = models.ForeignKey(AttachmentBlob, on_delete=models.SET_NULL, null=True, blank=True, related_name='attachments')
+    # MIME part on the IMAP server, for attachments that are not downloaded yet
+    part = models.CharField(max_length=64, blank=True)
+    encoding = models.CharField(max_length=32, blank=True)
+    size = models.PositiveIntegerField(null=True, blank=True)
+    # Lease of the download that claimed the part, so it is not fetched twice
+    downloading_until = models.DateTimeField(null=True, blank=True, editable=False)
 
     class Meta:
         indexes = [
@@ -112,6 +319,48 @@ class Attachment(models.Model):
     def __str__(self):
         return self.filename or os.path.basename(self.file.name)
 
+    @property
+    def is_downloaded(self):
+        return bool(self.file)
+
+    @property
+    def is_downloading(self):
+        return not self.file and self.downloading_until is not None and self.downloading_until > timezone.now()
+
+    def set_content(self, content):
+        """
+        Points the attachment (not saved) at the deduplicated blob holding `content`.
+        Save it with save_contents() so the blob references stay counted.
+        """
+        if not hasattr(self, '_saved_blob_id'):
+            self._saved_blob_id = None if self._state.adding else self.blob_id
+        self.blob = AttachmentBlob.store(content, self.filename)
+        self.file.name = self.blob.file.name
+        self.size = self.blob.size
+
+    @classmethod
+    def save_contents(cls, attachments, created=False):
+        """
+        Inserts (created=True) or updates the file, blob and size of attachments
+        and counts their blob references in the same transaction. Only rows whose
+        blob changed since they were loaded move a reference.
+        """
+        deltas = Counter()
+        for attachment in attachments:
+            previous = getattr(attachment, '_saved_blob_id', None if created else attachment.blob_id)
+            if previous != attachment.blob_id:
+                deltas[attachment.blob_id] += 1
+                deltas[previous] -= 1
+
+        with transaction.atomic():
+            if created:
+                cls.objects.bulk_create(attachments)
+            else:
+                cls.objects.bulk_update(attachments, ['file', 'blob', 'size'])
+            AttachmentBlob.change_references(deltas)
+        for attachment in attachments:
+            attachment._saved_blob_id = attachment.blob_id
+
 class EmailUserStatus(models.Model):
     email = models.ForeignKey(Email, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
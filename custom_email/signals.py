@@ -1,8 +1,11 @@
 # custom_email/signals.py
-from django.db.models.signals import post_migrate
+from django.db.models import F
+from django.db.models.signals import post_migrate, post_save, post_delete
 from django.dispatch import receiver
 from django_celery_beat.models import PeriodicTask, IntervalSchedule
 from django.db.utils import OperationalError, ProgrammingError
+from .models import Attachment, AttachmentBlob, Mailbox, UserEmailAccount
+from .context_processors import clear_mailbox_cache, clear_mailbox_cache_for
 
 @receiver(post_migrate)
 def create_fetch_email_task(sender, **kwargs):
@@ -23,3 +26,22 @@ def create_fetch_email_task(sender, **kwargs):
     except (OperationalError, ProgrammingError):
         # This is still necessary during early migration phases
         pass
+
+
+# Release the attachment's reference on its shared blob (files are removed by dedupe_attachments --gc)
+@receiver(post_delete, sender=Attachment)
+def release_attachment_blob(sender, instance, **kwargs):
+    if instance.blob_id:
+        AttachmentBlob.objects.filter(pk=instance.blob_id, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+
+
+# Sidebar mailboxes are cached per user
+@receiver([post_save, post_delete], sender=UserEmailAccount)
+def clear_user_mailboxes(sender, instance, **kwargs):
+    clear_mailbox_cache(instance.user_id)
+
+
+@receiver(post_save, sender=Mailbox)
+def clear_mailbox_users(sender, instance, created, **kwargs):
+    if not created:
+        clear_mailbox_cache_for(instance.pk)
@@ -1,6 +1,7 @@
 # custom_email/tasks/__init__.py
 
-from .fetch_emails import fetch_all_emails
+from .fetch_emails import fetch_all_emails, fetch_mailbox_emails
 from .maintenance import cleanup_old_fetch_statuses
+from .attachments import prefetch_attachments
 
-__all__ = ['fetch_all_emails', 'cleanup_old_fetch_statuses']
+__all__ = ['fetch_all_emails', 'fetch_mailbox_emails', 'cleanup_old_fetch_statuses', 'prefetch_attachments']
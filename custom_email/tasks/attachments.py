@@ -0,0 +1,161 @@
+# custom_email/tasks/attachments.py
+
+import logging
+import time
+from datetime import timedelta
+from itertools import groupby
+
+from celery import shared_task
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from custom_email.models import Email, Attachment
+from .imap import connect_mailbox, decode_part, parse_fetch_response
+
+logger = logging.getLogger(__name__)
+
+# How long a claimed attachment is left to the download that claimed it
+ATTACHMENT_DOWNLOAD_LEASE = timedelta(minutes=5)
+# How long wait=True waits for the downloads running elsewhere
+ATTACHMENT_WAIT_SECONDS = 30
+ATTACHMENT_WAIT_INTERVAL = 0.5
+
+
+def pending_attachments(emails):
+    """
+    The attachments of `emails` that were recorded at fetch time but not downloaded yet.
+    """
+    return Attachment.objects.filter(email__in=emails, file='').exclude(part='')
+
+
+def claim_attachments(emails):
+    """
+    Leases the pending attachments nobody else is downloading, in a short transaction.
+    Returns: the claimed attachments, ordered for one connection per mailbox and folder.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        claimed = list(
+            pending_attachments(emails)
+            .filter(Q(downloading_until__isnull=True) | Q(downloading_until__lt=now))
+            .select_related('email__mailbox')
+            .select_for_update(of=('self',), skip_locked=True)
+            .order_by('email__mailbox_id', 'email__imap_folder', 'email_id')
+        )
+        if claimed:
+            Attachment.objects.filter(pk__in=[a.pk for a in claimed]).update(
+                downloading_until=now + ATTACHMENT_DOWNLOAD_LEASE
+            )
+    return claimed
+
+
+def download_attachments(emails, wait=False):
+    """
+    Downloads the attachment parts that were only recorded at fetch time
+    (Mailbox.lazy_attachments), with one IMAP connection per mailbox and
+    one BODY.PEEK FETCH per email.
+
+    The pending rows are claimed with a lease (Attachment.downloading_until) before
+    the IMAP work, which runs without a transaction open, so the prefetch task and
+    the views never download the same attachment twice: rows another download has
+    claimed are skipped, or with wait=True waited for (up to ATTACHMENT_WAIT_SECONDS).
+
+    :param emails: Email queryset or iterable of Email instances
+    :param wait: bool wait for the rows being downloaded elsewhere instead of skipping them
+    :return: int number of attachments downloaded
+    """
+    downloaded = _download_claimed(claim_attachments(emails))
+    if wait:
+        deadline = time.monotonic() + ATTACHMENT_WAIT_SECONDS
+        waited = False
+        while (pending_attachments(emails).filter(downloading_until__gte=timezone.now()).exists()
+               and time.monotonic() < deadline):
+            time.sleep(ATTACHMENT_WAIT_INTERVAL)
+            waited = True
+        if waited:
+            # Picks up the rows the other download failed to fetch
+            downloaded += _download_claimed(claim_attachments(emails))
+    return downloaded
+
+
+def _download_claimed(claimed):
+    """
+    Downloads the claimed attachments, saves the ones that were fetched and
+    releases the claim on all of them.
+    Returns: int number of attachments downloaded
+    """
+    if not claimed:
+        return 0
+
+    downloaded = []
+    try:
+        for mailbox_id, mailbox_attachments in groupby(claimed, key=lambda a: a.email.mailbox_id):
+            mailbox_attachments = list(mailbox_attachments)
+            mb = mailbox_attachments[0].email.mailbox
+            try:
+                mail = connect_mailbox(mb)
+            except Exception as e:
+                logger.error(f"❌ Could not connect to {mb.imap_username} to download attachments: {e}")
+                continue
+
+            try:
+                for folder, folder_attachments in groupby(mailbox_attachments, key=lambda a: a.email.imap_folder):
+                    typ, _ = mail.select(f'"{folder}"', readonly=True)
+                    if typ != 'OK':
+                        logger.warning(f"⚠️ Could not select folder: {folder}")
+                        continue
+
+                    for email_id, email_attachments in groupby(folder_attachments, key=lambda a: a.email_id):
+                        downloaded += fetch_attachment_parts(mail, list(email_attachments))
+            finally:
+                try:
+                    mail.logout()
+                except Exception:
+                    pass
+    finally:
+        with transaction.atomic():
+            if downloaded:
+                Attachment.save_contents(downloaded)
+            Attachment.objects.filter(pk__in=[a.pk for a in claimed]).update(downloading_until=None)
+
+    logger.info(f"📎 Downloaded {len(downloaded)} of {len(claimed)} pending attachments")
+    return len(downloaded)
+
+
+def fetch_attachment_parts(mail, attachments):
+    """
+    Fetches the parts of one email's attachments and stores them.
+    Returns: the attachments whose file was saved.
+    """
+    email_obj = attachments[0].email
+    sections = ' '.join(f'BODY.PEEK[{attachment.part}]' for attachment in attachments)
+    try:
+        typ, msg_data = mail.uid('FETCH', str(email_obj.uid), f'(UID {sections})')
+        responses = parse_fetch_response(msg_data) if typ == 'OK' else []
+    except Exception as e:
+        logger.error(f"❌ Error fetching attachments of UID {email_obj.uid}: {e}")
+        return []
+    if not responses:
+        logger.warning(f"⚠️ UID {email_obj.uid} is no longer in folder '{email_obj.imap_folder}'")
+        return []
+
+    saved = []
+    for attachment in attachments:
+        data = responses[0].get(f'BODY[{attachment.part}]'.encode())
+        if not data:
+            continue
+        try:
+            attachment.set_content(decode_part(data, attachment.encoding))
+            saved.append(attachment)
+        except Exception as e:
+            logger.error(f"❌ Error saving attachment {attachment.filename} of UID {email_obj.uid}: {e}")
+    return saved
+
+
+@shared_task(name="custom_email.tasks.prefetch_attachments")
+def prefetch_attachments(email_ids):
+    """
+    Background download of attachments for emails users are likely to open.
+    """
+    return download_attachments(Email.objects.filter(id__in=email_ids))
@@ -1,28 +1,31 @@
 # fetch_emails.py
 
-import imaplib
 import email
 import re
 import email.utils
 import logging
+import time
+from datetime import timedelta
 
 from email.header import decode_header
 from django.utils import timezone
 from django.utils.timezone import make_aware, get_default_timezone
-from django.core.files.base import ContentFile
+from django.db.models import Q
 
-from custom_email.models import Mailbox, FetchStatus, Email, Attachment
+from custom_email.models import Mailbox, FetchStatus, FolderSyncState, Email, Attachment
+from custom_email.context_processors import clear_mailbox_cache_for
 from celery import shared_task
+from celery.exceptions import SoftTimeLimitExceeded
+from .imap import (
+    sanitize_string, connect_mailbox, decode_filename, decode_part,
+    parse_fetch_response, walk_bodystructure,
+)
 
 logger = logging.getLogger(__name__)
 
 JUNK_FOLDERS = {'junk', 'junk e-mail', 'spam'}
 
 
-def sanitize_string(s):
-    return s.replace('\x00', '').strip() if s else ''
-
-
 def decode_header_field(field):
     try:
         decoded, encoding = decode_header(field)[0]
@@ -34,212 +37,549 @@ def decode_header_field(field):
         return sanitize_string(field)
 
 
-@shared_task(name="custom_email.tasks.fetch_all_emails") 
-def fetch_all_emails():
-    logger.info("📥 Starting email fetch task")
+FETCH_BATCH_SIZE = 50
+# Seconds one mailbox may spend fetching; below the 5-minute beat interval
+FETCH_TIME_BUDGET = 240
+UID_RE = re.compile(rb'UID (\d+)')
+STATUS_RE = re.compile(rb'(UIDNEXT|UIDVALIDITY|HIGHESTMODSEQ) (\d+)')
 
-    for mb in Mailbox.objects.all():
-        logger.info(f"📬 Processing mailbox: {mb.imap_username}")
-        status = FetchStatus.objects.create(mailbox=mb)
 
+def parse_date(date_header):
+    """
+    Parses a Date: header into a timezone-aware datetime (now() if missing or invalid).
+    """
+    if not date_header:
+        return timezone.now()
+    try:
+        parsed_dt = email.utils.parsedate_to_datetime(date_header)
+        # If parsed_dt is naive (no tz), make it aware in default TZ
+        if parsed_dt.tzinfo is None:
+            parsed_dt = make_aware(parsed_dt, get_default_timezone())
+        return parsed_dt
+    except Exception:
+        return timezone.now()
+
+
+def extract_body(msg):
+    """
+    Returns the first plain-text, non-attachment part of the message.
+    """
+    if not msg.is_multipart():
+        try:
+            return sanitize_string(msg.get_payload(decode=True).decode(errors="ignore"))
+        except Exception:
+            return ""
+
+    for part in msg.walk():
+        ctype = part.get_content_type()
+        disp = part.get("Content-Disposition", "")
+        if ctype == "text/plain" and "attachment" not in disp:
+            try:
+                return sanitize_string(part.get_payload(decode=True).decode(errors="ignore"))
+            except Exception:
+                continue
+    return ""
+
+
+def extract_attachments(msg):
+    """
+    Returns [{'filename', 'data', 'size', 'content_type', 'inline'}] for every
+    named part with a payload, one per filename.
+    """
+    attachments = {}
+    for part in msg.walk():
+        filename = part.get_filename()
+        if not filename:
+            continue
+        decoded_filename = decode_filename(filename)
+
+        # Avoid saving duplicate attachments
+        if decoded_filename in attachments:
+            continue
+        file_data = part.get_payload(decode=True)
+        if file_data:
+            attachments[decoded_filename] = {
+                'filename': decoded_filename,
+                'data': file_data,
+                'size': len(file_data),
+                'content_type': part.get_content_type(),
+                'inline': part.get_content_disposition() == 'inline' or bool(part.get('Content-ID')),
+            }
+    return list(attachments.values())
+
+
+def build_email(msg, body, attachments, uid, mb, folder, normalized_folder):
+    """
+    Builds an unsaved Email from the parsed headers of a message.
+    """
+    return Email(
+        mailbox=mb,
+        sender=sanitize_string(msg.get("From", "")),
+        recipients=sanitize_string(msg.get("To", "")),
+        subject=decode_header_field(msg.get("Subject", "")) or "(No Subject)",
+        body=body,
+        date_received=parse_date(msg.get("Date", "")),  # use the parsed email date
+        message_id=sanitize_string(msg.get("Message-ID", f"{uid}@{mb.id}-{folder}")),
+        uid=uid,
+        folder=normalized_folder,
+        imap_folder=folder,
+        is_read=False,
+        status='new',
+        has_attachments=bool(attachments),
+    )
+
+
+def parse_email(raw_email, uid, mb, folder, normalized_folder):
+    """
+    Builds an unsaved Email from an RFC822 message.
+    Returns: (Email, [attachment dicts])
+    """
+    msg = email.message_from_bytes(raw_email)
+    attachments = extract_attachments(msg)
+    return build_email(msg, extract_body(msg), attachments, uid, mb, folder, normalized_folder), attachments
+
+
+def fetch_messages(mail, uids):
+    """
+    Fetches several messages in a single UID FETCH round-trip.
+    Returns: [(uid, raw_email)]
+    """
+    typ, msg_data = mail.uid('FETCH', ','.join(str(uid) for uid in uids), '(RFC822)')
+    if typ != 'OK':
+        return []
+
+    messages = []
+    for item in msg_data:
+        # Each message is a (b'N (UID x RFC822 {size}', raw) tuple followed by b')'
+        if not isinstance(item, tuple):
+            continue
+        match = UID_RE.search(item[0])
+        if match:
+            messages.append((int(match.group(1)), item[1]))
+    return messages
+
+
+def fetch_message_headers(mail, uids, mb, folder, normalized_folder):
+    """
+    Header-first fetch: one FETCH for the headers and BODYSTRUCTURE of every
+    message, then one FETCH per distinct text part section for the bodies.
+    Attachments are only recorded (part number, encoding, size) for later download.
+    Returns: [(Email, [attachment dicts])]
+    """
+    typ, msg_data = mail.uid('FETCH', ','.join(str(uid) for uid in uids), '(UID BODYSTRUCTURE BODY.PEEK[HEADER])')
+    if typ != 'OK':
+        return []
+
+    messages = []
+    text_sections = {}
+    for response in parse_fetch_response(msg_data):
+        try:
+            uid = int(response[b'UID'])
+            msg = email.message_from_bytes(response.get(b'BODY[HEADER]') or b'')
+            parts = list(walk_bodystructure(response[b'BODYSTRUCTURE']))
+        except Exception as email_error:
+            logger.error(f"❌ Error processing headers of UID {response.get(b'UID')}: {email_error}")
+            continue
+
+        # Same rules as extract_body(): the whole payload of a single-part message,
+        # otherwise the first inline text/plain part
+        if len(parts) == 1 and parts[0]['section'] == '1':
+            text_part = parts[0]
+        else:
+            text_part = next(
+                (part for part in parts if part['content_type'] == 'text/plain' and part['disposition'] != 'attachment'),
+                None,
+            )
+        if text_part:
+            text_sections.setdefault(text_part['section'], []).append(uid)
+
+        attachments = {}
+        for part in parts:
+            # Avoid saving duplicate attachments
+            if part['filename'] and part['size'] and part['filename'] not in attachments:
+                attachments[part['filename']] = {
+                    'filename': part['filename'],
+                    'data': None,
+                    'part': part['section'],
+                    'encoding': part['encoding'],
+                    'size': part['size'],
+                    'content_type': part['content_type'],
+                    'inline': part['disposition'] == 'inline' or bool(part['content_id']),
+                }
+        messages.append((uid, msg, text_part, list(attachments.values())))
+
+    bodies = {}
+    for section, section_uids in text_sections.items():
+        typ, body_data = mail.uid('FETCH', ','.join(str(uid) for uid in section_uids), f'(UID BODY.PEEK[{section}])')
+        if typ != 'OK':
+            continue
+        for response in parse_fetch_response(body_data):
+            bodies[int(response[b'UID'])] = response.get(f'BODY[{section}]'.encode())
+
+    parsed = []
+    for uid, msg, text_part, attachments in messages:
+        body = ""
+        if text_part and bodies.get(uid):
+            try:
+                body = sanitize_string(decode_part(bodies[uid], text_part['encoding']).decode(errors="ignore"))
+            except Exception:
+                pass
+        parsed.append((build_email(msg, body, attachments, uid, mb, folder, normalized_folder), attachments))
+    return parsed
+
+
+def filter_attachments(mb, attachments):
+    """
+    Drops the attachments the mailbox ingest rules ignore (inline logos,
+    signatures, tiny images...) before anything is downloaded or stored.
+    Returns: (kept attachments, number skipped, bytes skipped)
+    """
+    kept = []
+    skipped = skipped_bytes = 0
+    for item in attachments:
+        if mb.ignores_attachment(item['filename'], item.get('content_type'), item['size'], item.get('inline', False)):
+            skipped += 1
+            skipped_bytes += item['size'] or 0
+        else:
+            kept.append(item)
+    return kept, skipped, skipped_bytes
+
+
+def save_emails(mb, normalized_folder, parsed):
+    """
+    Inserts a batch of parsed emails with one bulk_create and stores their attachments.
+    Emails whose message_id already exists (in any folder) are skipped by the database.
+    Returns: int number of new emails.
+    """
+    emails = [email_obj for email_obj, _ in parsed]
+    try:
+        Email.objects.bulk_create(emails, ignore_conflicts=True)
+    except Exception as e:
+        # One bad row fails the whole statement: retry row by row to isolate it
+        logger.warning(f"⚠️ Batch insert failed, retrying one by one: {e}")
+        for email_obj in emails:
+            try:
+                Email.objects.bulk_create([email_obj], ignore_conflicts=True)
+            except Exception as email_error:
+                logger.error(f"❌ Error processing UID {email_obj.uid}: {email_error}")
+
+    # ignore_conflicts does not return primary keys: read back the rows this batch inserted
+    inserted = dict(
+        Email.objects.filter(
+            mailbox=mb,
+            folder=normalized_folder,
+            uid__in=[email_obj.uid for email_obj in emails],
+        ).values_list('message_id', 'id')
+    )
+
+    if inserted:
+        Email.update_search_vectors(Email.objects.filter(pk__in=inserted.values(), search_vector__isnull=True))
+
+    new_count = 0
+    for email_obj, attachments in parsed:
+        email_obj.pk = inserted.get(email_obj.message_id)
+        if email_obj.pk is None:
+            continue
+        new_count += 1
+        email_obj._state.adding = False
+
+        rows = []
+        for item in attachments:
+            try:
+                attachment = Attachment(
+                    email=email_obj,
+                    filename=item['filename'],
+                    part=item.get('part', ''),
+                    encoding=item.get('encoding', ''),
+                    size=item['size'],
+                )
+                if item['data'] is not None:
+                    attachment.set_content(item['data'])
+                rows.append(attachment)
+            except Exception as attachment_error:
+                logger.error(f"❌ Error saving attachment {item['filename']} of UID {email_obj.uid}: {attachment_error}")
+        if rows:
+            Attachment.save_contents(rows, created=True)
+    return new_count
+
+
+def fetch_folder(mail, mb, folder, since_uid=None, batch_size=FETCH_BATCH_SIZE, deadline=None):
+    """
+    Ingests the messages of the selected folder from UID `since_uid` on
+    (default: after the highest stored UID), `batch_size` messages per FETCH.
+    Stops between batches once time.monotonic() passes `deadline`.
+    Returns: (int number of new emails, first UID still to fetch or None if done)
+    """
+    normalized_folder = folder.lower().replace('.', '').strip()
+
+    # Everything already stored for this folder, loaded once
+    known = Email.objects.filter(mailbox=mb, folder=normalized_folder)
+    known_message_ids = {message_id: (pk, uid) for message_id, pk, uid in known.values_list('message_id', 'id', 'uid')}
+    known_uids = {uid for _, uid in known_message_ids.values() if uid is not None}
+    if since_uid is None:
+        since_uid = max(known_uids, default=0) + 1
+    new_folder = not known_message_ids
+
+    typ, data = mail.uid('SEARCH', None, f'UID {since_uid}:*')
+    if typ != 'OK':
+        logger.warning(f"⚠️ UID search failed in folder: {folder}")
+        return 0, since_uid
+
+    # "N:*" always matches the last message, even when it is older than N
+    uid_nums = [int(uid) for uid in data[0].split() if int(uid) >= since_uid and int(uid) not in known_uids]
+    logger.info(f"📨 Found {len(uid_nums)} new emails in folder '{folder}'")
+
+    new_count = 0
+    for start in range(0, len(uid_nums), batch_size):
+        batch = uid_nums[start:start + batch_size]
+        if deadline is not None and time.monotonic() > deadline:
+            logger.warning(f"⏱ Time budget reached in folder '{folder}' after {new_count} emails")
+            return new_count, batch[0]
         try:
-            logger.info("🔗 Connecting to IMAP server...")
-            mail = imaplib.IMAP4(mb.imap_host, mb.imap_port)
-            mail.starttls()
-            mail.login(mb.imap_username, mb.imap_password)
-            logger.info("✅ Connected and authenticated successfully.")
+            if mb.lazy_attachments:
+                fetched = fetch_message_headers(mail, batch, mb, folder, normalized_folder)
+            else:
+                fetched = []
+                for uid, raw_email in fetch_messages(mail, batch):
+                    try:
+                        fetched.append(parse_email(raw_email, uid, mb, folder, normalized_folder))
+                    except Exception as email_error:
+                        logger.error(f"❌ Error processing UID {uid}: {email_error}")
+
+            parsed = []
+            relinked = []
+            skipped = skipped_bytes = 0
+            for email_obj, attachments in fetched:
+                # Skip duplicates by message_id
+                if email_obj.message_id in known_message_ids:
+                    pk, uid = known_message_ids[email_obj.message_id]
+                    if uid is None and pk is not None:
+                        # Stored before a UIDVALIDITY reset: point it at its new UID
+                        relinked.append(Email(pk=pk, uid=email_obj.uid))
+                    continue
+                known_message_ids[email_obj.message_id] = (None, email_obj.uid)
+
+                attachments, email_skipped, email_skipped_bytes = filter_attachments(mb, attachments)
+                skipped += email_skipped
+                skipped_bytes += email_skipped_bytes
+                email_obj.has_attachments = bool(attachments)
+                parsed.append((email_obj, attachments))
+
+            if parsed:
+                new_count += save_emails(mb, normalized_folder, parsed)
+                if new_folder and new_count:
+                    # The folder now shows up in the users' sidebar
+                    clear_mailbox_cache_for(mb.pk)
+                    new_folder = False
+            if relinked:
+                Email.objects.bulk_update(relinked, ['uid'])
+            mb.record_skipped_attachments(skipped, skipped_bytes)
+        except SoftTimeLimitExceeded:
+            raise
+        except Exception as batch_error:
+            # Most likely a dropped connection: resume from this batch next time
+            logger.error(f"❌ Error fetching UIDs {batch[0]}-{batch[-1]}: {batch_error}")
+            return new_count, batch[0]
+
+    logger.info(f"✅ Stored {new_count} new emails from folder '{folder}'")
+    return new_count, None
+
+
+def folder_status(mail, folder, condstore=False):
+    """
+    One STATUS round-trip: {'uidvalidity', 'uidnext', 'highestmodseq'} of a folder, or None.
+    """
+    items = 'UIDNEXT UIDVALIDITY HIGHESTMODSEQ' if condstore else 'UIDNEXT UIDVALIDITY'
+    typ, data = mail.status(f'"{folder}"', f'({items})')
+    if typ != 'OK' or not data or not data[0]:
+        return None
+    values = {key.decode().lower(): int(value) for key, value in STATUS_RE.findall(data[-1])}
+    values.setdefault('highestmodseq', None)
+    return values
+
+
+def sync_folder(mail, mb, folder, deadline=None, condstore=False):
+    """
+    Fetches a folder only if its STATUS changed since the last sync, so an
+    idle folder costs a single round-trip. A new UIDVALIDITY invalidates the
+    stored UIDs: they are cleared and the whole folder is downloaded again from
+    UID 1. Messages already stored are only deduplicated on insert, by the
+    unique message_id conflict.
+    Returns: int number of new emails, or None if the folder was skipped.
+    """
+    status = folder_status(mail, folder, condstore)
+    state = FolderSyncState.objects.filter(mailbox=mb, folder=folder).first()
+
+    if status and state and state.uidvalidity == status['uidvalidity'] and state.uidnext == status['uidnext']:
+        # HIGHESTMODSEQ alone only means flag changes, which are not mirrored
+        if state.highestmodseq != status['highestmodseq']:
+            state.highestmodseq = status['highestmodseq']
+            state.save(update_fields=['highestmodseq', 'last_synced_at'])
+        logger.info(f"⏭ Folder '{folder}' unchanged, skipping")
+        return None
+
+    since_uid = state.uidnext if state else None
+    if status and state and state.uidvalidity is not None and state.uidvalidity != status['uidvalidity']:
+        logger.warning(f"♻️ UIDVALIDITY of folder '{folder}' changed, resyncing it")
+        Email.objects.filter(mailbox=mb, folder=folder.lower().replace('.', '').strip()).update(uid=None)
+        since_uid = 1
+
+    logger.info(f"📂 Selecting folder: {folder}")
+    typ, data = mail.select(f'"{folder}"', readonly=True)
+    if typ != 'OK':
+        logger.warning(f"⚠️ Could not select folder: {folder}")
+        return 0
+
+    new_count, resume_uid = fetch_folder(mail, mb, folder, since_uid=since_uid, deadline=deadline)
+
+    if status:
+        FolderSyncState.objects.update_or_create(
+            mailbox=mb, folder=folder,
+            defaults={
+                'uidvalidity': status['uidvalidity'],
+                # Messages that arrive after STATUS get a UID >= uidnext
+                'uidnext': resume_uid or status['uidnext'],
+                # Not "in sync" until the folder has been fetched completely
+                'highestmodseq': None if resume_uid else status['highestmodseq'],
+            },
+        )
+    return new_count
+
+
+@shared_task(name="custom_email.tasks.fetch_all_emails")
+def fetch_all_emails():
+    """
+    Fans out one fetch_mailbox_emails subtask per mailbox, so a slow IMAP
+    server only delays its own mailbox.
+    """
+    logger.info("📥 Starting email fetch task")
 
-            logger.info("📂 Fetching available folders...")
-            typ, folders = mail.list()
-            if typ != 'OK' or not folders:
-                raise Exception("Failed to list folders or no folders returned")
+    mailbox_ids = list(Mailbox.objects.values_list('id', flat=True))
+    for mailbox_id in mailbox_ids:
+        fetch_mailbox_emails.delay(mailbox_id)
+
+    logger.info(f"📤 Queued {len(mailbox_ids)} mailbox fetches")
+
+
+def acquire_mailbox_lock(mb, seconds):
+    """
+    Atomically leases the mailbox for `seconds`. Returns False if another fetch holds it.
+    The lease expires by itself if a worker dies without releasing it.
+    """
+    now = timezone.now()
+    return Mailbox.objects.filter(pk=mb.pk).filter(
+        Q(fetch_locked_until__isnull=True) | Q(fetch_locked_until__lt=now)
+    ).update(fetch_locked_until=now + timedelta(seconds=seconds)) == 1
+
+
+def release_mailbox_lock(mb):
+    Mailbox.objects.filter(pk=mb.pk).update(fetch_locked_until=None)
+
+
+@shared_task(
+    name="custom_email.tasks.fetch_mailbox_emails",
+    soft_time_limit=FETCH_TIME_BUDGET + 60,
+    time_limit=FETCH_TIME_BUDGET + 90,
+)
+def fetch_mailbox_emails(mailbox_id, time_budget=FETCH_TIME_BUDGET):
+    """
+    Fetches one mailbox under a per-mailbox lock, stopping between batches
+    once `time_budget` seconds are spent. The next run resumes from the last UID.
+    """
+    mb = Mailbox.objects.filter(pk=mailbox_id).first()
+    if mb is None:
+        return
+
+    # Lease a little longer than the hard time limit so it never expires mid-fetch
+    if not acquire_mailbox_lock(mb, time_budget + 120):
+        logger.info(f"🔒 Mailbox {mb.imap_username} is already being fetched, skipping")
+        return
+
+    logger.info(f"📬 Processing mailbox: {mb.imap_username}")
+    status = FetchStatus.objects.create(mailbox=mb)
+    deadline = time.monotonic() + time_budget
+    fetched_folders = []
+    unchanged_count = 0
+    timed_out = False
 
-            folder_names = []
+    try:
+        logger.info("🔗 Connecting to IMAP server...")
+        mail = connect_mailbox(mb)
+        logger.info("✅ Connected and authenticated successfully.")
 
-            for folder_bytes in folders:
-                try:
-                    folder_line = folder_bytes.decode(errors="ignore").strip()
+        logger.info("📂 Fetching available folders...")
+        typ, folders = mail.list()
+        if typ != 'OK' or not folders:
+            raise Exception("Failed to list folders or no folders returned")
 
-                    # Extract folder name (either quoted or unquoted at end)
-                    match = re.search(r'(?:"([^"]+)"|([^" ]+))\s*$', folder_line)
-                    if not match:
-                        logger.warning(f"⚠️ Could not parse folder line: {folder_line}")
-                        continue
+        folder_names = []
 
-                    folder_name = match.group(1) or match.group(2)
-                    folder_name = sanitize_string(folder_name)
+        for folder_bytes in folders:
+            try:
+                folder_line = folder_bytes.decode(errors="ignore").strip()
 
-                    if any(junk in folder_name.lower() for junk in JUNK_FOLDERS):
-                        logger.info(f"🚫 Skipping junk folder: {folder_name}")
-                        continue
+                # Extract folder name (either quoted or unquoted at end)
+                match = re.search(r'(?:"([^"]+)"|([^" ]+))\s*$', folder_line)
+                if not match:
+                    logger.warning(f"⚠️ Could not parse folder line: {folder_line}")
+                    continue
 
-                    folder_names.append(folder_name)
+                folder_name = match.group(1) or match.group(2)
+                folder_name = sanitize_string(folder_name)
 
-                except Exception as e:
-                    logger.warning(f"⚠️ Failed to parse folder line: {folder_bytes} — {e}")
+                if any(junk in folder_name.lower() for junk in JUNK_FOLDERS):
+                    logger.info(f"🚫 Skipping junk folder: {folder_name}")
                     continue
 
-            if not any(name.upper() == "INBOX" for name in folder_names):
-                folder_names.insert(0, "INBOX")
-                logger.warning("📥 Manually injecting INBOX into folders (not returned by server)")
-
-            logger.info(f"📋 Parsed folders: {', '.join(folder_names)}")
-
-            for folder in folder_names:
-                try:
-                    logger.info(f"📂 Selecting folder: {folder}")
-                    typ, data = mail.select(f'"{folder}"', readonly=True)
-                    if typ != 'OK':
-                        logger.warning(f"⚠️ Could not select folder: {folder}")
-                        continue
-
-                    normalized_folder = folder.lower().replace('.', '').strip()
-
-                    latest_uid_obj = Email.objects.filter(
-                        mailbox=mb,
-                        folder=normalized_folder,
-                        uid__isnull=False
-                    ).order_by('-uid').first()
-                    last_uid = latest_uid_obj.uid if latest_uid_obj else 0
-
-                    typ, data = mail.uid('SEARCH', None, f'UID {last_uid + 1}:*')
-                    if typ != 'OK':
-                        logger.warning(f"⚠️ UID search failed in folder: {folder}")
-                        continue
-
-                    uid_nums = data[0].split()
-                    logger.info(f"📨 Found {len(uid_nums)} new emails in folder '{folder}'")
-
-                    for uid in uid_nums:
-                        try:
-                            uid_str = uid.decode()
-                            typ, msg_data = mail.uid('FETCH', uid, '(RFC822)')
-                            if typ != 'OK':
-                                continue
-
-                            raw_email = msg_data[0][1]
-                            msg = email.message_from_bytes(raw_email)
-
-                            subject = decode_header_field(msg.get("Subject", ""))
-                            from_ = sanitize_string(msg.get("From", ""))
-                            to = sanitize_string(msg.get("To", ""))
-                            msg_id = sanitize_string(
-                                msg.get("Message-ID", f"{uid_str}@{mb.id}-{folder}")
-                            )
-
-                            # Skip duplicates by UID or message_id
-                            if Email.objects.filter(
-                                mailbox=mb,
-                                folder=normalized_folder,
-                                uid=int(uid)
-                            ).exists() or Email.objects.filter(message_id=msg_id).exists():
-                                continue
-
-                            # === Parse the Date: header into a timezone-aware datetime ===
-                            date_header = msg.get("Date", "")
-                            if date_header:
-                                try:
-                                    parsed_dt = email.utils.parsedate_to_datetime(date_header)
-                                    # If parsed_dt is naive (no tz), make it aware in default TZ
-                                    if parsed_dt.tzinfo is None:
-                                        parsed_dt = make_aware(parsed_dt, get_default_timezone())
-                                except Exception:
-                                    parsed_dt = timezone.now()
-                            else:
-                                parsed_dt = timezone.now()
-                            # ==================================================================
-
-                            # Extract plain-text body
-                            body = ""
-                            if msg.is_multipart():
-                                for part in msg.walk():
-                                    ctype = part.get_content_type()
-                                    disp = part.get("Content-Disposition", "")
-                                    if ctype == "text/plain" and "attachment" not in disp:
-                                        try:
-                                            body = sanitize_string(
-                                                part.get_payload(decode=True).decode(errors="ignore")
-                                            )
-                                            break
-                                        except Exception:
-                                            continue
-                            else:
-                                try:
-                                    body = sanitize_string(
-                                        msg.get_payload(decode=True).decode(errors="ignore")
-                                    )
-                                except Exception:
-                                    pass
-
-                            email_obj = Email.objects.create(
-                                mailbox=mb,
-                                sender=from_,
-                                recipients=to,
-                                subject=subject or "(No Subject)",
-                                body=body,
-                                date_received=parsed_dt,  # use the parsed email date
-                                message_id=msg_id,
-                                uid=int(uid),
-                                folder=normalized_folder,
-                                is_read=False,
-                                status='new',
-                                has_attachments=False,
-                            )
-
-                            # === Process attachments ===
-                            has_attachments = False
-                            for part in msg.walk():
-                                filename = part.get_filename()
-                                if filename:
-                                    try:
-                                        decoded_filename, enc = decode_header(filename)[0]
-                                        if isinstance(decoded_filename, bytes):
-                                            decoded_filename = decoded_filename.decode(
-                                                enc or "utf-8", errors="ignore"
-                                            )
-                                        decoded_filename = sanitize_string(decoded_filename)
-                                    except Exception:
-                                        decoded_filename = "unknown_filename"
-
-                                    # Avoid saving duplicate attachments
-                                    if Attachment.objects.filter(
-                                        email=email_obj,
-                                        filename=decoded_filename
-                                    ).exists():
-                                        continue
-
-                                    file_data = part.get_payload(decode=True)
-                                    if file_data:
-                                        Attachment(
-                                            email=email_obj,
-                                            filename=decoded_filename
-                                        ).file.save(
-                                            decoded_filename,
-                                            ContentFile(file_data),
-                                            save=True
-                                        )
-                                        has_attachments = True
-
-                            if has_attachments:
-                                email_obj.has_attachments = True
-                                email_obj.save(update_fields=["has_attachments"])
-
-                        except Exception as email_error:
-                            logger.error(f"❌ Error processing UID {uid}: {email_error}")
-
-                except Exception as e:
-                    logger.warning(f"⚠️ Exception selecting folder '{folder}': {e}")
-
-            status.success = True
-            status.message = f"✅ Fetched folders: {', '.join(folder_names)}"
-            mail.logout()
-            logger.info(f"✅ Finished fetching for {mb.imap_username}")
-
-        except Exception as e:
-            logger.error(f"❌ Fetch failed for mailbox {mb.imap_username}: {e}")
-            status.success = False
-            status.message = str(e)
-
-        status.finished_at = timezone.now()
-        status.save()
-        logger.info(f"📦 FetchStatus saved for mailbox: {mb.imap_username}")
+                folder_names.append(folder_name)
+
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to parse folder line: {folder_bytes} — {e}")
+                continue
+
+        if not any(name.upper() == "INBOX" for name in folder_names):
+            folder_names.insert(0, "INBOX")
+            logger.warning("📥 Manually injecting INBOX into folders (not returned by server)")
+
+        logger.info(f"📋 Parsed folders: {', '.join(folder_names)}")
+        condstore = 'CONDSTORE' in mail.capabilities
+
+        for folder in folder_names:
+            if time.monotonic() > deadline:
+                logger.warning(f"⏱ Time budget reached, stopping before folder '{folder}'")
+                timed_out = True
+                break
+            try:
+                if sync_folder(mail, mb, folder, deadline=deadline, condstore=condstore) is None:
+                    unchanged_count += 1
+                else:
+                    fetched_folders.append(folder)
+
+            except SoftTimeLimitExceeded:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ Exception selecting folder '{folder}': {e}")
+
+        status.success = True
+        status.message = f"✅ Fetched folders: {', '.join(fetched_folders)} ({unchanged_count} unchanged)"
+        if timed_out or time.monotonic() > deadline:
+            status.message = f"⏱ Time budget reached. {status.message}"
+        mail.logout()
+        logger.info(f"✅ Finished fetching for {mb.imap_username}")
+
+    except SoftTimeLimitExceeded:
+        logger.error(f"⏱ Time limit exceeded for mailbox {mb.imap_username}")
+        status.success = False
+        status.message = f"⏱ Time limit exceeded after folders: {', '.join(fetched_folders)}"
+
+    except Exception as e:
+        logger.error(f"❌ Fetch failed for mailbox {mb.imap_username}: {e}")
+        status.success = False
+        status.message = str(e)
+
+    finally:
+        release_mailbox_lock(mb)
+
+    status.finished_at = timezone.now()
+    status.save()
+    logger.info(f"📦 FetchStatus saved for mailbox: {mb.imap_username}")
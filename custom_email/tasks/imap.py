@@ -0,0 +1,200 @@
+# custom_email/tasks/imap.py
+
+import base64
+import imaplib
+import itertools
+import quopri
+import re
+import email.utils
+
+from email.header import decode_header
+from urllib.parse import unquote
+
+
+def sanitize_string(s):
+    return s.replace('\x00', '').strip() if s else ''
+
+
+# Seconds before a blocking IMAP socket operation gives up
+IMAP_TIMEOUT = 60
+
+
+def connect_mailbox(mb):
+    """
+    Opens an authenticated IMAP connection for the mailbox.
+    """
+    mail = imaplib.IMAP4(mb.imap_host, mb.imap_port, timeout=IMAP_TIMEOUT)
+    mail.starttls()
+    mail.login(mb.imap_username, mb.imap_password)
+    return mail
+
+
+##########################################################################################
+############################### FETCH response parsing ###################################
+
+class Literal(bytes):
+    """
+    An IMAP {n} literal: raw bytes that must not be tokenized.
+    """
+
+
+TOKEN_RE = re.compile(rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|([^\s()"\[]+(?:\[[^\]]*\](?:<\d+>)?)?))')
+LITERAL_RE = re.compile(rb'\{(\d+)\}$')
+
+
+def _chunks(msg_data):
+    # imaplib returns (b'prefix {n}', literal) tuples and plain bytes for the rest
+    for item in msg_data:
+        if isinstance(item, tuple):
+            yield LITERAL_RE.sub(b'', item[0])
+            yield Literal(item[1])
+        elif item:
+            yield item
+
+
+def _tokens(msg_data):
+    for chunk in _chunks(msg_data):
+        if isinstance(chunk, Literal):
+            yield ('atom', bytes(chunk))
+            continue
+        pos = 0
+        while pos < len(chunk):
+            match = TOKEN_RE.match(chunk, pos)
+            if not match or match.end() == pos:
+                break
+            pos = match.end()
+            if match.group(1):
+                yield ('open', None)
+            elif match.group(2):
+                yield ('close', None)
+            elif match.group(3) is not None:
+                yield ('atom', re.sub(rb'\\(.)', rb'\1', match.group(3)))
+            elif match.group(4):
+                atom = match.group(4)
+                yield ('atom', None if atom.upper() == b'NIL' else atom)
+
+
+def _parse_list(tokens):
+    items = []
+    for kind, value in tokens:
+        if kind == 'open':
+            items.append(_parse_list(tokens))
+        elif kind == 'close':
+            return items
+        else:
+            items.append(value)
+    return items
+
+
+def parse_fetch_response(msg_data):
+    """
+    Parses the data of a UID FETCH response.
+    Returns: [{b'UID': b'12', b'BODYSTRUCTURE': [...], b'BODY[1]': b'...'}]
+    """
+    tokens = _tokens(msg_data)
+    messages = []
+    for kind, value in tokens:
+        if kind != 'open':
+            continue  # the message sequence number
+        items = _parse_list(tokens)
+        messages.append({
+            (items[i] or b'').upper(): items[i + 1]
+            for i in range(0, len(items) - 1, 2)
+        })
+    return messages
+
+
+##########################################################################################
+################################# BODYSTRUCTURE ##########################################
+
+def _text(value):
+    if isinstance(value, bytes):
+        return value.decode(errors='ignore')
+    return value or ''
+
+
+def _params(values):
+    if not isinstance(values, list):
+        return {}
+    return {
+        _text(values[i]).lower(): _text(values[i + 1])
+        for i in range(0, len(values) - 1, 2)
+    }
+
+
+def _filename(params):
+    # RFC 2231 (filename*=utf-8''..., possibly split into filename*0*, filename*1*...)
+    for key in ('filename', 'name'):
+        parts = sorted(
+            (name for name in params if name.startswith(f'{key}*')),
+            key=lambda name: int(re.sub(r'\D', '', name) or 0),
+        )
+        if parts:
+            value = ''.join(params[name] for name in parts)
+            if any(name.endswith('*') for name in parts):
+                charset, _, text = email.utils.decode_rfc2231(value)
+                return unquote(text, encoding=charset or 'utf-8', errors='replace')
+            return value
+        if params.get(key):
+            return params[key]
+    return None
+
+
+def decode_filename(filename):
+    try:
+        decoded_filename, enc = decode_header(filename)[0]
+        if isinstance(decoded_filename, bytes):
+            decoded_filename = decoded_filename.decode(enc or "utf-8", errors="ignore")
+        return sanitize_string(decoded_filename)
+    except Exception:
+        return "unknown_filename"
+
+
+def walk_bodystructure(structure, section=''):
+    """
+    Yields one dict per leaf part of a BODYSTRUCTURE:
+    {'section', 'content_type', 'charset', 'content_id', 'encoding', 'size', 'filename', 'disposition'}
+    A non-multipart message only has section '1'. `size` is the decoded size.
+    """
+    if structure and isinstance(structure[0], list):
+        # multipart: the child parts, then the subtype and extension data
+        for index, child in enumerate(itertools.takewhile(lambda item: isinstance(item, list), structure), start=1):
+            yield from walk_bodystructure(child, f'{section}.{index}' if section else str(index))
+        return
+
+    content_type = f"{_text(structure[0])}/{_text(structure[1])}".lower()
+    params = _params(structure[2])
+    extension = 8 if content_type.startswith('text/') else 7
+    if content_type == 'message/rfc822':
+        extension = 10
+    disposition = structure[extension + 1] if len(structure) > extension + 1 else None
+    disposition_type, disposition_params = '', {}
+    if isinstance(disposition, list) and disposition:
+        disposition_type = _text(disposition[0]).lower()
+        disposition_params = _params(disposition[1] if len(disposition) > 1 else None)
+
+    filename = _filename(disposition_params) or _filename(params)
+    encoding = _text(structure[5]).lower()
+    size = int(structure[6] or 0)
+    yield {
+        'section': section or '1',
+        'content_type': content_type,
+        'charset': params.get('charset', ''),
+        'content_id': _text(structure[3]),
+        'encoding': encoding,
+        'size': size * 3 // 4 if encoding == 'base64' else size,
+        'filename': decode_filename(filename) if filename else None,
+        'disposition': disposition_type,
+    }
+
+
+def decode_part(data, encoding):
+    """
+    Undoes the Content-Transfer-Encoding of a part fetched with BODY.PEEK[n].
+    """
+    data = data or b''
+    if encoding == 'base64':
+        return base64.b64decode(data + b'===', validate=False)
+    if encoding == 'quoted-printable':
+        return quopri.decodestring(data)
+    return data
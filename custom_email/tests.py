@@ -1,3 +1,137 @@
+from datetime import timedelta
+from unittest import mock
+
 from django.test import TestCase
+from django.utils import timezone
+
+from .models import Attachment, Email, Mailbox
+from .tasks.attachments import claim_attachments, download_attachments
+from .tasks.imap import decode_part, parse_fetch_response, walk_bodystructure
+
+TEXT_PART = b'("text" "plain" ("charset" "utf-8") NIL NIL "7bit" 20 1 NIL NIL NIL NIL)'
+PDF_PART = (
+    b'("application" "pdf" ("name" "report.pdf") NIL NIL "base64" 400 NIL '
+    b'("attachment" ("filename" "report.pdf")) NIL NIL)'
+)
+LOGO_PART = b'("image" "png" ("name" "logo.png") "<logo@x>" NIL "base64" 80 NIL ("inline" NIL) NIL NIL)'
+
+
+class ParseFetchResponseTests(TestCase):
+    def test_items_are_keyed_by_upper_case_name(self):
+        messages = parse_fetch_response([b'1 (uid 12 FLAGS (\\Seen) RFC822.SIZE 2048)'])
+        self.assertEqual(messages, [{b'UID': b'12', b'FLAGS': [b'\\Seen'], b'RFC822.SIZE': b'2048'}])
+
+    def test_literals_are_not_tokenized(self):
+        body = b'not (a list) "nor a string"\r\n'
+        messages = parse_fetch_response([(b'1 (UID 12 BODY[2] {%d}' % len(body), body), b')'])
+        self.assertEqual(messages[0][b'BODY[2]'], body)
+
+    def test_several_messages_and_sections(self):
+        messages = parse_fetch_response([
+            (b'1 (UID 12 BODY[2] {3}', b'abc'), b' BODY[3] "de\\"f")',
+            (b'2 (UID 13 BODY[2] {2}', b'gh'), b')',
+        ])
+        self.assertEqual([message[b'UID'] for message in messages], [b'12', b'13'])
+        self.assertEqual(messages[0][b'BODY[3]'], b'de"f')
+        self.assertEqual(messages[1][b'BODY[2]'], b'gh')
+
+    def test_nil_is_none(self):
+        messages = parse_fetch_response([b'1 (UID 12 BODYSTRUCTURE ' + TEXT_PART + b')'])
+        self.assertIsNone(messages[0][b'BODYSTRUCTURE'][3])
+
+    def test_empty_response(self):
+        self.assertEqual(parse_fetch_response([None]), [])
+
+
+class WalkBodystructureTests(TestCase):
+    def structure(self, raw):
+        return parse_fetch_response([b'1 (UID 1 BODYSTRUCTURE ' + raw + b')'])[0][b'BODYSTRUCTURE']
+
+    def test_single_part_message_is_section_1(self):
+        parts = list(walk_bodystructure(self.structure(TEXT_PART)))
+        self.assertEqual(len(parts), 1)
+        self.assertEqual(parts[0]['section'], '1')
+        self.assertEqual(parts[0]['content_type'], 'text/plain')
+        self.assertEqual(parts[0]['charset'], 'utf-8')
+        self.assertIsNone(parts[0]['filename'])
+
+    def test_multipart_sections_and_attachments(self):
+        raw = b'(' + TEXT_PART + PDF_PART + LOGO_PART + b' "mixed" ("boundary" "x") NIL NIL NIL)'
+        parts = list(walk_bodystructure(self.structure(raw)))
+        self.assertEqual([part['section'] for part in parts], ['1', '2', '3'])
+
+        pdf = parts[1]
+        self.assertEqual(pdf['filename'], 'report.pdf')
+        self.assertEqual(pdf['disposition'], 'attachment')
+        self.assertEqual(pdf['encoding'], 'base64')
+        # The decoded size of the base64 part
+        self.assertEqual(pdf['size'], 300)
+
+        logo = parts[2]
+        self.assertEqual(logo['disposition'], 'inline')
+        self.assertEqual(logo['content_id'], '<logo@x>')
+
+    def test_nested_multipart(self):
+        alternative = b'(' + TEXT_PART + TEXT_PART.replace(b'"plain"', b'"html"') + b' "alternative" NIL NIL NIL NIL)'
+        raw = b'(' + alternative + PDF_PART + b' "mixed" NIL NIL NIL NIL)'
+        parts = list(walk_bodystructure(self.structure(raw)))
+        self.assertEqual(
+            [(part['section'], part['content_type']) for part in parts],
+            [('1.1', 'text/plain'), ('1.2', 'text/html'), ('2', 'application/pdf')],
+        )
+
+    def test_rfc2231_filename(self):
+        raw = PDF_PART.replace(
+            b'("filename" "report.pdf")',
+            b'("filename*0*" "utf-8\'\'r%C3%A9sum" "filename*1*" "%C3%A9.pdf")',
+        )
+        parts = list(walk_bodystructure(self.structure(raw)))
+        self.assertEqual(parts[0]['filename'], 'résumé.pdf')
+
+    def test_filename_falls_back_to_the_name_parameter(self):
+        raw = PDF_PART.replace(b'("attachment" ("filename" "report.pdf"))', b'NIL')
+        parts = list(walk_bodystructure(self.structure(raw)))
+        self.assertEqual(parts[0]['filename'], 'report.pdf')
+        self.assertEqual(parts[0]['disposition'], '')
+
+
+class DecodePartTests(TestCase):
+    def test_transfer_encodings(self):
+        self.assertEqual(decode_part(b'aGVsbG8', 'base64'), b'hello')
+        self.assertEqual(decode_part(b'caf=C3=A9', 'quoted-printable'), 'café'.encode())
+        self.assertEqual(decode_part(b'plain', '7bit'), b'plain')
+        self.assertEqual(decode_part(None, 'base64'), b'')
+
+
+class ClaimAttachmentsTests(TestCase):
+    def setUp(self):
+        self.mailbox = Mailbox.objects.create(
+            name='Test', imap_username='test', imap_password='x', smtp_username='test', smtp_password='x',
+        )
+        self.email = Email.objects.create(
+            mailbox=self.mailbox, sender='a@example.com', recipients='b@example.com', subject='Report',
+            body='', date_received=timezone.now(), has_attachments=True, message_id='<1@example.com>',
+            folder='inbox', uid=12, imap_folder='INBOX',
+        )
+        self.pending = Attachment.objects.create(email=self.email, filename='report.pdf', part='2', encoding='base64')
+        Attachment.objects.create(email=self.email, filename='done.pdf', file='done.pdf')
+
+    def test_claim_leases_the_pending_rows(self):
+        self.assertEqual(claim_attachments([self.email]), [self.pending])
+        self.pending.refresh_from_db()
+        self.assertGreater(self.pending.downloading_until, timezone.now())
+        self.assertTrue(self.pending.is_downloading)
+
+    def test_claimed_rows_are_skipped_until_the_lease_expires(self):
+        claim_attachments([self.email])
+        self.assertEqual(claim_attachments([self.email]), [])
+
+        Attachment.objects.filter(pk=self.pending.pk).update(downloading_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(claim_attachments([self.email]), [self.pending])
 
-# Create your tests here.
+    def test_the_claim_is_released_when_the_download_fails(self):
+        with mock.patch('custom_email.tasks.attachments.connect_mailbox', side_effect=OSError('down')):
+            self.assertEqual(download_attachments([self.email]), 0)
+        self.pending.refresh_from_db()
+        self.assertIsNone(self.pending.downloading_until)
+        self.assertFalse(self.pending.file)
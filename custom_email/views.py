@@ -3,7 +3,7 @@ from django.contrib.auth.decorators import login_required
 from django.utils.timezone import now
 from django.utils import timezone
 from datetime import timedelta
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse, Http404
 from .models import Email, Mailbox, UserEmailAccount, Attachment, OutgoingEmail
 from django.core.paginator import Paginator
 from .forms import ReplyEmailForm, SendEmailForm
@@ -14,12 +14,14 @@ from django.contrib import messages
 from collections import defaultdict
 from email.utils import parseaddr
 from django.db.models import Prefetch
-from django.db.models import Q
-from django.db.models.functions import Substr
+from django.db.models import F, Q
 from tasks.utils import *
-from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from tasks.utilities.pagination import KeysetPaginator, keyset_pagination_enabled
+from django.contrib.postgres.search import SearchRank
 from django.core.exceptions import ValidationError
 from customers.models import Customer
+from .context_processors import get_mailbox_summary
+from .tasks.attachments import download_attachments, prefetch_attachments
 import os
 import re
 import logging
@@ -29,6 +31,8 @@ import json
 logger = logging.getLogger(__name__)
 
 MAX_ATTACHMENT_SIZE = 10 * 1024 * 1024  # 10MB
+# An inbox page queues the attachment prefetch of an email at most this often
+PREFETCH_REQUEUE_SECONDS = 60 * 10
 
 
 @login_required
@@ -124,7 +128,14 @@ def format_tagify_string(email_string):
 @login_required
 def mail_detail(request, pk):
     email_obj = get_object_or_404(Email, pk=pk)
+    if email_obj.has_attachments:
+        try:
+            download_attachments([email_obj])
+        except Exception as e:
+            logger.error("❌ Could not download attachments of email %s: %s", email_obj.pk, e)
     attachments = email_obj.attachment_set.all()
+    # Parts the prefetch task is still downloading, the page can be refreshed for them
+    attachments_downloading = any(a.is_downloading for a in attachments)
 
     # Prefill for modal
     prefill = {
@@ -143,11 +154,34 @@ def mail_detail(request, pk):
     return render(request, 'custom_email/mail-detail.html', {
         "email": email_obj,
         "attachments": attachments,
+        "attachments_downloading": attachments_downloading,
         "prefill": prefill,
         'nav_title': 'Email Detail',
     })
 
 
+@login_required
+def attachments_zip(request, pk):
+    """
+    Streams the useful attachments of an email as one zip, without building it in memory.
+    """
+    email_obj = get_object_or_404(Email, pk=pk)
+    if email_obj.has_attachments:
+        try:
+            # The zip needs every file: wait for a prefetch that holds some of them
+            download_attachments([email_obj], wait=True)
+        except Exception as e:
+            logger.error("❌ Could not download attachments of email %s: %s", email_obj.pk, e)
+
+    entries = zip_attachment_entries(email_obj)
+    if not entries:
+        raise Http404("No attachments to download")
+
+    response = StreamingHttpResponse(stream_zip(entries), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="email_{email_obj.pk}_attachments.zip"'
+    return response
+
+
 @login_required
 def reply_email(request, email_id):
     original_email = get_object_or_404(Email, id=email_id)
@@ -243,23 +277,8 @@ def inbox(request):
             'user_mailboxes': user_mailboxes,
         })
 
-    # 3. Cached folder structure
-    cache_key = f'mailbox_folders_{request.user.id}'
-    mailbox_folders = cache.get(cache_key)
-    
-    if not mailbox_folders:
-        folders_query = Email.objects.filter(
-            mailbox__in=user_mailboxes
-        ).values('mailbox_id', 'folder').distinct()
-        
-        mailbox_folders = defaultdict(list)
-        for item in folders_query:
-            mailbox_folders[item['mailbox_id']].append(item['folder'])
-        
-        for mb_id in mailbox_folders:
-            mailbox_folders[mb_id].sort()
-        
-        cache.set(cache_key, dict(mailbox_folders), timeout=60*15)  # 15 minutes
+    # 3. Cached folder structure (shared with the sidebar context processor)
+    mailbox_folders = get_mailbox_summary(request.user)['folders']
 
     # 4. Optimized email query with selective prefetching
     email_query = Email.objects.filter(
@@ -271,7 +290,7 @@ def inbox(request):
     ).prefetch_related(
         Prefetch('attachment_set',
                queryset=Attachment.objects.only(
-                   'file', 'filename', 'email_id'
+                   'file', 'filename', 'size', 'part', 'email_id'
                ),
                to_attr='prefetched_attachments')
     )
@@ -290,36 +309,42 @@ def inbox(request):
 
     # 5. Optimized search (only if needed)
     if search_query:
-        from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank
+        # Matches through the GIN index on the stored vector, only the matches get ranked
+        query = Email.search_query(search_query)
 
-        vector = (
-            SearchVector('subject', weight='A') + 
-            SearchVector('sender', weight='B') + 
-            SearchVector(Substr('body', 1, 1000000), weight='C')  # Avoids error
-        )
-        query = SearchQuery(search_query)
-        
-        email_query = email_query.annotate(
-            rank=SearchRank(vector, query)
-        ).filter(rank__gte=0.1).order_by('-rank', '-date_received')
+        email_query = email_query.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-date_received')
 
     # 6. Efficient pagination (process before attachment check)
-    page_number = request.GET.get('page')
-    paginator = Paginator(email_query, per_page)
-    page_obj = paginator.get_page(page_number)
+    if keyset_pagination_enabled() and not search_query:
+        # Cursor on (sort column, id): deep pages cost the same as the first one
+        paginator = KeysetPaginator(email_query, per_page, [sort])
+        page_obj = paginator.get_page(after=request.GET.get('cursor'), before=request.GET.get('before'))
+    else:
+        page_number = request.GET.get('page')
+        paginator = Paginator(email_query, per_page)
+        page_obj = paginator.get_page(page_number)
 
     # 7. Optimized attachment processing (only for current page)
     cutoff_time = timezone.now() - timedelta(minutes=15)
 
+    to_prefetch = []
     for email in page_obj.object_list:
         email.is_new = email.date_received >= cutoff_time
-        email.has_real_attachments = any(
-            not is_useless_attachment(
-                a.file.path, 
-                a.filename or os.path.basename(a.file.name)
-            )
-            for a in email.prefetched_attachments
-        )
+        real_attachments = [a for a in email.prefetched_attachments if not attachment_is_useless(a)]
+        email.has_real_attachments = bool(real_attachments)
+        # Only parts still on the server can be downloaded, and only once per PREFETCH_REQUEUE_SECONDS
+        if any(not a.file and a.part for a in real_attachments) \
+                and cache.add(f'attachment_prefetch:{email.id}', True, PREFETCH_REQUEUE_SECONDS):
+            to_prefetch.append(email.id)
+
+    # Download the attachments of the visible emails in the background before they are opened
+    if to_prefetch:
+        try:
+            prefetch_attachments.delay(to_prefetch)
+        except Exception as e:
+            logger.warning("⚠️ Could not queue attachment prefetch: %s", e)
 
     # 8. Template context with optimized data
     context = {
@@ -9,6 +9,7 @@ from django.core.exceptions import ValidationError
 from django.db.models import Q, Sum
 from django.contrib.contenttypes.models import ContentType
 from tasks.models import Task
+from tasks.utilities.pagination import cached_count
 from .models import Customer, Phone
 from .forms import CustomerForm, Phoneform
 from django.db import transaction
@@ -39,8 +40,9 @@ def customers_data(request):
             Q(customer_phone__icontains=search_value)
         )
 
-    total_records = Customer.objects.count()
-    filtered_records = qs.count()
+    # DataTables asks for both counts on every draw: reuse them for a few minutes
+    total_records = cached_count(Customer.objects.all())
+    filtered_records = cached_count(qs) if search_value else total_records
 
     data = []
     for customer in qs[start:start+length]:
@@ -68,17 +70,8 @@ def customers_data(request):
 
 @login_required
 def customers_list(request):
-    customers = Customer.objects.all().order_by('customer_name')
-
-    # Server-side pagination
-    page_number = request.GET.get('page', 1)
-    paginator = Paginator(customers, 50)  # 🔁 50 per page
-
-    page_obj = paginator.get_page(page_number)
-
+    # The DataTable loads and pages its rows from customers_data
     context = {
-        'page_obj': page_obj,
-        'paginator': paginator,
         'nav_title': 'Customers',
     }
 
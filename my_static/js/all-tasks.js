@@ -115,15 +115,54 @@ function adjustTableColumns() {
 window.addEventListener('load', adjustTableColumns);
 window.addEventListener('resize', adjustTableColumns);
 
-// Make project groups collapsible on mobile
-document.querySelectorAll('.project-group-header').forEach(header => {
-    header.addEventListener('click', function() {
-        if (window.innerWidth < 768) {
-            const target = document.querySelector(this.getAttribute('data-bs-target'));
-            target.classList.toggle('show');
-            const icon = this.querySelector('i');
-            icon.classList.toggle('fa-chevron-down');
-            icon.classList.toggle('fa-chevron-up');
+// Make project groups collapsible on mobile (the groups are loaded later, so listen on the document)
+document.addEventListener('click', function (e) {
+    const header = e.target.closest('.project-group-header');
+    if (header && window.innerWidth < 768) {
+        const target = document.querySelector(header.getAttribute('data-bs-target'));
+        target.classList.toggle('show');
+        const icon = header.querySelector('i');
+        icon.classList.toggle('fa-chevron-down');
+        icon.classList.toggle('fa-chevron-up');
+    }
+});
+
+// Project groups: fetched the first time the section is expanded, then page by page
+document.addEventListener('DOMContentLoaded', function () {
+    const container = document.getElementById('projectGroups');
+    if (!container) return;
+
+    function loadProjectGroups(page) {
+        const params = new URLSearchParams(window.location.search);
+        params.delete('cursor');
+        params.delete('before');
+        params.set('page', page);
+        container.innerHTML = '<div class="text-center py-4"><div class="spinner-border text-primary" role="status"><span class="visually-hidden">Loading...</span></div></div>';
+
+        fetch(`${container.dataset.url}?${params.toString()}`)
+            .then(response => response.text())
+            .then(html => {
+                container.innerHTML = html;
+                container.dataset.loaded = '1';
+                adjustTableColumns();
+            })
+            .catch(error => {
+                console.error('Error:', error);
+                container.innerHTML = '<p class="text-center text-danger py-4">Error loading projects</p>';
+            });
+    }
+
+    container.addEventListener('show.bs.collapse', function (e) {
+        if (e.target === container && !container.dataset.loaded) {
+            loadProjectGroups(1);
+        }
+    });
+
+    container.addEventListener('click', function (e) {
+        const link = e.target.closest('[data-project-page]');
+        if (link) {
+            e.preventDefault();
+            loadProjectGroups(link.dataset.projectPage);
         }
     });
 });
\ No newline at end of file
@@ -1,7 +1,23 @@
 const socket = new WebSocket(`ws://${window.location.host}/ws/notifications/`);
 
+// Unread counters arrive as {"type": "unread", "deltas": {"<notification type>": +n / -n}}
+function applyUnreadDeltas(deltas) {
+    for (const [typeName, delta] of Object.entries(deltas)) {
+        const badgeId = typeName.toLowerCase() === 'payment' ? 'payment-notification-badge' : 'notification-badge';
+        const badge = document.getElementById(badgeId);
+        if (!badge) continue;
+        const count = Math.max((parseInt(badge.textContent.trim()) || 0) + delta, 0);
+        badge.textContent = count;
+        badge.classList.toggle('d-none', count === 0);
+    }
+}
+
 socket.onmessage = function(e) {
     const data = JSON.parse(e.data);
+    if (data.type === "unread") {
+        applyUnreadDeltas(data.deltas || {});
+        return;
+    }
     const taskId = data.task_id || "#";
     const taskTitle = data.task_title || "New Task";
     const createdBy = data.created_by || "System";
@@ -17,13 +33,7 @@ socket.onmessage = function(e) {
         </a>`;
 
     if (category === "payment") {
-        const badge = document.getElementById('payment-notification-badge');
         const dropdown = document.getElementById('payment-notification-dropdown');
-        if (badge) {
-            let count = parseInt(badge.textContent.trim()) || 0;
-            badge.textContent = count + 1;
-            badge.classList.remove('d-none');
-        }
         if (dropdown) {
             const emptyItem = dropdown.querySelector('.dropdown-item');
             if (emptyItem && emptyItem.textContent.includes('No new')) {
@@ -32,13 +42,7 @@ socket.onmessage = function(e) {
             dropdown.prepend(li);
         }
     } else {
-        const badge = document.getElementById('notification-badge');
         const dropdown = document.getElementById('notification-dropdown');
-        if (badge) {
-            let count = parseInt(badge.textContent.trim()) || 0;
-            badge.textContent = count + 1;
-            badge.classList.remove('d-none');
-        }
         if (dropdown) {
             const emptyItem = dropdown.querySelector('.dropdown-item');
             if (emptyItem && emptyItem.textContent.includes('No new')) {
@@ -8,15 +8,15 @@ class Command(BaseCommand):  # ✅ THIS MUST EXIST AND BE NAMED EXACTLY 'Command
     help = 'Recalculate TaskPaymentStatus for all tasks'
 
     def handle(self, *args, **kwargs):
-        tasks = Task.objects.all()
-        updated = 0
-        for task in tasks:
-            if task.final_price == 0:
-                continue
+        task_ids = list(Task.objects.exclude(final_price=0).values_list('id', flat=True))
 
-            status, created = TaskPaymentStatus.objects.get_or_create(task=task)
-            status.total_price = task.final_price
-            status.update_status()
-            updated += 1
+        TaskPaymentStatus.objects.bulk_create(
+            [TaskPaymentStatus(task_id=task_id) for task_id in task_ids],
+            ignore_conflicts=True,
+            batch_size=1000,
+        )
+        statuses, tasks = TaskPaymentStatus.recompute(task_ids)
 
-        self.stdout.write(self.style.SUCCESS(f"✅ Updated {updated} task payment statuses"))
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Checked {len(task_ids)} tasks: updated {statuses} payment statuses and {tasks} task paid statuses"
+        ))
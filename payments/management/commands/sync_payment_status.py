@@ -1,13 +1,41 @@
+import time
 from django.core.management.base import BaseCommand
-from django.db.models import Sum
+from django.db import transaction
+from django.db.models import Sum, Count, Q
 from tasks.models import Task
 from payments.models import TaskPaymentStatus, Payment
 from decimal import Decimal
 
+STATUS_FIELDS = ['paid_amount', 'is_fully_paid', 'is_down_payment_only']
+
+
+def payment_flags(total_paid, final_price, has_full_payment, has_down_payment):
+    """
+    Returns (is_fully_paid, is_down_payment_only) using the same rules as the per-task sync.
+    """
+    if has_full_payment:
+        return True, False
+    if has_down_payment:
+        return False, True
+    if total_paid >= final_price:
+        return True, False
+    if total_paid > 0:
+        return False, True
+    return False, False
+
+
 class Command(BaseCommand):
     help = 'Syncs payment statuses for tasks based on their payment records'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--bulk', action='store_true', help='Resync every task with a few grouped queries and chunked bulk writes')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows written per statement in --bulk mode')
+        parser.add_argument('--dry-run', action='store_true', help='With --bulk, print the differences without writing them')
+
     def handle(self, *args, **options):
+        if options['bulk'] or options['dry_run']:
+            return self.bulk_resync(options['chunk_size'], options['dry_run'])
+
         # Find all tasks with payments
         tasks_with_payments = Task.objects.filter(
             payments__isnull=False
@@ -66,4 +94,63 @@ class Command(BaseCommand):
 
         self.stdout.write(self.style.SUCCESS(
             f"\nSuccessfully processed {processed_count} new records and updated {updated_count} records!"
-        ))
\ No newline at end of file
+        ))
+
+    def bulk_resync(self, chunk_size, dry_run):
+        started = time.perf_counter()
+
+        # One grouped query for every task with payments
+        totals = Payment.objects.values('task_id', 'task__final_price').annotate(
+            total=Sum('amount'),
+            full_count=Count('id', filter=Q(payment_type='full')),
+            down_count=Count('id', filter=Q(payment_type='down')),
+        ).order_by('task_id')
+        current = {
+            row['task_id']: row
+            for row in TaskPaymentStatus.objects.values('task_id', *STATUS_FIELDS)
+        }
+        self.stdout.write(f"Loaded {len(totals)} tasks with payments in {time.perf_counter() - started:.2f}s")
+
+        changed = []
+        created_count = 0
+        for row in totals:
+            total_paid = row['total'] or Decimal('0.00')
+            is_fully_paid, is_down_payment_only = payment_flags(
+                total_paid, row['task__final_price'], row['full_count'] > 0, row['down_count'] > 0
+            )
+            wanted = {'paid_amount': total_paid, 'is_fully_paid': is_fully_paid, 'is_down_payment_only': is_down_payment_only}
+            existing = current.get(row['task_id'])
+            if existing is None:
+                created_count += 1
+            elif all(existing[field] == wanted[field] for field in STATUS_FIELDS):
+                continue
+
+            if dry_run:
+                before = ', '.join(f"{field}={existing[field]}" for field in STATUS_FIELDS) if existing else 'missing'
+                after = ', '.join(f"{field}={wanted[field]}" for field in STATUS_FIELDS)
+                self.stdout.write(f"  Task #{row['task_id']}: {before} -> {after}")
+            changed.append(TaskPaymentStatus(task_id=row['task_id'], **wanted))
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(
+                f"Dry run: {len(changed)} statuses would change ({created_count} new), nothing was written"
+            ))
+            return
+
+        written = 0
+        with transaction.atomic():
+            for start in range(0, len(changed), chunk_size):
+                chunk = changed[start:start + chunk_size]
+                TaskPaymentStatus.objects.bulk_create(
+                    chunk,
+                    update_conflicts=True,
+                    unique_fields=['task'],
+                    update_fields=STATUS_FIELDS + ['updated'],
+                )
+                written += len(chunk)
+                self.stdout.write(f"  Wrote {written}/{len(changed)} statuses")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Synced {len(totals)} tasks: {written} statuses written ({created_count} new) "
+            f"in {time.perf_counter() - started:.2f}s"
+        ))
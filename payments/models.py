@@ -1,5 +1,9 @@
 # payments/models.py
-from django.db import models
+from decimal import Decimal
+from django.db import models, transaction
+from django.db.models import Case, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Now
+from django.db.models.lookups import Exact, GreaterThan, GreaterThanOrEqual, LessThan
 from django.contrib.auth import get_user_model
 
 
@@ -41,28 +45,84 @@ class TaskPaymentStatus(models.Model):
     updated = models.DateTimeField(auto_now=True)
 
 
-    # In payments/models.py inside TaskPaymentStatus class
-    def update_status(self):
-        payments = self.task.payments.all()
-        total_paid = sum([p.amount for p in payments])
-        self.paid_amount = total_paid
-
-        self.is_fully_paid = total_paid >= self.task.final_price
-        self.is_down_payment_only = 0 < total_paid < self.task.final_price
-        self.save()
-
-        # ✅ Update paid_status on the Task model too
-        if total_paid == self.task.final_price:
-            self.task.paid_status = 'P'
-        elif total_paid > self.task.final_price:
-            self.task.paid_status = 'O'
-        elif total_paid > 0:
-            self.task.paid_status = 'U'
-        else:
-            self.task.paid_status = 'U'
-
-        self.task.save(update_fields=['paid_status'])
+    @staticmethod
+    def _paid_sum(task_ref):
+        """
+        Subquery summing the payments of the task referenced by `task_ref`.
+        """
+        paid = Payment.objects.filter(task_id=OuterRef(task_ref)).values('task_id').annotate(
+            total=Sum('amount')
+        ).values('total')
+        return Coalesce(
+            Subquery(paid), Value(Decimal('0.00')),
+            output_field=models.DecimalField(max_digits=20, decimal_places=2),
+        )
+
+    @classmethod
+    def recompute(cls, task_ids=None):
+        """
+        Recomputes paid_amount, the paid flags and Task.paid_status of many tasks
+        with one set-based UPDATE per table. Only tasks that have a TaskPaymentStatus
+        are touched, and rows that are already up to date are skipped, so calling
+        this twice for the same payment only costs a no-op UPDATE.
+
+        :param task_ids: iterable of task ids, or None for every task
+        :return: (statuses updated, tasks updated)
+        """
+        from tasks.models import Task
+
+        statuses = cls.objects.all()
+        if task_ids is not None:
+            statuses = statuses.filter(task_id__in=list(task_ids))
+
+        paid = cls._paid_sum('task_id')
+        final_price = Subquery(Task.objects.filter(pk=OuterRef('task_id')).values('final_price')[:1])
+        is_fully_paid = Case(When(GreaterThanOrEqual(paid, final_price), then=Value(True)), default=Value(False))
+        is_down_payment_only = Case(
+            When(GreaterThan(paid, 0) & LessThan(paid, final_price), then=Value(True)),
+            default=Value(False),
+        )
 
+        task_paid = cls._paid_sum('pk')
+        paid_status = Case(
+            When(Exact(task_paid, F('final_price')), then=Value('P')),
+            When(GreaterThan(task_paid, F('final_price')), then=Value('O')),
+            default=Value('U'),
+        )
+        tasks = Task.objects.filter(pk__in=statuses.values('task_id'))
+
+        with transaction.atomic():
+            status_count = statuses.exclude(
+                Exact(F('paid_amount'), paid)
+                & Exact(F('is_fully_paid'), is_fully_paid)
+                & Exact(F('is_down_payment_only'), is_down_payment_only)
+            ).update(
+                paid_amount=paid,
+                is_fully_paid=is_fully_paid,
+                is_down_payment_only=is_down_payment_only,
+                updated=Now(),
+            )
+            task_count = tasks.exclude(Exact(F('paid_status'), paid_status)).update(paid_status=paid_status)
+
+        if task_count:
+            # paid_status feeds the "unpaid" and "pending" counters of my_tasks
+            from tasks.reports import clear_all_my_task_counters, clear_my_task_counters_for
+            if task_ids is None:
+                clear_all_my_task_counters()
+            else:
+                clear_my_task_counters_for(*task_ids)
+        return status_count, task_count
+
+    def update_status(self):
+        """
+        Recomputes this status (and Task.paid_status) in the database,
+        then refreshes both instances.
+        """
+        type(self).recompute([self.task_id])
+        self.refresh_from_db(fields=['paid_amount', 'is_fully_paid', 'is_down_payment_only', 'updated'])
+        task = self._state.fields_cache.get('task')
+        if task is not None:
+            task.paid_status = type(task).objects.filter(pk=task.pk).values_list('paid_status', flat=True).first()
 
     def __str__(self):
         return f"{self.task} - Paid: {self.paid_amount}/{self.task.final_price}"
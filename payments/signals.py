@@ -1,11 +1,70 @@
 # payments/signals.py
-from django.db.models.signals import post_save, post_delete
+from decimal import Decimal
+from django.db.models import F, Sum
+from django.db.models.signals import post_init, post_save, post_delete
 from django.dispatch import receiver
-from .models import Payment
+from tasks.models import Task
+from .models import Payment, TaskPaymentStatus
+
+
+# Keep Task.total_paid in sync with F() deltas instead of re-aggregating
+@receiver(post_init, sender=Payment)
+def remember_payment_amount(sender, instance, **kwargs):
+    if instance.pk:
+        instance._paid_snapshot = (instance.__dict__.get('task_id'), instance.__dict__.get('amount'))
+
+
+def _add_to_task_total(task_id, amount):
+    if task_id and amount:
+        Task.objects.filter(pk=task_id).update(total_paid=F('total_paid') + amount)
+
+
+def _recompute_task_total(task_id):
+    if task_id:
+        total = Payment.objects.filter(task_id=task_id).aggregate(total=Sum('amount'))['total']
+        Task.objects.filter(pk=task_id).update(total_paid=total or Decimal('0'))
+
+
+def _refresh_task_total(instance):
+    task = instance._state.fields_cache.get('task')
+    if task is not None and task.pk:
+        row = Task.objects.filter(pk=task.pk).values_list('total_paid', 'remaining', 'paid_status').first()
+        if row is not None:
+            task.total_paid, task.remaining, task.paid_status = row
+
+
+@receiver(post_save, sender=Payment)
+def update_task_total_paid(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_paid_snapshot', None)
+    if created:
+        _add_to_task_total(instance.task_id, instance.amount)
+    elif previous is None or previous[1] is None:
+        # Loaded without its amount: recompute the task total from scratch
+        _recompute_task_total(instance.task_id)
+    elif previous != (instance.task_id, instance.amount):
+        _add_to_task_total(previous[0], -previous[1])
+        _add_to_task_total(instance.task_id, instance.amount)
+    instance._previous_task_id = previous[0] if previous else None
+    instance._paid_snapshot = (instance.task_id, instance.amount)
+
+
+@receiver(post_delete, sender=Payment)
+def remove_from_task_total_paid(sender, instance, **kwargs):
+    previous = getattr(instance, '_paid_snapshot', None) or (instance.task_id, instance.amount)
+    if previous[1] is None:
+        # Loaded without its amount (e.g. .only()): the row is gone, recompute the rest
+        _recompute_task_total(previous[0])
+    else:
+        _add_to_task_total(previous[0], -previous[1])
+
 
 # Auto update payment status when payment change
 @receiver([post_save, post_delete], sender=Payment)
-def update_task_payment_status(sender, instance, **kwargs):
-    task = instance.task
-    if hasattr(task, 'payment_status'):
-        task.payment_status.update_status()
\ No newline at end of file
+def update_task_payment_status(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    task_ids = {instance.task_id, getattr(instance, '_previous_task_id', None)} - {None}
+    TaskPaymentStatus.recompute(task_ids)
+    _refresh_task_total(instance)
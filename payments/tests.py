@@ -1,3 +1,88 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
 
-# Create your tests here.
+from customers.models import Customer
+from tasks.models import Task, TaskName
+from .models import Payment, TaskPaymentStatus
+
+User = get_user_model()
+
+
+class TaskTotalPaidTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='cashier')
+        task_name = TaskName.objects.create(name='Print')
+        customer = Customer.objects.create(customer_name='Customer', customer_phone='+961000001')
+        self.task, self.other = [
+            Task.objects.create(
+                task_name=task_name, customer_name=customer, user=self.user, created_by=self.user,
+                final_price=Decimal('100'), currency='USD',
+            )
+            for _ in range(2)
+        ]
+
+    def pay(self, amount, task=None):
+        return Payment.objects.create(task=task or self.task, amount=Decimal(amount), payment_type='down', paid_by=self.user)
+
+    def totals(self, task=None):
+        return Task.objects.values_list('total_paid', 'remaining').get(pk=(task or self.task).pk)
+
+    def test_payments_add_up(self):
+        TaskPaymentStatus.objects.create(task=self.task)
+        self.pay('30')
+        self.pay('25.50')
+        self.assertEqual(self.totals(), (Decimal('55.50'), Decimal('44.50')))
+        self.assertEqual(TaskPaymentStatus.objects.get(task=self.task).paid_amount, Decimal('55.50'))
+
+    def test_amount_change_applies_the_difference(self):
+        payment = self.pay('30')
+        self.pay('10')
+        payment.amount = Decimal('50')
+        payment.save()
+        self.assertEqual(self.totals(), (Decimal('60'), Decimal('40')))
+
+    def test_payment_moved_to_another_task(self):
+        payment = self.pay('30')
+        payment.task = self.other
+        payment.save()
+        self.assertEqual(self.totals(), (Decimal('0'), Decimal('100')))
+        self.assertEqual(self.totals(self.other), (Decimal('30'), Decimal('70')))
+
+    def test_deleted_payment_is_removed(self):
+        payment = self.pay('30')
+        self.pay('10')
+        payment.delete()
+        self.assertEqual(self.totals(), (Decimal('10'), Decimal('90')))
+
+    def test_payment_loaded_without_its_amount(self):
+        payment = self.pay('30')
+        self.pay('10')
+        Payment.objects.only('id', 'task_id').get(pk=payment.pk).delete()
+        self.assertEqual(self.totals(), (Decimal('10'), Decimal('90')))
+
+        payment = Payment.objects.only('id', 'task_id').get()
+        payment.notes = 'changed'
+        payment.save()
+        self.assertEqual(self.totals(), (Decimal('10'), Decimal('90')))
+
+    def test_overpayment_leaves_nothing_remaining(self):
+        self.pay('120')
+        self.assertEqual(self.totals(), (Decimal('120'), Decimal('0')))
+
+    def test_task_instance_of_the_payment_is_refreshed(self):
+        payment = self.pay('30')
+        self.assertEqual(payment.task.total_paid, Decimal('30'))
+        self.assertEqual(payment.task.remaining_amount, Decimal('70'))
+
+    def test_task_save_keeps_total_paid_and_refreshes_remaining(self):
+        stale = Task.objects.get(pk=self.task.pk)
+        self.pay('30')
+        stale.final_price = Decimal('80')
+        stale.save()
+        self.assertEqual(self.totals(), (Decimal('30'), Decimal('50')))
+        self.assertEqual(stale.remaining, Decimal('50'))
+
+        stale.refresh_from_db(fields=['total_paid'])
+        self.assertEqual((stale.total_paid, stale.remaining), (Decimal('30'), Decimal('50')))
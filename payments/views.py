@@ -9,14 +9,15 @@ from django.db.models import Sum, Q
 from django.utils.timezone import now
 from decimal import Decimal, ROUND_HALF_UP
 from django.contrib import messages
-from tasks.utils import notify_user_about_task
+from tasks.utils import notify_users_about_task
+from tasks.outbox import record_task_activity
 from django.contrib.auth.models import Group
 from django.contrib.auth import get_user_model
 from .models import Payment, TaskPaymentStatus
 from tasks.models import Task
 from tasks.decorators import disallow_groups
 from .forms import PaymentForm
-from tasks.models import TaskActivityLog, CurrencyRate
+from tasks.models import CurrencyRate
 
 
 User = get_user_model()
@@ -48,7 +49,9 @@ def task_table_data(request, status):
         )
 
     total = queryset.count()
-    tasks = queryset[start:start + length]
+    tasks = queryset.select_related(
+        'task_name', 'customer_name', 'created_by'
+    ).prefetch_related('assigned_employees')[start:start + length]
 
     data = []
     for task in tasks:
@@ -57,8 +60,6 @@ def task_table_data(request, status):
         remaining = Decimal(task.remaining_amount or 0).quantize(Decimal('0.00'), rounding=ROUND_HALF_UP)
         paid = Decimal(task.total_paid_amount or 0).quantize(Decimal('0.00'), rounding=ROUND_HALF_UP)
 
-        print(f"DEBUG ❗ Task {task.id}: final_price={final_price}, paid={paid}, remaining={remaining}")
-
         # 💰 Badge logic with popovers
         if final_price == Decimal('0.00'):
             paid_amount_display = (
@@ -146,8 +147,8 @@ def make_payment(request, task_id):
     # Fetch the task object
     task = get_object_or_404(Task, id=task_id)
 
-    # Calculate total paid so far across all payments linked to this task
-    paid_so_far = Payment.objects.filter(task=task).aggregate(total=Sum('amount'))['total'] or 0
+    # Total paid so far across all payments linked to this task
+    paid_so_far = task.total_paid
 
     # Calculate how much remains to be paid
     remaining = task.final_price - paid_so_far
@@ -177,7 +178,7 @@ def make_payment(request, task_id):
                 task.paid_status = 'P'
                 task.save(update_fields=['paid_status'])
 
-            TaskActivityLog.objects.create(
+            record_task_activity(
                 task=task,
                 user=request.user,
                 action="🛠 Fixed Overpaid Task",
@@ -191,19 +192,16 @@ def make_payment(request, task_id):
             last_payment = Payment.objects.filter(task=task).order_by('-paid_at').first()
             if last_payment:
                 amount = last_payment.amount
+                # The Payment signal recalculates the status on delete
+                TaskPaymentStatus.objects.get_or_create(task=task)
                 last_payment.delete()
-
-                # Recalculate status
-                TaskPaymentStatus.objects.get_or_create(task=task)[0].update_status()
                 task.refresh_from_db()
 
-                if task.final_price > 0 and (
-                    Payment.objects.filter(task=task).aggregate(total=Sum('amount'))['total'] or 0
-                ) < task.final_price:
+                if task.final_price > 0 and task.total_paid < task.final_price:
                     task.paid_status = 'U'
                     task.save(update_fields=['paid_status'])
 
-                TaskActivityLog.objects.create(
+                record_task_activity(
                     task=task,
                     user=request.user,
                     action="❌ Canceled Last Payment",
@@ -236,14 +234,12 @@ def make_payment(request, task_id):
                     messages.error(request, f"Down payment exceeds remaining amount ({remaining:.2f} {task.currency}).")
                     return redirect(request.path)
 
-            # Save payment
+            # Save payment (the Payment signal recalculates the status)
+            TaskPaymentStatus.objects.get_or_create(task=task)
             payment.save()
 
-            payment_status, created = TaskPaymentStatus.objects.get_or_create(task=task)
-            payment_status.update_status()
-
             # --- ACTIVITY LOG ---
-            TaskActivityLog.objects.create(
+            record_task_activity(
                 task=task,
                 user=request.user,
                 action="Full Payment" if payment.payment_type == "full" else "Down Payment",
@@ -273,8 +269,7 @@ def make_payment(request, task_id):
             message = f"Task #{task.id} has {payment_status} paid."
 
             # Notify all relevant users
-            for user in all_users:
-                notify_user_about_task(user, task, message, type_name="Payment")
+            notify_users_about_task(all_users, task, message, type_name="Payment")
 
             messages.success(request, "Payment recorded successfully.")
             return redirect('payments:unpaid_jobs')
@@ -75,6 +75,15 @@ CHANNEL_LAYERS = {
 }
 
 
+# Shared by the web workers, the Celery worker and management commands: the
+# per-user counters and caches they invalidate for each other live here
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": config('CACHE_URL', default='redis://127.0.0.1:6379/1'),
+    },
+}
+
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
 CELERY_RESULT_BACKEND = 'django-db'
@@ -88,6 +97,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'tasks.middleware.log_request_context.RequestLogContextMiddleware',
+    'tasks.middleware.request_profiler.RequestProfilerMiddleware',
     'crum.CurrentRequestUserMiddleware',
 ]
 
@@ -181,6 +191,22 @@ STATICFILES_DIRS = [
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "mediafiles"
 
+# Cursor pagination for the inbox and the task lists: no OFFSET, and the total
+# "N entries" (a cached COUNT(*)) is only shown with KEYSET_PAGINATION_COUNT
+KEYSET_PAGINATION = config('KEYSET_PAGINATION', default=False, cast=bool)
+KEYSET_PAGINATION_COUNT = config('KEYSET_PAGINATION_COUNT', default=False, cast=bool)
+
+# Per-request query count, DB/template time and size (tasks.middleware.request_profiler)
+REQUEST_PROFILING = config('REQUEST_PROFILING', default=False, cast=bool)
+REQUEST_PROFILE_BUFFER_SIZE = 500
+# A warning is logged when one of these views goes over a limit (current cost plus some headroom)
+REQUEST_BUDGETS = {
+    'tasks.views.all_tasks': {'queries': 50, 'db_ms': 300, 'total_ms': 1000},
+    'tasks.views.task_detail': {'queries': 70, 'db_ms': 300, 'total_ms': 1000},
+    'payments.views.make_payment': {'queries': 40, 'db_ms': 300, 'total_ms': 1000},
+    'custom_email.views.inbox': {'queries': 20, 'db_ms': 300, 'total_ms': 1500},
+}
+
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 
 CRISPY_TEMPLATE_PACK = "bootstrap5"
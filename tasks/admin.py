@@ -9,7 +9,8 @@ from import_export import resources
 from import_export.admin import ImportExportModelAdmin
 from import_export.fields import Field
 from import_export.widgets import ForeignKeyWidget
-from .models import Vat, Project, TaskName, Task, Subtask, TaskActivityLog, CurrencyRate, Notification, NotificationType, DeliveredTask, Branch
+from .reports import clear_task_counters, clear_all_my_task_counters
+from .models import Vat, Project, TaskName, Task, Subtask, TaskActivityLog, CurrencyRate, Notification, NotificationType, DeliveredTask, Branch, OutboxMessage
 from customers.models import Customer
 from decimal import Decimal
 from payments.models import Payment, TaskPaymentStatus
@@ -21,6 +22,13 @@ admin.site.register(DeliveredTask)
 admin.site.register(NotificationType)
 admin.site.register(Branch)
 
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'created_at', 'attempts', 'retry_at', 'last_error')
+    list_filter = ('kind',)
+    readonly_fields = ('created_at',)
+
 # Resource classes for import_export
 class VatResource(resources.ModelResource):
     class Meta:
@@ -407,18 +415,26 @@ class TaskAdmin(ImportExportModelAdmin):
 
     actions = ['mark_as_completed', 'mark_as_paid', 'mark_as_closed']
 
+    def clear_cached_counters(self):
+        # QuerySet.update() skips the Task signals that keep the badge counters fresh
+        clear_task_counters()
+        clear_all_my_task_counters()
+
     def mark_as_completed(self, request, queryset):
         updated = queryset.update(status='done')
+        self.clear_cached_counters()
         self.message_user(request, f"{updated} tasks marked as completed.")
     mark_as_completed.short_description = "Mark selected tasks as completed"
     
     def mark_as_paid(self, request, queryset):
         updated = queryset.update(paid_status='P')
+        self.clear_cached_counters()
         self.message_user(request, f"{updated} tasks marked as paid.")
     mark_as_paid.short_description = "Mark selected tasks as paid"
     
     def mark_as_closed(self, request, queryset):
         updated = queryset.update(closed=True)
+        self.clear_cached_counters()
         self.message_user(request, f"{updated} tasks marked as closed.")
     mark_as_closed.short_description = "Mark selected tasks as closed"
 
@@ -1,25 +1,63 @@
+from functools import cache as memoize
+
+from django.core.cache import cache
+from django.db.models import Q
 from tasks.models import Notification
+from tasks.utils import get_unread_counts
+
+# Cleared on every Notification write (see tasks.signals and tasks.utils.mark_notifications_read)
+NOTIFICATION_CACHE_TIMEOUT = 60 * 5
+IS_PAYMENT = Q(type__name__iexact='payment')
+
+
+def notification_cache_key(user_id):
+    return f'notification_context:{user_id}'
+
+
+def clear_notification_cache(*user_ids):
+    cache.delete_many([notification_cache_key(user_id) for user_id in user_ids])
+
+
+def get_notification_summary(user):
+    """
+    The 5 latest unread notifications of each kind, cached per user.
+    """
+    key = notification_cache_key(user.pk)
+    summary = cache.get(key)
+    if summary is None:
+        latest = Notification.objects.filter(user=user, is_read=False) \
+            .select_related('task', 'type') \
+            .order_by('-created_at')
+        summary = {
+            'notifications': list(latest.exclude(IS_PAYMENT)[:5]),
+            'payment_notifications': list(latest.filter(IS_PAYMENT)[:5]),
+        }
+        cache.set(key, summary, NOTIFICATION_CACHE_TIMEOUT)
+    return summary
+
+
+def get_badge_counts(user):
+    """
+    Unread general and payment notifications, from the cached counters.
+    """
+    counts = get_unread_counts(user.pk)
+    payment = sum(total for name, total in counts.items() if name.lower() == 'payment')
+    return {
+        'notification_unread_count': sum(counts.values()) - payment,
+        'payment_unread_count': payment,
+    }
+
 
 def notification_context(request):
     if not request.user.is_authenticated:
         return {}
 
-    unread = Notification.objects.filter(user=request.user, is_read=False) \
-        .select_related('task', 'type') \
-        .order_by('-created_at')
-    
-    general_notifications = []
-    payment_notifications = []
-
-    for n in unread:
-        if n.type and n.type.name.lower() == 'payment':
-            payment_notifications.append(n)
-        else:
-            general_notifications.append(n)
-
+    # Templates call callables: nothing is queried unless the page shows notifications
+    summary = memoize(lambda: get_notification_summary(request.user))
+    counts = memoize(lambda: get_badge_counts(request.user))
     return {
-        'notification_unread_count': len(general_notifications),
-        'notifications': general_notifications[:5],
-        'payment_notifications': payment_notifications[:5],
-        'payment_unread_count': len(payment_notifications),
-    }
\ No newline at end of file
+        'notification_unread_count': lambda: counts()['notification_unread_count'],
+        'notifications': lambda: summary()['notifications'],
+        'payment_notifications': lambda: summary()['payment_notifications'],
+        'payment_unread_count': lambda: counts()['payment_unread_count'],
+    }
@@ -0,0 +1,54 @@
+import time
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from tasks.views import stats, stats_year, stats_quarter, stats_month
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Count the database queries and time spent by each statistics view'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True, help='User to render the stats pages as')
+        parser.add_argument('--year', type=int, default=datetime.now().year)
+        parser.add_argument('--quarter', type=int, default=1)
+        parser.add_argument('--month', type=int, default=1)
+        parser.add_argument('--repeat', type=int, default=1, help='Render each view N times and report the average time')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['username']}' does not exist")
+
+        views = [
+            ('stats', stats, {}),
+            ('stats_year', stats_year, {'year_number': str(options['year'])}),
+            ('stats_quarter', stats_quarter, {'quarter_number': str(options['quarter'])}),
+            ('stats_month', stats_month, {'month_number': str(options['month'])}),
+        ]
+        factory = RequestFactory()
+
+        for name, view, kwargs in views:
+            queries = 0
+            elapsed = 0.0
+            for _ in range(options['repeat']):
+                request = factory.get('/')
+                request.user = user
+                with CaptureQueriesContext(connection) as ctx:
+                    started = time.perf_counter()
+                    response = view(request, **kwargs)
+                    elapsed += time.perf_counter() - started
+                queries = len(ctx.captured_queries)
+
+            self.stdout.write(
+                f"{name:<15} status={response.status_code} queries={queries} "
+                f"avg_time={elapsed / options['repeat'] * 1000:.1f}ms"
+            )
+
+        self.stdout.write(self.style.SUCCESS("✅ Benchmark finished"))
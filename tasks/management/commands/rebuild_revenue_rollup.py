@@ -0,0 +1,19 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from tasks.reports import rebuild_revenue_rollup
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the RevenueRollup table from scratch using the Task table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk insert')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        with transaction.atomic():
+            written = rebuild_revenue_rollup(batch_size=options['batch_size'])
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"✅ Rebuilt {written} revenue rollup rows in {elapsed:.2f}s"))
@@ -0,0 +1,124 @@
+import json
+import logging
+import threading
+import time
+from collections import Counter, deque
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import Template
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Last request summaries of this process, newest last (see tasks.views.request_profiles)
+REQUEST_PROFILES = deque(maxlen=getattr(settings, 'REQUEST_PROFILE_BUFFER_SIZE', 500))
+# A statement run this many times in one request is reported as a likely N+1
+DUPLICATE_QUERY_THRESHOLD = 3
+
+_profile = threading.local()
+
+
+def view_path(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    func = getattr(match.func, 'view_class', match.func)
+    return f"{func.__module__}.{func.__qualname__}"
+
+
+class RequestProfile:
+    def __init__(self):
+        self.query_count = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper(): sees every query, DEBUG or not
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.query_count += 1
+            self.statements[sql] += 1
+
+    def duplicates(self):
+        return [
+            {"count": count, "sql": sql[:300]}
+            for sql, count in self.statements.most_common(5)
+            if count >= DUPLICATE_QUERY_THRESHOLD
+        ]
+
+
+def _profiled_render(render):
+    def wrapper(self, context=None, request=None):
+        profile = getattr(_profile, 'current', None)
+        if profile is None or profile.template_depth:
+            return render(self, context, request)
+        # Only the outermost render is timed, it includes its {% include %}s
+        profile.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            profile.template_time += time.perf_counter() - started
+            profile.template_depth -= 1
+
+    wrapper.profiled = True
+    return wrapper
+
+
+class RequestProfilerMiddleware:
+    """
+    Records the query count, DB time, repeated statements, template render time
+    and response size of every request in REQUEST_PROFILES, and logs a warning
+    when a view listed in settings.REQUEST_BUDGETS goes over one of its limits.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'REQUEST_PROFILING', False)
+        self.budgets = getattr(settings, 'REQUEST_BUDGETS', {})
+        if self.enabled and not getattr(Template.render, 'profiled', False):
+            Template.render = _profiled_render(Template.render)
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+
+        profile = _profile.current = RequestProfile()
+        started = time.perf_counter()
+        try:
+            with connections['default'].execute_wrapper(profile):
+                response = self.get_response(request)
+        finally:
+            _profile.current = None
+        total_time = time.perf_counter() - started
+
+        summary = {
+            "time": timezone.now().isoformat(),
+            "method": request.method,
+            "path": request.path,
+            "view": view_path(request),
+            "status": response.status_code,
+            "queries": profile.query_count,
+            "db_ms": round(profile.db_time * 1000, 1),
+            "template_ms": round(profile.template_time * 1000, 1),
+            "total_ms": round(total_time * 1000, 1),
+            "response_bytes": None if response.streaming else len(response.content),
+            "duplicates": profile.duplicates(),
+        }
+        REQUEST_PROFILES.append(summary)
+        self.check_budget(summary)
+        return response
+
+    def check_budget(self, summary):
+        budget = self.budgets.get(summary["view"])
+        if not budget:
+            return
+        over = {name: summary[name] for name, limit in budget.items() if summary.get(name, 0) > limit}
+        if over:
+            logger.warning(f"⚠️ {summary['view']} over budget {over} (budget {budget}): {json.dumps(summary)}")
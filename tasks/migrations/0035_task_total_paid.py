@@ -0,0 +1,43 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:18
+
+import django.db.models.expressions
+import django.db.models.functions
+import django.db.models.functions.comparison
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def backfill_total_paid(apps, schema_editor):
+    Task = apps.get_model('tasks', 'Task')
+    Payment = apps.get_model('payments', 'Payment')
+    paid = Payment.objects.filter(task=models.OuterRef('pk')).values('task').annotate(
+        total=models.Sum('amount')
+    ).values('total')
+    Task.objects.update(
+        total_paid=django.db.models.functions.Coalesce(
+            models.Subquery(paid), models.Value(Decimal('0.00')),
+            output_field=models.DecimalField(max_digits=20, decimal_places=2),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0034_revenuerollup'),
+        ('payments', '0003_remove_taskpaymentstatus_total_price_payment_notes_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='total_paid',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=20),
+        ),
+        migrations.RunPython(backfill_total_paid, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='task',
+            name='remaining',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.comparison.Greatest(django.db.models.expressions.CombinedExpression(models.F('final_price'), '-', models.F('total_paid')), models.Value(Decimal('0.00'))), output_field=models.DecimalField(decimal_places=2, max_digits=20)),
+        ),
+    ]
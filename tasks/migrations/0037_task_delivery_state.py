@@ -0,0 +1,39 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:52
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_delivery_state(apps, schema_editor):
+    Task = apps.get_model('tasks', 'Task')
+    DeliveredTask = apps.get_model('tasks', 'DeliveredTask')
+    delivery = DeliveredTask.objects.filter(main_task=models.OuterRef('pk'))
+    Task.objects.update(
+        delivered_at=models.Subquery(delivery.values('delivery_date')[:1]),
+        is_delivered=Coalesce(models.Subquery(delivery.values('is_delivered')[:1]), models.Value(False)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0036_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='delivered_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='is_delivered',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(backfill_delivery_state, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('canceled', False), ('delivered_at__isnull', True)), fields=['closed', 'created_at'], name='task_undelivered_idx'),
+        ),
+    ]
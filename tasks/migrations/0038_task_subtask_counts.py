@@ -0,0 +1,68 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:56
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_subtask_counts(apps, schema_editor):
+    Task = apps.get_model('tasks', 'Task')
+    Subtask = apps.get_model('tasks', 'Subtask')
+
+    def count(field='pk', distinct=False, **filters):
+        subtasks = Subtask.objects.filter(task=models.OuterRef('pk'), **filters).order_by().values('task')
+        return Coalesce(
+            models.Subquery(subtasks.annotate(total=models.Count(field, distinct=distinct)).values('total')[:1]),
+            models.Value(0),
+        )
+
+    Task.objects.update(
+        subtask_count=count(),
+        done_subtask_count=count(is_done=True),
+        canceled_subtask_count=count(is_canceled=True),
+        subtask_employee_count=count('user', distinct=True),
+        done_employee_count=count('user', distinct=True, is_done=True),
+        project_manager_done=models.Exists(
+            Subtask.objects.filter(task=models.OuterRef('pk'), user=models.OuterRef('user'), is_done=True)
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0037_task_delivery_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='canceled_subtask_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='done_employee_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='done_subtask_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='project_manager_done',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='subtask_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='subtask_employee_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_subtask_counts, migrations.RunPython.noop),
+    ]
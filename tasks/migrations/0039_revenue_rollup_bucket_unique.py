@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+BUCKET = ('user_id', 'branch_id', 'currency', 'year', 'month')
+
+
+def merge_duplicate_buckets(apps, schema_editor):
+    RevenueRollup = apps.get_model('tasks', 'RevenueRollup')
+    duplicates = RevenueRollup.objects.values(*BUCKET).annotate(
+        rows=models.Count('id'),
+        total=models.Sum('total_final_price'),
+        count=models.Sum('task_count'),
+        keep=models.Min('id'),
+    ).filter(rows__gt=1).order_by()
+    for bucket in duplicates:
+        rows = RevenueRollup.objects.filter(**{field: bucket[field] for field in BUCKET})
+        rows.exclude(id=bucket['keep']).delete()
+        rows.update(total_final_price=bucket['total'], task_count=bucket['count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0038_task_subtask_counts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_buckets, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='revenuerollup',
+            constraint=models.UniqueConstraint(fields=('user', 'branch', 'currency', 'year', 'month'), name='revenue_rollup_bucket_unique', nulls_distinct=False),
+        ),
+    ]
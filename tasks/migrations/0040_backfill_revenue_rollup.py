@@ -0,0 +1,25 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:12
+
+from django.conf import settings
+from django.db import migrations
+
+
+def backfill_revenue_rollup(apps, schema_editor):
+    from tasks.reports import rebuild_revenue_rollup
+
+    rebuild_revenue_rollup(
+        task_model=apps.get_model('tasks', 'Task'),
+        rollup_model=apps.get_model('tasks', 'RevenueRollup'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0039_revenue_rollup_bucket_unique'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_revenue_rollup, migrations.RunPython.noop),
+    ]
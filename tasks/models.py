@@ -2,7 +2,9 @@
 from django.db import models
 from django.conf import settings
 from django.utils import timezone
-from django.db.models import Sum, F
+from django.db.models import Count, Exists, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.lookups import Exact
+from django.db.models.functions import Coalesce, Greatest
 from django.core.exceptions import ValidationError
 from customers.models import Customer
 from custom_email.models import Email
@@ -203,6 +205,35 @@ class Task(models.Model):
     cancel_requested = models.BooleanField(default=False)
     canceled = models.BooleanField(default=False)
 
+    # Maintained by the Payment signals (payments/signals.py) with F() updates
+    total_paid = models.DecimalField(max_digits=20, decimal_places=2, default=0, editable=False)
+    remaining = models.GeneratedField(
+        expression=Greatest(F('final_price') - F('total_paid'), Value(Decimal('0.00'))),
+        output_field=models.DecimalField(max_digits=20, decimal_places=2),
+        db_persist=True,
+    )
+
+    # Copied from the DeliveredTask by its signals (tasks/signals.py): delivered_at is its
+    # delivery_date (null while the task has none), is_delivered its is_delivered flag
+    delivered_at = models.DateTimeField(null=True, blank=True, editable=False)
+    is_delivered = models.BooleanField(default=False, editable=False)
+
+    # Subtask counters, recomputed by the Subtask signals (tasks/signals.py) with
+    # recompute_subtask_counts() so progress and close checks never query the subtasks
+    subtask_count = models.PositiveIntegerField(default=0, editable=False)
+    done_subtask_count = models.PositiveIntegerField(default=0, editable=False)
+    canceled_subtask_count = models.PositiveIntegerField(default=0, editable=False)
+    subtask_employee_count = models.PositiveIntegerField(default=0, editable=False)
+    done_employee_count = models.PositiveIntegerField(default=0, editable=False)
+    project_manager_done = models.BooleanField(default=False, editable=False)
+
+    SUBTASK_COUNT_FIELDS = (
+        'subtask_count', 'done_subtask_count', 'canceled_subtask_count',
+        'subtask_employee_count', 'done_employee_count', 'project_manager_done',
+    )
+    # Columns only written with UPDATEs by signals, never from a possibly stale instance
+    SIGNAL_MAINTAINED_FIELDS = {'total_paid', 'delivered_at', 'is_delivered', *SUBTASK_COUNT_FIELDS}
+
     class Meta:
         ordering = ['-id']
         indexes = [
@@ -211,6 +242,12 @@ class Task(models.Model):
             models.Index(fields=['created_at']),
             models.Index(fields=['order_number']),
             models.Index(fields=['customer_name', 'status']),
+            # Undelivered / finished lists and counters
+            models.Index(
+                fields=['closed', 'created_at'],
+                condition=Q(delivered_at__isnull=True, canceled=False),
+                name='task_undelivered_idx',
+            ),
         ]
 
     def __str__(self):
@@ -219,6 +256,27 @@ class Task(models.Model):
         Format: "Task {id}: {task_name} for {customer_name}"
         """
         return f"Task {self.id}: {self.task_name.name} for {self.customer_name.customer_name}"
+
+    def save(self, *args, **kwargs):
+        # total_paid, the delivery state and the subtask counters are only written by the
+        # Payment, DeliveredTask and Subtask signals: never overwrite them from an instance
+        # loaded before the last change.
+        if not self._state.adding and not args and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                f.attname for f in self._meta.concrete_fields
+                if not f.primary_key and not f.generated
+                and f.attname not in deferred and f.attname not in self.SIGNAL_MAINTAINED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+        # The database computed `remaining` again: read it back when it is next used
+        self.__dict__.pop('remaining', None)
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        # `remaining` follows final_price and total_paid, so reload it with them
+        if fields is not None and 'remaining' not in fields and {'final_price', 'total_paid'} & set(fields):
+            fields = [*fields, 'remaining']
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
     
     @property
     def is_created_by_current_user(self):
@@ -237,13 +295,47 @@ class Task(models.Model):
         except Exception:
             return False
 
+    @classmethod
+    def recompute_subtask_counts(cls, task_ids=None):
+        """
+        Recomputes the subtask counters of many tasks with one set-based UPDATE.
+        Tasks whose counters are already up to date are skipped.
+
+        :param task_ids: iterable of task ids, or None for every task
+        :return: number of tasks updated
+        """
+        def count(field='pk', distinct=False, **filters):
+            subtasks = Subtask.objects.filter(task=OuterRef('pk'), **filters).order_by().values('task')
+            return Coalesce(
+                Subquery(subtasks.annotate(total=Count(field, distinct=distinct)).values('total')[:1]),
+                Value(0),
+            )
+
+        counts = {
+            'subtask_count': count(),
+            'done_subtask_count': count(is_done=True),
+            'canceled_subtask_count': count(is_canceled=True),
+            'subtask_employee_count': count('user', distinct=True),
+            'done_employee_count': count('user', distinct=True, is_done=True),
+            'project_manager_done': Exists(
+                Subtask.objects.filter(task=OuterRef('pk'), user=OuterRef('user'), is_done=True)
+            ),
+        }
+        tasks = cls.objects.all()
+        if task_ids is not None:
+            tasks = tasks.filter(pk__in=list(task_ids))
+        up_to_date = Q()
+        for name, expression in counts.items():
+            up_to_date &= Exact(F(name), expression)
+        return tasks.exclude(up_to_date).update(**counts)
+
     def total_employees(self):
         """
         Calculates the number of unique employees assigned to subtasks of this task.
         Returns:
             int: Count of distinct users with subtasks.
         """
-        return self.subtasks.values('user').distinct().count()
+        return self.subtask_employee_count
     
     def calculate_final_price(self):
         """
@@ -266,8 +358,7 @@ class Task(models.Model):
 
     @property
     def total_paid_amount(self):
-        total = self.payments.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-        return total
+        return self.total_paid or Decimal('0.00')
 
     @property
     def is_fully_paid(self):
@@ -283,6 +374,9 @@ class Task(models.Model):
     
     @property
     def remaining_amount(self):
+        # The stored `remaining` column when it was loaded, so lists can also sort on it
+        if 'remaining' in self.__dict__:
+            return self.remaining
         remaining = self.final_price - self.total_paid_amount
         # prevent negative remaining in case of overpayment
         return remaining if remaining > 0 else 0
@@ -293,7 +387,7 @@ class Task(models.Model):
         Returns:
             bool: True if no undone subtasks exist, False otherwise.
         """
-        return not self.subtasks.filter(is_done=False).exists()
+        return self.done_subtask_count == self.subtask_count
 
     def all_subtasks_resolved(self):
         """
@@ -301,7 +395,8 @@ class Task(models.Model):
         Returns:
             bool: True if all subtasks are resolved, False otherwise.
         """
-        return all(sub.is_done or sub.is_canceled for sub in self.subtasks.all())
+        # A subtask is never both done and canceled (see Subtask.clean)
+        return self.done_subtask_count + self.canceled_subtask_count >= self.subtask_count
 
     def can_be_closed_by_pm(self):
         """
@@ -349,9 +444,9 @@ class Task(models.Model):
         Returns:
             bool: True if the project manager has any done subtask, False otherwise.
         """
-        if not self.user:
+        if not self.user_id:
             return False  # No project manager assigned
-        return self.subtasks.filter(user=self.user, is_done=True).exists()
+        return self.project_manager_done
 
     @property
     def get_all_subtasks_progess_percentage(self):
@@ -367,8 +462,7 @@ class Task(models.Model):
         total_employees = self.total_employees()
         if total_employees == 0:
             return 0  # Avoid division by zero
-        done_employees = self.subtasks.filter(is_done=True).values('user').distinct().count()
-        return int((done_employees / total_employees) * 100)
+        return int((self.done_employee_count / total_employees) * 100)
 
     def can_be_closed(self):
         """
@@ -382,18 +476,16 @@ class Task(models.Model):
         return self.check_all_subtasks_done() and self.is_paid
     
     def can_user_assign_operator(self, user):
-        has_delivered = hasattr(self, 'deliveredtask')
+        has_delivered = self.delivered_at is not None
+        # Stored columns first: the queries only run for an open task with done subtasks
         return (
-            user in self.assigned_employees.all() and
-            self.subtasks.filter(user=user, is_done=True).exists() and
             not has_delivered and
             not self.canceled and
-            not self.closed
+            not self.closed and
+            self.done_subtask_count > 0 and
+            user in self.assigned_employees.all() and
+            self.subtasks.filter(user=user, is_done=True).exists()
         )
-        
-    @property
-    def is_delivered(self):
-        return DeliveredTask.objects.filter(main_task=self).exists()
     
     # def save(self, *args, **kwargs):
     #     if self.is_second_branch():
@@ -501,7 +593,8 @@ class TaskActivityLog(models.Model):
     task = models.ForeignKey(Task, related_name='activity_logs', on_delete=models.CASCADE)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
     action = models.CharField(max_length=255)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the action happens: the row itself may be written later by the outbox drain
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     note = models.TextField(blank=True)
 
     def __str__(self):
@@ -510,3 +603,64 @@ class TaskActivityLog(models.Model):
     class Meta:
         ordering = ['timestamp']  # newest first
     
+
+
+# ----------------- RevenueRollup -----------------
+class RevenueRollup(models.Model):
+    """
+    Monthly revenue per project manager, branch and currency.
+    Kept up to date with delta writes from the Task signals and rebuilt
+    from scratch by the `rebuild_revenue_rollup` management command.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='revenue_rollups')
+    branch = models.ForeignKey(Branch, null=True, blank=True, on_delete=models.SET_NULL, related_name='revenue_rollups')
+    currency = models.CharField(max_length=5, choices=CURRENCY_CHOICES)
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    total_final_price = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    task_count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['year', 'month']),
+            models.Index(fields=['user', 'year', 'month']),
+        ]
+        constraints = [
+            # One row per bucket, tasks without a branch included: the signals upsert into it
+            models.UniqueConstraint(
+                fields=['user', 'branch', 'currency', 'year', 'month'],
+                nulls_distinct=False,
+                name='revenue_rollup_bucket_unique',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user} | {self.year}-{self.month:02} | {self.total_final_price} {self.currency}"
+
+
+# ----------------- OutboxMessage -----------------
+class OutboxMessage(models.Model):
+    """
+    A side effect of a request (WebSocket push, activity log row) written in
+    the request's transaction and carried out later, oldest first, by the
+    `tasks.drain_outbox` Celery task (see tasks.outbox).
+    """
+    WEBSOCKET = 'websocket'
+    ACTIVITY_LOG = 'activity_log'
+    KIND_CHOICES = [
+        (WEBSOCKET, 'WebSocket messages'),
+        (ACTIVITY_LOG, 'Task activity log'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    retry_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"#{self.id} {self.kind} ({self.attempts} attempts)"
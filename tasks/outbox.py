@@ -0,0 +1,183 @@
+# tasks/outbox.py
+"""
+Transactional outbox: views write their side effects as OutboxMessage rows
+in their own transaction, and the `tasks.drain_outbox` Celery task carries
+them out in batches. A slow Redis or channel layer then delays the pushes
+instead of the response, and nothing is sent for a transaction that rolled back.
+"""
+import logging
+from datetime import timedelta
+from itertools import groupby
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from tasks.models import OutboxMessage, TaskActivityLog
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = 200
+# A message failing this many times is left in the table (see the admin) and skipped
+OUTBOX_MAX_ATTEMPTS = 8
+
+
+def enqueue(kind, payload):
+    """
+    Writes an outbox message in the current transaction and wakes the drain once it commits.
+    """
+    message = OutboxMessage.objects.create(kind=kind, payload=payload)
+    connection = transaction.get_connection()
+    # One wake-up per transaction, however many messages it writes
+    if not any(func is wake_drain for _, func, _ in connection.run_on_commit):
+        transaction.on_commit(wake_drain)
+    return message
+
+
+def push_to_groups(group_messages):
+    """
+    Queues [(group name, JSON text)] for the WebSocket consumers, sent in this order.
+    """
+    if group_messages:
+        enqueue(OutboxMessage.WEBSOCKET, {"messages": [list(message) for message in group_messages]})
+
+
+def record_task_activity(task, user, action, note=""):
+    """
+    Queues a TaskActivityLog row, timestamped now.
+    """
+    enqueue(OutboxMessage.ACTIVITY_LOG, {
+        "task_id": task.pk,
+        "user_id": user.pk if user else None,
+        "action": action,
+        "note": note,
+        "timestamp": timezone.now().isoformat(),
+    })
+
+
+def wake_drain():
+    from tasks.tasks import drain_outbox
+
+    try:
+        drain_outbox.delay()
+    except Exception as e:
+        # The periodic drain picks the messages up
+        logger.warning(f"⚠️ Could not queue the outbox drain: {e}")
+
+
+def send_group_messages(group_messages):
+    """
+    Sends [(group name, JSON text)] to the WebSocket consumers in one event loop.
+    """
+    channel_layer = get_channel_layer()
+
+    async def send_all():
+        for group, text in group_messages:
+            await channel_layer.group_send(group, {"type": "send_notification", "message": text})
+
+    async_to_sync(send_all)()
+
+
+def send_websockets(payloads):
+    send_group_messages([message for payload in payloads for message in payload["messages"]])
+
+
+def write_activity_logs(payloads):
+    TaskActivityLog.objects.bulk_create([
+        TaskActivityLog(
+            task_id=payload["task_id"],
+            user_id=payload["user_id"],
+            action=payload["action"],
+            note=payload["note"],
+            timestamp=parse_datetime(payload["timestamp"]),
+        )
+        for payload in payloads
+    ])
+
+
+HANDLERS = {
+    OutboxMessage.WEBSOCKET: send_websockets,
+    OutboxMessage.ACTIVITY_LOG: write_activity_logs,
+}
+
+
+def run_one_by_one(kind, run, done):
+    """
+    Carries out the messages of a failed run separately, appending them to `done`,
+    up to the first one that fails again.
+    Returns: (the failing message, its exception), or (None, None) if all went through.
+    """
+    for message in run:
+        try:
+            with transaction.atomic():
+                HANDLERS[kind]([message.payload])
+        except Exception as e:
+            return message, e
+        done.append(message)
+    return None, None
+
+
+def charge_failure(message, error, now):
+    """
+    Counts a failed attempt on the message and schedules its retry with exponential backoff.
+    """
+    message.attempts += 1
+    message.retry_at = now + timedelta(seconds=2 ** message.attempts)
+    message.last_error = f"{type(error).__name__}: {error}"
+    message.save(update_fields=['attempts', 'retry_at', 'last_error'])
+    logger.warning(f"⚠️ Outbox message #{message.id} failed (attempt {message.attempts}): {error}")
+
+
+def process_outbox(batch_size=OUTBOX_BATCH_SIZE):
+    """
+    Carries out pending messages in id order, consecutive messages of one kind
+    in a single call. A run that fails is retried one message at a time, and
+    processing stops at the message that fails so later messages never overtake
+    it: only that one is charged and retried with exponential backoff, up to
+    OUTBOX_MAX_ATTEMPTS. WebSocket messages are sent at least once.
+    Returns: int number of messages processed.
+    """
+    processed = 0
+    while True:
+        with transaction.atomic():
+            # Row locks make a concurrent drain wait here instead of sending the same messages
+            batch = list(
+                OutboxMessage.objects.filter(attempts__lt=OUTBOX_MAX_ATTEMPTS)
+                .select_for_update()
+                .order_by('id')[:batch_size]
+            )
+            now = timezone.now()
+            ready = []
+            for message in batch:
+                if message.retry_at and message.retry_at > now:
+                    break
+                ready.append(message)
+            if not ready:
+                return processed
+
+            done = []
+            failed = None
+            for kind, run in groupby(ready, key=lambda message: message.kind):
+                run = list(run)
+                try:
+                    with transaction.atomic():
+                        HANDLERS[kind]([message.payload for message in run])
+                except Exception as e:
+                    if len(run) == 1:
+                        failed, error = run[0], e
+                    else:
+                        # One message at a time, so only the one that fails is charged
+                        failed, error = run_one_by_one(kind, run, done)
+                    if failed:
+                        charge_failure(failed, error, now)
+                        break
+                    continue
+                done += run
+
+            OutboxMessage.objects.filter(id__in=[message.id for message in done]).delete()
+            processed += len(done)
+
+        if failed or len(batch) < batch_size:
+            return processed
@@ -0,0 +1,437 @@
+# tasks/reports.py
+from decimal import Decimal
+from datetime import date
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Q, Sum, Count, F
+from django.db.models.functions import ExtractMonth, ExtractYear
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from .models import Task, RevenueRollup
+
+User = get_user_model()
+
+STATS_GROUPS = ['Graphic', 'Laser', 'Outdoor', 'Typing', 'ManagerAssistant']
+CURRENCIES = ['USD', 'LBP']
+
+QUARTER_MONTHS = {
+    1: [1, 2, 3],
+    2: [4, 5, 6],
+    3: [7, 8, 9],
+    4: [10, 11, 12],
+}
+
+
+def get_stats_users():
+    """
+    Active users that appear on the statistics charts.
+    """
+    return User.objects.filter(
+        groups__name__in=STATS_GROUPS,
+        is_active=True
+    ).distinct()
+
+
+GROUP_BY_FIELDS = {
+    'user': 'user_id',
+    'branch': 'branch_id',
+    None: None,
+}
+GRANULARITIES = ('month', 'quarter', 'year')
+
+
+def period_months(period):
+    """
+    Months covered by a period dict ({'year', 'quarter', 'month' or 'months'}).
+    """
+    if period.get('month'):
+        return [int(period['month'])]
+    if period.get('months'):
+        return [int(m) for m in period['months']]
+    if period.get('quarter'):
+        return QUARTER_MONTHS.get(int(period['quarter']), [])
+    return list(range(1, 13))
+
+
+class RevenueMatrix:
+    """
+    Columnar revenue totals: values[i][j][k] is the total of keys[i]
+    (a user or branch id, or None when not grouped) in buckets[j]
+    (a month, quarter or year) for currencies[k].
+    Charts and exports read the parallel lists directly.
+    """
+
+    def __init__(self, keys, buckets, currencies):
+        self.keys = list(keys)
+        self.buckets = list(buckets)
+        self.currencies = list(currencies)
+        self.values = [
+            [[Decimal('0')] * len(self.currencies) for _ in self.buckets]
+            for _ in self.keys
+        ]
+        self._key_index = {key: i for i, key in enumerate(self.keys)}
+        self._bucket_index = {bucket: j for j, bucket in enumerate(self.buckets)}
+
+    def add(self, key, bucket, currency, amount):
+        i = self._key_index.get(key)
+        j = self._bucket_index.get(bucket)
+        if i is None or j is None or not amount:
+            return
+        self.values[i][j][self.currencies.index(currency)] += amount
+
+    def series(self, currency):
+        """
+        Returns: keys x buckets matrix of totals for one currency.
+        """
+        k = self.currencies.index(currency)
+        return [[cell[k] for cell in row] for row in self.values]
+
+    def key_totals(self, currency):
+        """
+        Returns: totals per key (summed over buckets), aligned with self.keys.
+        """
+        return [sum(row, Decimal('0')) for row in self.series(currency)]
+
+    def bucket_totals(self, currency):
+        """
+        Returns: totals per bucket (summed over keys), aligned with self.buckets.
+        """
+        return [sum(column, Decimal('0')) for column in zip(*self.series(currency))] or [Decimal('0')] * len(self.buckets)
+
+    def totals_by_key(self, currency):
+        return dict(zip(self.keys, self.key_totals(currency)))
+
+
+def revenue_matrix(period=None, granularity='month', currencies=CURRENCIES, group_by='user', keys=None):
+    """
+    Revenue of a period in a single aggregate query over RevenueRollup.
+
+    :param period: dict with optional 'year' and one of 'month', 'months' or 'quarter'
+    :param granularity: 'month', 'quarter' or 'year' buckets
+    :param currencies: currencies to return, in order
+    :param group_by: 'user', 'branch' or None for a single total row
+    :param keys: optional ids restricting (and ordering) the rows; defaults to every id found
+    :return: RevenueMatrix
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity: {granularity}")
+    if group_by not in GROUP_BY_FIELDS:
+        raise ValueError(f"Unknown group_by: {group_by}")
+
+    period = period or {}
+    currencies = list(currencies)
+    months = period_months(period)
+    group_field = GROUP_BY_FIELDS[group_by]
+
+    rollups = RevenueRollup.objects.filter(currency__in=currencies)
+    if len(months) < 12:
+        rollups = rollups.filter(month__in=months)
+    if period.get('year'):
+        rollups = rollups.filter(year=int(period['year']))
+    if keys is not None and group_field:
+        keys = list(keys)
+        rollups = rollups.filter(**{f'{group_field}__in': keys})
+
+    group_fields = [group_field] if group_field else []
+    group_fields.append('year' if granularity == 'year' else 'month')
+
+    rows = list(
+        rollups.values(*group_fields).annotate(
+            **{
+                f'total_{currency}': Sum('total_final_price', filter=Q(currency=currency))
+                for currency in currencies
+            }
+        ).order_by()
+    )
+
+    def bucket_of(row):
+        if granularity == 'year':
+            return row['year']
+        if granularity == 'quarter':
+            return (row['month'] - 1) // 3 + 1
+        return row['month']
+
+    if granularity == 'year':
+        buckets = [int(period['year'])] if period.get('year') else sorted({row['year'] for row in rows})
+    elif granularity == 'quarter':
+        buckets = sorted({(m - 1) // 3 + 1 for m in months})
+    else:
+        buckets = months
+
+    if not group_field:
+        keys = [None]
+    elif keys is None:
+        keys = sorted({row[group_field] for row in rows}, key=lambda k: (k is None, k))
+
+    matrix = RevenueMatrix(keys, buckets, currencies)
+    for row in rows:
+        key = row[group_field] if group_field else None
+        for currency in currencies:
+            matrix.add(key, bucket_of(row), currency, row[f'total_{currency}'])
+    return matrix
+
+
+class RevenueReport:
+    """
+    Per-user and per-month revenue structures used by the stats views,
+    built from one revenue_matrix() call over every project manager.
+    """
+
+    def __init__(self, year=None, months=None):
+        self.matrix = revenue_matrix({'year': year, 'months': months}, granularity='month')
+
+    def user_stats(self, users, currency, key='final_price'):
+        """
+        Returns: [{'user': user, key: total}] in the order of `users`.
+        """
+        totals = self.matrix.totals_by_key(currency)
+        return [
+            {'user': user, key: round(totals.get(user.id, Decimal('0')), 2)}
+            for user in users
+        ]
+
+    def month_stats(self, currency):
+        """
+        Returns: [{'month': month, 'Amount': total}] for every month of the period.
+        """
+        return [
+            {'month': month, 'Amount': amount}
+            for month, amount in zip(self.matrix.buckets, self.matrix.bucket_totals(currency))
+        ]
+
+
+########################################################################
+########################### Revenue rollup #############################
+ROLLUP_FIELDS = {'user', 'user_id', 'branch', 'branch_id', 'currency', 'final_price', 'created_at'}
+REVENUE_FIELDS = ('user_id', 'branch_id', 'currency', 'final_price', 'created_at')
+
+
+def revenue_fields(task, previous=None):
+    """
+    Returns the task values RevenueRollup depends on, or None if some are unknown.
+    Reads the instance __dict__ so deferred fields are never loaded; they are
+    taken from `previous` instead since a deferred field was not modified.
+    """
+    fields = dict(previous or {})
+    fields.update({name: task.__dict__[name] for name in REVENUE_FIELDS if name in task.__dict__})
+    return fields if len(fields) == len(REVENUE_FIELDS) else None
+
+
+def revenue_state(fields):
+    """
+    Returns the (user_id, branch_id, currency, year, month, final_price)
+    contribution of a task to RevenueRollup, or None if it has none yet.
+    """
+    if not fields or fields['created_at'] is None or fields['user_id'] is None:
+        return None
+    created_at = fields['created_at']
+    if timezone.is_aware(created_at):
+        created_at = timezone.localtime(created_at)
+    return (
+        fields['user_id'], fields['branch_id'], fields['currency'],
+        created_at.year, created_at.month, fields['final_price'] or Decimal('0'),
+    )
+
+
+def apply_revenue_delta(state, sign):
+    """
+    Adds (sign=1) or removes (sign=-1) a task contribution with an F() update,
+    creating the rollup row the first time a bucket is used.
+    """
+    user_id, branch_id, currency, year, month, amount = state
+    bucket = RevenueRollup.objects.filter(
+        user_id=user_id, branch_id=branch_id, currency=currency, year=year, month=month
+    )
+    changes = {
+        'total_final_price': F('total_final_price') + sign * amount,
+        'task_count': F('task_count') + sign,
+    }
+    if bucket.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            RevenueRollup.objects.create(
+                user_id=user_id, branch_id=branch_id, currency=currency, year=year, month=month,
+                total_final_price=sign * amount, task_count=sign,
+            )
+    except IntegrityError:
+        # A concurrent first write created the bucket (revenue_rollup_bucket_unique)
+        bucket.update(**changes)
+
+
+def rebuild_revenue_rollup(batch_size=1000, task_model=Task, rollup_model=RevenueRollup):
+    """
+    Recomputes every RevenueRollup row from the Task table.
+    The models can be swapped for the historical ones of a data migration.
+    Returns: int number of rollup rows written.
+    """
+    rows = task_model.objects.annotate(
+        year=ExtractYear('created_at'),
+        month=ExtractMonth('created_at'),
+    ).values('user_id', 'branch_id', 'currency', 'year', 'month').annotate(
+        total=Sum('final_price'),
+        count=Count('id'),
+    ).order_by()
+
+    rollups = [
+        rollup_model(
+            user_id=row['user_id'], branch_id=row['branch_id'], currency=row['currency'],
+            year=row['year'], month=row['month'],
+            total_final_price=row['total'] or 0, task_count=row['count'],
+        )
+        for row in rows
+    ]
+    rollup_model.objects.all().delete()
+    rollup_model.objects.bulk_create(rollups, batch_size=batch_size)
+    return len(rollups)
+
+
+# ---------------- all_tasks dashboard counters ----------------
+# Short TTL: queryset.update() calls skip the signals that bump the version
+TASK_COUNTERS_TIMEOUT = 60
+TASK_YEARS_TIMEOUT = 60 * 60 * 24
+TASK_YEARS_KEY = 'task_available_years'
+
+
+def task_counters_version():
+    return cache.get_or_set('task_counters_version', 1, None)
+
+
+def clear_task_counters():
+    """
+    Drops every cached counter block at once (called from the Task and DeliveredTask signals).
+    """
+    try:
+        cache.incr('task_counters_version')
+    except ValueError:
+        pass
+
+
+def task_counters(year):
+    """
+    The all_tasks badge counters of a year, in one conditional-aggregate query, cached.
+    Returns: dict of counter name -> int
+    """
+    today = date.today()
+    key = f'task_counters:{task_counters_version()}:{year}:{today}'
+    counters = cache.get(key)
+    if counters is None:
+        not_canceled = Q(canceled=False)
+        undelivered = Q(delivered_at__isnull=True)
+        counters = Task.objects.filter(is_quote=False, created_at__year=year).aggregate(
+            total_all=Count('id', filter=not_canceled),
+            finished_count_all=Count('id', filter=not_canceled & Q(closed=True) & undelivered),
+            pending_count_all=Count('id', filter=not_canceled & Q(closed=False)),
+            new_all=Count('id', filter=not_canceled & Q(created_at__date=today)),
+            undelivered_count_all=Count('id', filter=not_canceled & Q(closed=False) & undelivered),
+            delivered_count_all=Count('id', filter=not_canceled & Q(is_delivered=True)),
+            canceled_count=Count('id', filter=Q(canceled=True)),
+            cancel_request_count=Count('id', filter=Q(cancel_requested=True, canceled=False)),
+        )
+        cache.set(key, counters, TASK_COUNTERS_TIMEOUT)
+    return counters
+
+
+def task_available_years():
+    """
+    Years that have tasks, newest first, cached until a task is created in a new year.
+    """
+    return cache.get_or_set(
+        TASK_YEARS_KEY,
+        lambda: list(
+            Task.objects.filter(is_quote=False)
+            .annotate(year=ExtractYear('created_at'))
+            .values_list('year', flat=True).distinct().order_by('-year')
+        ),
+        TASK_YEARS_TIMEOUT,
+    )
+
+
+def forget_new_task_year(year):
+    years = cache.get(TASK_YEARS_KEY)
+    if years is not None and year not in years:
+        cache.delete(TASK_YEARS_KEY)
+
+
+# ---------------- my_tasks tabs and per-user counters ----------------
+MY_TASK_COUNTERS_TIMEOUT = 60 * 5
+# Context name of each my_tasks counter -> the tab it counts
+MY_TASK_COUNTERS = {
+    'total': 'all',
+    'finished_count': 'finished',
+    'unfinished_count': 'pending',
+    'new': 'today',
+    'close_waiting_delivery_count': 'closed-waiting-delivery',
+    'unpaid_count': 'unpaid',
+}
+
+
+def my_task_tabs(today=None):
+    """
+    The filter of each my_tasks tab, applied on top of assigned_employees=user.
+    The same filters build the list and the counters.
+    """
+    not_canceled = Q(canceled=False)
+    return {
+        'all': not_canceled,
+        'finished': not_canceled & Q(closed=True),
+        'today': not_canceled & Q(created_at__date=today or date.today()),
+        # Not closed, or unpaid, or in progress, or not delivered; except branch 1
+        'pending': not_canceled & ~Q(branch_id=1) & (
+            Q(closed=False) | Q(paid_status='U') | Q(status='in_progress') | Q(delivered_at__isnull=True)
+        ),
+        'closed-waiting-delivery': not_canceled & Q(closed=True, delivered_at__isnull=True),
+        'unpaid': not_canceled & Q(closed=False, paid_status='U'),
+    }
+
+
+def my_task_counters_version():
+    return cache.get_or_set('my_task_counters_version', 1, None)
+
+
+def my_task_counters_key(user_id):
+    return f'my_task_counters:{my_task_counters_version()}:{user_id}'
+
+
+def clear_my_task_counters(*user_ids):
+    cache.delete_many([my_task_counters_key(user_id) for user_id in user_ids])
+
+
+def clear_all_my_task_counters():
+    """
+    Drops the cached counters of every user at once, for writes that skip the
+    signals (QuerySet.update() in the admin actions, bulk recomputes).
+    """
+    try:
+        cache.incr('my_task_counters_version')
+    except ValueError:
+        pass
+
+
+def clear_my_task_counters_for(*task_ids):
+    """
+    Drops the cached counters of everyone assigned to these tasks.
+    """
+    user_ids = Task.objects.filter(pk__in=task_ids, assigned_employees__isnull=False) \
+        .values_list('assigned_employees', flat=True).distinct()
+    clear_my_task_counters(*user_ids)
+
+
+def my_task_counters(user):
+    """
+    The my_tasks badge counters of a user, in one conditional-aggregate query,
+    cached per user (and day, for "new").
+    Returns: dict of counter name -> int
+    """
+    today = date.today()
+    key = my_task_counters_key(user.pk)
+    cached = cache.get(key)
+    if cached is not None and cached['date'] == today:
+        return cached['counters']
+
+    tabs = my_task_tabs(today)
+    counters = Task.objects.filter(assigned_employees=user).aggregate(**{
+        name: Count('id', filter=tabs[tab]) for name, tab in MY_TASK_COUNTERS.items()
+    })
+    cache.set(key, {'date': today, 'counters': counters}, MY_TASK_COUNTERS_TIMEOUT)
+    return counters
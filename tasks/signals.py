@@ -1,12 +1,19 @@
-from django.db.models.signals import (m2m_changed, pre_save, post_save, post_delete, pre_delete )
+from django.db.models.signals import (m2m_changed, pre_save, post_save, post_delete, pre_delete, post_init, post_migrate )
 from django.contrib.auth.models import User, Group
 from django.db.models import Q, Avg, Sum
 from django.dispatch import receiver
 from django.db import transaction
 from django.db.models import F
 from django.conf import settings
-from .models import (Task, Subtask)
+from django.core.cache import cache
+from django.db.utils import OperationalError, ProgrammingError
+from django_celery_beat.models import PeriodicTask, IntervalSchedule
+from .models import (Task, Subtask, Notification, NotificationType, DeliveredTask)
+from .context_processors import clear_notification_cache
+from .utils import change_unread_counts, forget_notification_types
 from users.models import Profile
+from .reports import (ROLLUP_FIELDS, REVENUE_FIELDS, revenue_fields, revenue_state, apply_revenue_delta,
+                      clear_task_counters, forget_new_task_year, clear_my_task_counters, clear_my_task_counters_for)
 import logging
 import traceback
 
@@ -47,4 +54,166 @@ def auto_create_or_update_pm_subtask(sender, instance, created, **kwargs):
         )
 
     # Mark that this was processed to prevent it from triggering again
-    instance._pm_subtask_created = True
\ No newline at end of file
+    instance._pm_subtask_created = True
+
+
+# ---------------- Revenue rollup ----------------
+@receiver(post_init, sender=Task)
+def remember_revenue_fields(sender, instance, **kwargs):
+    instance._revenue_fields = revenue_fields(instance)
+
+
+@receiver(pre_save, sender=Task)
+def load_revenue_fields(sender, instance, **kwargs):
+    # Instances loaded with deferred fields have no snapshot: read it from the DB
+    if instance.pk and instance._revenue_fields is None and not instance._state.adding:
+        instance._revenue_fields = Task.objects.filter(pk=instance.pk).values(*REVENUE_FIELDS).first()
+
+
+@receiver(post_save, sender=Task)
+def update_revenue_rollup(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    if raw:
+        return
+    if update_fields and not ROLLUP_FIELDS.intersection(update_fields):
+        return
+
+    old_state = None if created else revenue_state(instance._revenue_fields)
+    new_fields = revenue_fields(instance, instance._revenue_fields)
+    new_state = revenue_state(new_fields)
+    if old_state != new_state:
+        if old_state:
+            apply_revenue_delta(old_state, -1)
+        if new_state:
+            apply_revenue_delta(new_state, 1)
+    instance._revenue_fields = new_fields
+
+
+@receiver(post_delete, sender=Task)
+def remove_from_revenue_rollup(sender, instance, **kwargs):
+    state = revenue_state(revenue_fields(instance, instance._revenue_fields))
+    if state:
+        apply_revenue_delta(state, -1)
+
+
+# ---------------- Delivery state copied on Task ----------------
+@receiver(post_save, sender=DeliveredTask)
+def copy_delivery_to_task(sender, instance, **kwargs):
+    if not instance.main_task_id:
+        return
+    Task.objects.filter(pk=instance.main_task_id).update(
+        delivered_at=instance.delivery_date,
+        is_delivered=instance.is_delivered,
+    )
+    # Keep the caller's Task instance (e.g. in deliver_job) in step
+    if DeliveredTask.main_task.is_cached(instance):
+        instance.main_task.delivered_at = instance.delivery_date
+        instance.main_task.is_delivered = instance.is_delivered
+
+
+@receiver(post_delete, sender=DeliveredTask)
+def clear_task_delivery(sender, instance, **kwargs):
+    if instance.main_task_id:
+        Task.objects.filter(pk=instance.main_task_id).update(delivered_at=None, is_delivered=False)
+
+
+# ---------------- Subtask counters on Task ----------------
+@receiver(post_init, sender=Subtask)
+def remember_subtask_task(sender, instance, **kwargs):
+    instance._previous_task_id = instance.__dict__.get('task_id')
+
+
+@receiver([post_save, post_delete], sender=Subtask)
+def update_task_subtask_counts(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # A subtask moved to another task changes the counters of both
+    task_ids = {instance.task_id, getattr(instance, '_previous_task_id', None)} - {None}
+    Task.recompute_subtask_counts(task_ids)
+    instance._previous_task_id = instance.task_id
+
+    # Keep the caller's Task instance (e.g. in update_subtask_modal) in step
+    if Subtask.task.is_cached(instance) and instance.task.pk:
+        counts = Task.objects.filter(pk=instance.task.pk).values(*Task.SUBTASK_COUNT_FIELDS).first()
+        for name, value in (counts or {}).items():
+            setattr(instance.task, name, value)
+
+
+# ---------------- all_tasks dashboard counters ----------------
+@receiver([post_save, post_delete], sender=Task)
+@receiver([post_save, post_delete], sender=DeliveredTask)
+def clear_cached_task_counters(sender, instance, **kwargs):
+    clear_task_counters()
+    if sender is Task and kwargs.get('created'):
+        forget_new_task_year(instance.created_at.year)
+
+
+# ---------------- my_tasks counters (cached per assigned employee) ----------------
+@receiver(post_save, sender=Task)
+@receiver(pre_delete, sender=Task)
+def clear_assignee_task_counters(sender, instance, **kwargs):
+    clear_my_task_counters_for(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=DeliveredTask)
+def clear_assignee_delivery_counters(sender, instance, **kwargs):
+    if instance.main_task_id:
+        clear_my_task_counters_for(instance.main_task_id)
+
+
+@receiver(m2m_changed, sender=Task.assigned_employees.through)
+def clear_reassigned_task_counters(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # user.assigned_tasks.add(...): only that user's counters change
+        if action in ('post_add', 'post_remove', 'pre_clear'):
+            clear_my_task_counters(instance.pk)
+    elif action in ('post_add', 'post_remove'):
+        clear_my_task_counters(*pk_set)
+    elif action == 'pre_clear':
+        clear_my_task_counters_for(instance.pk)
+
+
+# ---------------- Navbar notification cache and unread counters ----------------
+@receiver([post_save, post_delete], sender=Notification)
+def clear_cached_notifications(sender, instance, **kwargs):
+    clear_notification_cache(instance.user_id)
+
+
+@receiver(post_save, sender=Notification)
+def count_new_notification(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and not instance.is_read:
+        change_unread_counts(instance.user_id, {instance.type.name if instance.type_id else '': 1})
+
+
+@receiver(post_delete, sender=Notification)
+def uncount_deleted_notification(sender, instance, **kwargs):
+    if not instance.is_read:
+        type_name = NotificationType.objects.filter(pk=instance.type_id).values_list('name', flat=True).first()
+        change_unread_counts(instance.user_id, {type_name or '': -1})
+
+
+@receiver([post_save, post_delete], sender=NotificationType)
+def clear_notification_type_names(sender, **kwargs):
+    cache.delete('notification_type_names')
+    forget_notification_types()
+
+
+# ---------------- Outbox ----------------
+@receiver(post_migrate)
+def create_drain_outbox_task(sender, **kwargs):
+    if sender.label != 'tasks':
+        return
+
+    # Retries failed messages and catches up when a wake-up could not be queued
+    try:
+        schedule, _ = IntervalSchedule.objects.get_or_create(
+            every=1,
+            period=IntervalSchedule.MINUTES,
+        )
+
+        PeriodicTask.objects.get_or_create(
+            interval=schedule,
+            name='Drain task outbox',
+            task='tasks.drain_outbox',
+        )
+    except (OperationalError, ProgrammingError):
+        pass
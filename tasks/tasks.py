@@ -0,0 +1,14 @@
+# tasks/tasks.py
+
+from celery import shared_task
+
+from tasks.outbox import process_outbox
+
+
+@shared_task(name="tasks.drain_outbox")
+def drain_outbox():
+    """
+    Carries out the side effects views left in the outbox. Woken after each
+    commit that writes one, and run every minute to retry failures.
+    """
+    return process_outbox()
@@ -41,8 +41,8 @@ def render_progressbar(task):
     if task.closed_at:
         stage_times['closed'] = task.closed_at
 
-    if hasattr(task, 'deliveredtask') and task.deliveredtask and task.deliveredtask.delivery_date:
-        stage_times['delivered'] = task.deliveredtask.delivery_date
+    if task.delivered_at:
+        stage_times['delivered'] = task.delivered_at
 
     current_status = task.status
 
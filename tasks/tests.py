@@ -1,3 +1,248 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db.models import Q
 from django.test import TestCase
+from django.utils import timezone
+
+from customers.models import Customer
+from . import outbox
+from .models import Branch, OutboxMessage, RevenueRollup, Task, TaskName
+from .outbox import OUTBOX_MAX_ATTEMPTS, process_outbox
+from .reports import rebuild_revenue_rollup
+from .utilities.pagination import InvalidCursor, KeysetPaginator
+
+User = get_user_model()
+
+
+class KeysetPaginatorTests(TestCase):
+    def setUp(self):
+        # Ties on attempts, so the primary key tie-breaker matters
+        self.messages = [
+            OutboxMessage.objects.create(kind=OutboxMessage.WEBSOCKET, payload={}, attempts=attempts)
+            for attempts in [0, 2, 1, 2, 0, 1, 2, 0]
+        ]
+        self.expected = sorted(self.messages, key=lambda message: (-message.attempts, -message.id))
+
+    def paginator(self, per_page=3, ordering=('-attempts',)):
+        return KeysetPaginator(OutboxMessage.objects.all(), per_page, ordering)
+
+    def test_primary_key_is_appended_as_tie_breaker(self):
+        self.assertEqual(self.paginator().ordering, ['-attempts', '-id'])
+        self.assertEqual(self.paginator(ordering=['created_at']).ordering, ['created_at', 'id'])
+        self.assertEqual(self.paginator(ordering=['-pk']).ordering, ['-pk'])
+
+    def test_seek_compares_the_columns_lexicographically(self):
+        paginator = self.paginator()
+        self.assertEqual(
+            paginator._seek([2, 10], backwards=False),
+            Q(attempts__lt=2) | Q(attempts=2, id__lt=10),
+        )
+        self.assertEqual(
+            paginator._seek([2, 10], backwards=True),
+            Q(attempts__gt=2) | Q(attempts=2, id__gt=10),
+        )
+
+    def test_pages_forward_through_every_row_once(self):
+        paginator = self.paginator()
+        page = paginator.page()
+        self.assertFalse(page.has_previous())
+        seen = list(page)
+        while page.has_next():
+            page = paginator.page(after=page.next_cursor)
+            self.assertTrue(page.has_previous())
+            seen += list(page)
+        self.assertEqual(seen, self.expected)
+
+    def test_previous_page_is_in_display_order(self):
+        paginator = self.paginator()
+        second = paginator.page(after=paginator.page().next_cursor)
+        previous = paginator.page(before=second.previous_cursor)
+        self.assertEqual(list(previous), self.expected[:3])
+        self.assertFalse(previous.has_previous())
+        self.assertTrue(previous.has_next())
+
+    def test_rows_added_meanwhile_do_not_shift_the_next_page(self):
+        paginator = self.paginator()
+        cursor = paginator.page().next_cursor
+        OutboxMessage.objects.create(kind=OutboxMessage.WEBSOCKET, payload={}, attempts=5)
+        self.assertEqual(list(paginator.page(after=cursor)), self.expected[3:6])
+
+    def test_cursor_round_trip_keeps_datetime_precision(self):
+        message = self.messages[0]
+        OutboxMessage.objects.filter(pk=message.pk).update(
+            created_at=timezone.now().replace(microsecond=123456) - timedelta(days=1)
+        )
+        message.refresh_from_db()
+        paginator = self.paginator(ordering=['-created_at'])
+        self.assertEqual(paginator.decode_cursor(paginator.encode_cursor(message)), [message.created_at, message.id])
+
+    def test_malformed_cursor(self):
+        paginator = self.paginator()
+        for cursor in ['not base64!', 'bm90IGpzb24', paginator.encode_cursor(self.messages[0])[:-4]]:
+            with self.assertRaises(InvalidCursor):
+                paginator.page(after=cursor)
+        self.assertEqual(list(paginator.get_page(after='bogus')), self.expected[:3])
+
+    def test_empty_queryset(self):
+        page = KeysetPaginator(OutboxMessage.objects.none(), 3, ['-id']).page()
+        self.assertEqual(list(page), [])
+        self.assertFalse(page.has_other_pages())
+        self.assertIsNone(page.next_cursor)
+
+
+class ProcessOutboxTests(TestCase):
+    def setUp(self):
+        self.calls = []
+        self.failing = set()
+        handlers = {OutboxMessage.WEBSOCKET: self.handler, OutboxMessage.ACTIVITY_LOG: self.handler}
+        patcher = mock.patch.dict(outbox.HANDLERS, handlers)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def handler(self, payloads):
+        names = [payload['name'] for payload in payloads]
+        self.calls.append(names)
+        if self.failing.intersection(names):
+            raise ConnectionError('down')
+
+    def message(self, name, kind=OutboxMessage.WEBSOCKET, **fields):
+        return OutboxMessage.objects.create(kind=kind, payload={'name': name}, **fields)
+
+    def test_runs_of_one_kind_are_handled_together_in_id_order(self):
+        for name, kind in [('a', OutboxMessage.WEBSOCKET), ('b', OutboxMessage.WEBSOCKET),
+                           ('c', OutboxMessage.ACTIVITY_LOG), ('d', OutboxMessage.WEBSOCKET)]:
+            self.message(name, kind)
+        self.assertEqual(process_outbox(), 4)
+        self.assertEqual(self.calls, [['a', 'b'], ['c'], ['d']])
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_only_the_failing_message_of_a_run_is_charged(self):
+        a, b, c = self.message('a'), self.message('b'), self.message('c')
+        self.failing.add('b')
+        self.assertEqual(process_outbox(), 1)
+        self.assertEqual(self.calls, [['a', 'b', 'c'], ['a'], ['b']])
+
+        self.assertFalse(OutboxMessage.objects.filter(pk=a.pk).exists())
+        b.refresh_from_db()
+        self.assertEqual(b.attempts, 1)
+        self.assertEqual(b.last_error, 'ConnectionError: down')
+        self.assertGreater(b.retry_at, timezone.now())
+        # Later messages wait behind the failure, uncharged
+        c.refresh_from_db()
+        self.assertEqual(c.attempts, 0)
+
+    def test_a_message_waiting_for_its_retry_holds_back_the_later_ones(self):
+        self.message('a', attempts=1, retry_at=timezone.now() + timedelta(minutes=1))
+        self.message('b')
+        self.assertEqual(process_outbox(), 0)
+        self.assertEqual(self.calls, [])
+
+        OutboxMessage.objects.update(retry_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(process_outbox(), 2)
+        self.assertEqual(self.calls, [['a', 'b']])
+
+    def test_backoff_doubles_with_each_attempt(self):
+        message = self.message('a', attempts=3)
+        self.failing.add('a')
+        before = timezone.now()
+        process_outbox()
+        message.refresh_from_db()
+        self.assertEqual(message.attempts, 4)
+        self.assertGreaterEqual(message.retry_at, before + timedelta(seconds=2 ** 4))
+
+    def test_messages_out_of_attempts_are_skipped(self):
+        dead = self.message('a', attempts=OUTBOX_MAX_ATTEMPTS)
+        self.message('b')
+        self.assertEqual(process_outbox(), 1)
+        self.assertEqual(self.calls, [['b']])
+        self.assertTrue(OutboxMessage.objects.filter(pk=dead.pk).exists())
+
+    def test_batches_are_drained_until_empty(self):
+        for name in 'abcde':
+            self.message(name, OutboxMessage.ACTIVITY_LOG if name in 'bd' else OutboxMessage.WEBSOCKET)
+        self.assertEqual(process_outbox(batch_size=2), 5)
+        self.assertEqual([name for call in self.calls for name in call], list('abcde'))
+
+
+class RevenueRollupTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create(username='alice')
+        self.bob = User.objects.create(username='bob')
+        self.branch = Branch.objects.create(name='Main')
+        self.task_name = TaskName.objects.create(name='Print')
+        self.customer = Customer.objects.create(customer_name='Customer', customer_phone='+961000001')
+        self.now = timezone.localtime()
+
+    def task(self, price, user=None, currency='USD'):
+        return Task.objects.create(
+            task_name=self.task_name, customer_name=self.customer, user=user or self.alice,
+            created_by=self.alice, final_price=Decimal(price), currency=currency, branch=self.branch,
+        )
+
+    def bucket(self, user=None, currency='USD'):
+        row = RevenueRollup.objects.filter(
+            user=user or self.alice, branch=self.branch, currency=currency,
+            year=self.now.year, month=self.now.month,
+        ).first()
+        return (row.total_final_price, row.task_count) if row else (Decimal('0'), 0)
+
+    def assertMatchesRebuild(self):
+        def rows():
+            return sorted(
+                RevenueRollup.objects.filter(task_count__gt=0).values_list(
+                    'user_id', 'branch_id', 'currency', 'year', 'month', 'total_final_price', 'task_count'
+                ),
+                key=str,
+            )
+        kept = rows()
+        rebuild_revenue_rollup()
+        self.assertEqual(kept, rows())
+
+    def test_new_tasks_are_added_to_their_bucket(self):
+        self.task('100')
+        self.task('50.50')
+        self.task('7', currency='LBP')
+        self.assertEqual(self.bucket(), (Decimal('150.50'), 2))
+        self.assertEqual(self.bucket(currency='LBP'), (Decimal('7'), 1))
+        self.assertMatchesRebuild()
+
+    def test_price_change_applies_the_difference(self):
+        task = self.task('100')
+        self.task('20')
+        task.final_price = Decimal('130')
+        task.save()
+        self.assertEqual(self.bucket(), (Decimal('150'), 2))
+        self.assertMatchesRebuild()
+
+    def test_reassigned_task_moves_to_the_new_bucket(self):
+        task = self.task('100')
+        task.user = self.bob
+        task.save()
+        self.assertEqual(self.bucket(), (Decimal('0'), 0))
+        self.assertEqual(self.bucket(self.bob), (Decimal('100'), 1))
+        self.assertMatchesRebuild()
+
+    def test_deleted_task_is_removed(self):
+        task = self.task('100')
+        self.task('30')
+        task.delete()
+        self.assertEqual(self.bucket(), (Decimal('30'), 1))
+        self.assertMatchesRebuild()
+
+    def test_unrelated_update_fields_leave_the_rollup_alone(self):
+        task = self.task('100')
+        RevenueRollup.objects.update(total_final_price=Decimal('1'))
+        task.notes = 'changed'
+        task.save(update_fields=['notes'])
+        self.assertEqual(self.bucket(), (Decimal('1'), 1))
 
-# Create your tests here.
+    def test_deferred_instance_uses_the_stored_values(self):
+        task = self.task('100')
+        task = Task.objects.only('id', 'final_price').get(pk=task.pk)
+        task.final_price = Decimal('60')
+        task.save()
+        self.assertEqual(self.bucket(), (Decimal('60'), 1))
+        self.assertMatchesRebuild()
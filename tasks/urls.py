@@ -8,7 +8,7 @@ from .views import (home, all_tasks, my_tasks, change_rate,
                     stats ,stats_month, stats_quarter, stats_year, get_customer_by_project,
                     export_excel, export_pdf, projects, project_detail, add_project,
                     clear_payment_notifications, clear_task_notifications,
-                    assign_tasks_to_project, remove_task_from_project)
+                    assign_tasks_to_project, remove_task_from_project, request_profiles, all_tasks_projects)
 
 
 app_name = 'tasks'
@@ -16,6 +16,7 @@ app_name = 'tasks'
 urlpatterns = [
     path('', home, name='home'),
     path('all-tasks/', all_tasks, name='all_tasks'),
+    path('all-tasks/projects/', all_tasks_projects, name='all_tasks_projects'),
     path('all-tasks/<str:query>/', all_tasks, name='all_tasks_query'),
     path('my-tasks/', my_tasks, name='my_tasks'),
     path('my-tasks/<str:query>/', my_tasks, name='my_tasks_query'),
@@ -62,4 +63,6 @@ urlpatterns = [
     path('notifications/clear/tasks/', clear_task_notifications, name='clear_task_notifications'),
     path('notifications/clear/payments/', clear_payment_notifications, name='clear_payment_notifications'),
 
+    path('request-profiles/', request_profiles, name='request_profiles'),
+
 ]
\ No newline at end of file
@@ -0,0 +1,167 @@
+import base64
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+# Seconds an exact COUNT(*) of a listing is reused before it is run again
+COUNT_CACHE_TIMEOUT = 300
+
+
+def keyset_pagination_enabled():
+    return getattr(settings, 'KEYSET_PAGINATION', False)
+
+
+def keyset_count_enabled():
+    return getattr(settings, 'KEYSET_PAGINATION_COUNT', False)
+
+
+def cached_count(queryset, timeout=COUNT_CACHE_TIMEOUT):
+    """
+    COUNT(*) of the queryset, cached by its SQL so repeated page loads skip it.
+    """
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+    key = 'listing_count:' + hashlib.md5(f'{sql}|{params}'.encode()).hexdigest()
+    return cache.get_or_set(key, queryset.count, timeout)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPaginator:
+    """
+    Cursor pagination: each page is "the next per_page rows after the last
+    row shown", a WHERE on the ordering columns instead of an OFFSET, so
+    page N costs the same as page 1 and rows added meanwhile never shift pages.
+
+    `ordering` must only use non-null model fields; the primary key is appended
+    as a tie-breaker when missing so the order is total.
+    The count is cached, and the pagination template only asks for it when
+    `with_count` is set (default: settings.KEYSET_PAGINATION_COUNT).
+    """
+    is_keyset = True
+
+    def __init__(self, queryset, per_page, ordering, count_timeout=COUNT_CACHE_TIMEOUT, with_count=None):
+        self.queryset = queryset
+        self.per_page = max(int(per_page), 1)
+        self.count_timeout = count_timeout
+        self.with_count = keyset_count_enabled() if with_count is None else with_count
+
+        ordering = list(ordering)
+        pk_name = queryset.model._meta.pk.name
+        if ordering[-1].lstrip('-') not in ('pk', pk_name):
+            ordering.append(('-' if ordering[-1].startswith('-') else '') + pk_name)
+        self.ordering = ordering
+        self.fields = [
+            queryset.model._meta.get_field(pk_name if name.lstrip('-') == 'pk' else name.lstrip('-'))
+            for name in ordering
+        ]
+
+    @cached_property
+    def count(self):
+        return cached_count(self.queryset, self.count_timeout)
+
+    def encode_cursor(self, obj):
+        # value_to_string() keeps full precision (DjangoJSONEncoder cuts microseconds)
+        values = [field.value_to_string(obj) for field in self.fields]
+        data = json.dumps(values).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            if len(values) != len(self.fields):
+                raise ValueError
+            return [field.to_python(value) for field, value in zip(self.fields, values)]
+        except Exception:
+            raise InvalidCursor(cursor)
+
+    def _seek(self, values, backwards):
+        # (a, b) > (x, y)  <=>  a > x OR (a = x AND b > y), per column direction
+        condition = Q()
+        equal = {}
+        for name, field, value in zip(self.ordering, self.fields, values):
+            descending = name.startswith('-') != backwards
+            condition |= Q(**equal, **{f'{field.attname}__{"lt" if descending else "gt"}': value})
+            equal[field.attname] = value
+        return condition
+
+    def page(self, after=None, before=None):
+        """
+        The page following cursor `after`, or preceding cursor `before`, or the first page.
+        Raises InvalidCursor for a malformed cursor.
+        """
+        if before:
+            ordering = [name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering]
+            queryset = self.queryset.filter(self._seek(self.decode_cursor(before), backwards=True))
+        else:
+            ordering = self.ordering
+            queryset = self.queryset
+            if after:
+                queryset = queryset.filter(self._seek(self.decode_cursor(after), backwards=False))
+
+        rows = list(queryset.order_by(*ordering)[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if before:
+            rows.reverse()
+            return KeysetPage(rows, self, has_next=True, has_previous=has_more)
+        return KeysetPage(rows, self, has_next=has_more, has_previous=bool(after))
+
+    def get_page(self, after=None, before=None):
+        """
+        Like page(), but falls back to the first page on a malformed cursor.
+        """
+        try:
+            return self.page(after, before)
+        except InvalidCursor:
+            return self.page()
+
+
+class KeysetPage:
+    is_keyset = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<KeysetPage of {len(self.object_list)} rows>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next and bool(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous and bool(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @cached_property
+    def next_cursor(self):
+        return self.paginator.encode_cursor(self.object_list[-1]) if self.has_next() else None
+
+    @cached_property
+    def previous_cursor(self):
+        return self.paginator.encode_cursor(self.object_list[0]) if self.has_previous() else None
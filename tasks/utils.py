@@ -4,17 +4,23 @@ from payments.models import Payment
 from decimal import Decimal
 from datetime import datetime, date
 from django.contrib.auth import get_user_model
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
 from tasks.models import Notification, NotificationType
 import json
 import os
+import time
+import io
 import zipfile
-from io import BytesIO
-from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from collections import Counter, defaultdict
 from django.conf import settings
+import logging
+from tasks.outbox import push_to_groups
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 ##########################################################################################
 ################################ Creates zip file ########################################
@@ -25,7 +31,7 @@ IGNORED_FILENAMES = [
     'signature.png', 'spacer.gif',
 ]
 
-def is_useless_attachment(file_path, filename):
+def is_useless_attachment(file_path, filename, size=None):
     filename_lower = filename.lower()
 
     # Ignore known filenames
@@ -38,7 +44,9 @@ def is_useless_attachment(file_path, filename):
 
     # Ignore tiny files (e.g. under 5KB)
     try:
-        if os.path.getsize(file_path) < 5 * 1024:
+        if size is None:
+            size = os.path.getsize(file_path)
+        if size < 5 * 1024:
             return True
     except FileNotFoundError:
         return True
@@ -46,55 +54,173 @@ def is_useless_attachment(file_path, filename):
     return False
 
 
-def zip_email_attachments(email, target_filename=None):
+def attachment_is_useless(attachment):
+    """
+    is_useless_attachment() for an Attachment, using its recorded size
+    while the file is not downloaded yet.
     """
-    Zips all attachments of an email and returns a Django File object.
-    The zip is saved under MEDIA_ROOT/zipped_attachments/
+    filename = attachment.filename or os.path.basename(attachment.file.name)
+    if not attachment.file:
+        return is_useless_attachment(None, filename, size=attachment.size or 0)
+    return is_useless_attachment(attachment.file.path, filename)
 
-    :param email: Email instance
-    :param target_filename: Optional custom zip filename
-    :return: File object ready to assign to FileField (e.g. task.file_name)
+
+# Already compressed formats are stored as is: deflating them again costs CPU for nothing
+ZIP_STORED_EXTENSIONS = {
+    '.pdf', '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic',
+    '.zip', '.rar', '.7z', '.gz', '.bz2', '.xz',
+    '.docx', '.xlsx', '.pptx', '.odt', '.ods',
+    '.mp3', '.mp4', '.mov', '.avi',
+}
+ZIP_CHUNK_SIZE = 64 * 1024
+
+
+def zip_attachment_entries(email):
     """
-    attachments = email.attachment_set.all()
-    if attachments.count() < 1:
-        return None
+    Returns the (file path, name in the zip) of the email attachments
+    worth zipping: downloaded and not useless.
+    """
+    entries = []
+    used_names = set()
+    for attachment in email.attachment_set.all():
+        if not attachment.file:
+            continue  # not downloaded from the IMAP server
+        file_path = attachment.file.path
+        filename = attachment.filename or os.path.basename(file_path)
+
+        if is_useless_attachment(file_path, filename, size=attachment.size or None):
+            continue  # ✅ Skip it
+
+        # Two attachments with the same name would overwrite each other when extracted
+        arcname, counter = filename, 1
+        while arcname.lower() in used_names:
+            root, ext = os.path.splitext(filename)
+            arcname, counter = f"{root} ({counter}){ext}", counter + 1
+        used_names.add(arcname.lower())
+        entries.append((file_path, arcname))
+    return entries
+
+
+class _ZipStream(io.RawIOBase):
+    """
+    Write-only sink that hands the bytes ZipFile wrote since the last pop().
+    It is not seekable, so ZipFile writes data descriptors instead of seeking back.
+    """
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
 
-    zip_buffer = BytesIO()
-    has_valid_files = False
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
 
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for attachment in attachments:
-            file_path = attachment.file.path
-            filename = attachment.filename or os.path.basename(file_path)
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
 
-            if is_useless_attachment(file_path, filename):
-                continue  # ✅ Skip it
 
-            zip_file.write(file_path, arcname=filename)
-            has_valid_files = True
+def stream_zip(entries):
+    """
+    Yields a zip archive of the (file path, name in the zip) entries chunk by chunk,
+    so memory stays flat whatever the size of the files.
+    Can feed a StreamingHttpResponse or be written to a file.
+    """
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, 'w') as zip_file:
+        for file_path, arcname in entries:
+            info = zipfile.ZipInfo.from_file(file_path, arcname)
+            if os.path.splitext(arcname)[1].lower() in ZIP_STORED_EXTENSIONS:
+                info.compress_type = zipfile.ZIP_STORED
+            else:
+                info.compress_type = zipfile.ZIP_DEFLATED
+
+            with open(file_path, 'rb') as src, zip_file.open(info, 'w') as dest:
+                for chunk in iter(lambda: src.read(ZIP_CHUNK_SIZE), b''):
+                    dest.write(chunk)
+                    data = stream.pop()
+                    if data:
+                        yield data
+            yield stream.pop()
+    yield stream.pop()
 
-    if not has_valid_files:
-        return None  # ⛔ Don't create zip if nothing valid
 
-    zip_buffer.seek(0)
+def zip_email_attachments(email, target_filename=None):
+    """
+    Zips all attachments of an email straight to a file
+    under MEDIA_ROOT/zipped_attachments/
+
+    :param email: Email instance
+    :param target_filename: Optional custom zip filename
+    :return: (name relative to MEDIA_ROOT, zip filename), ready to assign to a FileField
+             (e.g. task.file_name), or (None, None) if there is nothing to zip
+    """
+    entries = zip_attachment_entries(email)
+    if not entries:
+        return None, None  # ⛔ Don't create zip if nothing valid
+
     zip_name = target_filename or f"email_{email.id}_attachments.zip"
-    zip_path = os.path.join(settings.MEDIA_ROOT, 'zipped_attachments', zip_name)
+    # Tasks point at the zip directly, so never overwrite another task's archive
+    name = default_storage.get_available_name(os.path.join('zipped_attachments', zip_name))
+    zip_path = default_storage.path(name)
 
     os.makedirs(os.path.dirname(zip_path), exist_ok=True)
-    with open(zip_path, 'wb') as f:
-        f.write(zip_buffer.read())
+    partial_path = f"{zip_path}.part"
+    try:
+        with open(partial_path, 'wb') as f:
+            for data in stream_zip(entries):
+                f.write(data)
+        os.replace(partial_path, zip_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
 
-    return File(open(zip_path, 'rb')), zip_name
+    return name, zip_name
 
 
 ##########################################################################################
 ################ Creates Notification object and Channels notification ###################
 
+# NotificationType rows by name -> (row, time.monotonic() when read). The signals in
+# tasks.signals only clear this process: the TTL bounds how long a type deleted or
+# renamed elsewhere (admin, another worker) is used here
+_notification_types = {}
+NOTIFICATION_TYPE_TTL = 60
+
+
+def get_notification_type(name):
+    cached = _notification_types.get(name)
+    if cached is not None and time.monotonic() - cached[1] < NOTIFICATION_TYPE_TTL:
+        return cached[0]
+    notif_type, _ = NotificationType.objects.get_or_create(name=name)
+    _notification_types[name] = (notif_type, time.monotonic())
+    return notif_type
+
+
+def forget_notification_types():
+    _notification_types.clear()
+
+
 def notify_user_about_task(user, task, message=None, type_name=None):
     """
     Creates a Notification and sends it via WebSocket.
     """
-    from tasks.models import NotificationType
+    return notify_users_about_task([user], task, message, type_name)
+
+
+def notify_users_about_task(users, task, message=None, type_name=None):
+    """
+    Creates the same task Notification for every user in one INSERT and
+    leaves the WebSocket pushes in the outbox (see tasks.outbox).
+    Returns: list of created Notification.
+    """
+    from tasks.context_processors import clear_notification_cache
+
+    users = list({user.pk: user for user in users if user is not None}.values())
+    if not users:
+        return []
 
     created_by = task.created_by.get_full_name() if task.created_by else "System"
     due_date = getattr(task, 'due_date', None)
@@ -104,11 +230,11 @@ def notify_user_about_task(user, task, message=None, type_name=None):
 
     # Determine notification type
     if type_name:
-        notif_type, _ = NotificationType.objects.get_or_create(name=type_name.lower())
+        notif_type = get_notification_type(type_name.lower())
     elif "paid" in default_msg.lower():
-        notif_type, _ = NotificationType.objects.get_or_create(name="payment")
+        notif_type = get_notification_type("payment")
     else:
-        notif_type, _ = NotificationType.objects.get_or_create(name="task")
+        notif_type = get_notification_type("task")
 
     # Build extra_data dict
     extra_data = {
@@ -117,14 +243,10 @@ def notify_user_about_task(user, task, message=None, type_name=None):
     if due_date:
         extra_data["due_date"] = due_date
 
-    # Create the notification
-    Notification.objects.create(
-        user=user,
-        task=task,
-        message=default_msg,
-        type=notif_type,
-        extra_data=extra_data
-    )
+    notifications = Notification.objects.bulk_create([
+        Notification(user=user, task=task, message=default_msg, type=notif_type, extra_data=extra_data)
+        for user in users
+    ])
 
     # Prepare WebSocket payload
     payload = {
@@ -137,177 +259,17 @@ def notify_user_about_task(user, task, message=None, type_name=None):
     }
     if due_date:
         payload["due_date"] = due_date
+    payload = json.dumps(payload)
 
-    # Send via WebSocket
-    async_to_sync(get_channel_layer().group_send)(
-        f"user_{user.id}",
-        {
-            "type": "send_notification",
-            "message": json.dumps(payload)
-        }
-    )
-
-########################################################################
-############################### Charts #################################
-def get_quarter_usd(quarter_number):
-    users = User.objects.filter(groups__name='Graphics').filter(is_active=True)
-    user_statsusd = []
+    # bulk_create skips the post_save signals that keep the counters and the navbar cache in sync
+    group_messages = []
     for user in users:
-        tasksusd = Task.objects.filter(user = user).filter(currency='USD').filter(created_at__quarter=quarter_number)
-        
-        total_final_priceusd = 0
-        for task in tasksusd:
-            total_final_priceusd += task.final_price
-
-        user_statsusd.append({
-            'user': user,
-            'total_final_price': total_final_priceusd,
-        })
-    return user_statsusd
-
-def get_quarter_lbp(quarter_number):
-    users = User.objects.filter(groups__name='Graphics').filter(is_active=True)
-    user_statsusd = []
-    for user in users:
-        tasksusd = Task.objects.filter(user = user).filter(currency='LBP').filter(created_at__quarter=quarter_number)
-        
-        total_final_priceusd = 0
-        for task in tasksusd:
-            total_final_priceusd += task.final_price
-
-        user_statsusd.append({
-            'user': user,
-            'total_final_price': total_final_priceusd,
-        })
-    return user_statsusd
-
-def get_year_usd(year_number):
-    users = User.objects.filter(groups__name='Graphics').filter(is_active=True)
-    user_statsusd = []
-    for user in users:
-        tasksusd = Task.objects.filter(user = user).filter(currency='USD').filter(created_at__year=year_number)
-        
-        total_final_priceusd = 0
-        for task in tasksusd:
-            total_final_priceusd += task.final_price
-
-        user_statsusd.append({
-            'user': user,
-            'total_final_price': total_final_priceusd,
-        })
-    return user_statsusd
-
-def get_year_lbp(year_number):
-    users = User.objects.filter(groups__name='Graphics').filter(is_active=True)
-    user_statslbp = []
-    for user in users:
-        taskslbp = Task.objects.filter(user = user).filter(currency='LBP').filter(created_at__year=year_number)
-
-        total_final_pricelbp = 0
-        for task in taskslbp:
-            total_final_pricelbp  += task.final_price
-
-        user_statslbp.append({
-            'user': user,
-            'total_final_price': total_final_pricelbp,
-        })
-    return user_statslbp
-
-    # get all monthes in the selected year
-def get_all_monthes_in_year_usd(year_number):
-    month_statsusd = []
-    for month in range(1, 13):
-        datetime_object = datetime.strptime(str(month), "%m")
-        month_usd = Task.objects.filter(currency='USD', created_at__month=month, created_at__year=year_number).aggregate(Sum('final_price'))
-        amount = month_usd['final_price__sum'] or 0
-        month_statsusd.append({
-            'month': datetime_object.strftime("%B"),
-            'Amount': amount,
-        })
-    return month_statsusd
-
-def get_all_monthes_in_year_lbp(year_number):
-    month_statslbp = []
-    for month in range(1, 13):
-        datetime_object = datetime.strptime(str(month), "%m")
-        month_lbp = Task.objects.filter(currency='LBP', created_at__month=month, created_at__year=year_number).aggregate(Sum('final_price'))
-        amount = month_lbp['final_price__sum'] or 0
-        month_statslbp.append({
-            'month': datetime_object.strftime("%B"),
-            'Amount': amount,
-        })
-    return month_statslbp
-
-
-def get_all_monthes_in_quarter_usd(year_number, quarter_number):
-    month_statsusd = []
-    
-    first = 0
-    last = 0
-    if quarter_number == '1':
-        first = 1 
-        last = 4
-    elif quarter_number == '2':
-        first = 4 
-        last = 7
-    elif quarter_number == '3':
-        first = 7 
-        last = 10
-    elif quarter_number == '4':
-        first = 10 
-        last = 13
-
-    for month in range(first, last):
-        datetime_object = datetime.strptime(str(month), "%m")
-        month_usd = Task.objects.filter(currency='USD').filter(created_at__month=month).filter(created_at__year=year_number).aggregate(Sum('final_price'))
-        amount = month_usd['final_price__sum']
-        if amount is None:
-             month_statsusd.append({
-            'month': datetime_object.strftime("%B"),
-            'Amount': 0,
-        })
-        else:
-            month_statsusd.append({
-                'month': datetime_object.strftime("%B"),
-                'Amount': amount,
-            })
-
-    return month_statsusd
-
-def get_all_monthes_in_quarter_lbp(year_number, quarter_number):
-    month_statslbp = []
-
-    first = 0
-    last = 0
-    if quarter_number == '1':
-        first = 1 
-        last = 4
-    elif quarter_number == '2':
-        first = 4 
-        last = 7
-    elif quarter_number == '3':
-        first = 7 
-        last = 10
-    elif quarter_number == '4':
-        first = 10 
-        last = 13
-    print(first, last)
-    for month in range(first, last):
-        datetime_object = datetime.strptime(str(month), "%m")
-        month_lbp = Task.objects.filter(currency='LBP').filter(created_at__month=month).filter(created_at__year=year_number).aggregate(Sum('final_price'))
-        amount = month_lbp['final_price__sum']
-        if amount is None:
-             month_statslbp.append({
-            'month': datetime_object.strftime("%B"),
-            'Amount': 0,
-        })
-        else:
-            month_statslbp.append({
-                'month': datetime_object.strftime("%B"),
-                'Amount': amount,
-            })
-
-    return month_statslbp
+        unread = change_unread_counts(user.pk, {notif_type.name: 1}, push=False)
+        group_messages += [unread, (f"user_{user.pk}", payload)]
+    clear_notification_cache(*[user.pk for user in users])
+
+    push_to_groups(group_messages)
+    return notifications
 
 
 def notify_user_assigned(user, message):
@@ -315,11 +277,114 @@ def notify_user_assigned(user, message):
     Notification.objects.create(user=user, message=message)
 
     # Send to WebSocket
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        f"user_{user.id}",
-        {
-            "type": "send_notification",
-            "message": message,
-        }
-    )
\ No newline at end of file
+    push_to_groups([(f"user_{user.id}", message)])
+
+##########################################################################################
+######################## Unread notification counters (cache) ###########################
+
+# Counters are rebuilt from the database whenever one is missing, so expiring them is safe.
+# They live in the shared cache (settings.CACHES): every process applies its deltas to the same keys.
+UNREAD_COUNTER_TIMEOUT = 60 * 60 * 24
+
+
+def unread_counter_key(user_id, type_name):
+    return f"notification_unread:{user_id}:{type_name or ''}"
+
+
+def unread_changes_key(user_id):
+    # Bumped by every committed delta, so a seed computed meanwhile is not stored
+    return f"notification_unread_changes:{user_id}"
+
+
+def notification_type_names():
+    return cache.get_or_set(
+        'notification_type_names',
+        lambda: [''] + list(NotificationType.objects.values_list('name', flat=True)),
+        UNREAD_COUNTER_TIMEOUT,
+    )
+
+
+def get_unread_counts(user_id):
+    """
+    Unread notifications of a user per NotificationType name ('' for untyped),
+    read from the cache; one grouped COUNT seeds the counters when any is missing.
+    """
+    names = notification_type_names()
+    keys = {unread_counter_key(user_id, name): name for name in names}
+    cached = cache.get_many(keys)
+    if len(cached) == len(keys):
+        return {name: max(cached[key], 0) for key, name in keys.items()}
+
+    changes = cache.get(unread_changes_key(user_id))
+    counts = dict.fromkeys(names, 0)
+    rows = Notification.objects.filter(user_id=user_id, is_read=False) \
+        .values_list('type__name').annotate(total=Count('id')).order_by()
+    for name, total in rows:
+        counts[name or ''] = total
+
+    # add() never overwrites a counter another process seeded or moved in the meantime,
+    # and a delta committed while counting makes this count possibly stale: skip the seed
+    if cache.get(unread_changes_key(user_id)) == changes:
+        for key, name in keys.items():
+            cache.add(key, counts[name], UNREAD_COUNTER_TIMEOUT)
+    return counts
+
+
+def _apply_unread_deltas(user_id, deltas):
+    changes_key = unread_changes_key(user_id)
+    cache.add(changes_key, 0, UNREAD_COUNTER_TIMEOUT)
+    try:
+        cache.incr(changes_key)
+    except ValueError:
+        pass
+    for name, delta in deltas.items():
+        try:
+            cache.incr(unread_counter_key(user_id, name), delta)
+        except ValueError:
+            pass
+
+
+def change_unread_counts(user_id, deltas, push=True):
+    """
+    Applies {type name: delta} to the user's counters once the current transaction
+    commits and, unless push is False, queues the delta for their WebSocket group in the outbox.
+    Missing counters are left alone: the next read seeds them from the database.
+    Returns: the pushed message as (group name, JSON text), or None.
+    """
+    deltas = {name or '': delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return None
+    # A rolled back notification never moves the counters
+    transaction.on_commit(lambda: _apply_unread_deltas(user_id, deltas))
+    message = (f"user_{user_id}", json.dumps({"type": "unread", "deltas": deltas}))
+    if push:
+        push_to_groups([message])
+    return message
+
+
+def mark_notifications_read(notifications):
+    """
+    Marks a queryset of notifications as read, keeping the unread counters
+    and the navbar cache of every affected user in sync.
+    Returns: int number of notifications marked as read.
+    """
+    from tasks.context_processors import clear_notification_cache
+
+    with transaction.atomic():
+        rows = list(
+            notifications.filter(is_read=False)
+            .select_for_update(of=('self',))
+            .values_list('id', 'user_id', 'type__name')
+        )
+        if not rows:
+            return 0
+        Notification.objects.filter(id__in=[row[0] for row in rows]).update(is_read=True)
+
+        deltas = defaultdict(Counter)
+        for _, user_id, name in rows:
+            deltas[user_id][name or ''] -= 1
+        push_to_groups([
+            change_unread_counts(user_id, user_deltas, push=False) for user_id, user_deltas in deltas.items()
+        ])
+        clear_notification_cache(*deltas)
+    return len(rows)
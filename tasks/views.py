@@ -1,13 +1,13 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.views.decorators.http import require_POST
 from django.contrib import messages
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.db import transaction
 from django.urls import reverse
 from urllib.parse import urlencode
-from django.db.models import Sum, Count, Q, Exists, OuterRef, Max, Prefetch, Subquery, CharField, Value, Case, When, Min, DecimalField
-from django.db.models.functions import Coalesce
+from django.db.models import Sum, Count, Q, Exists, OuterRef, Max, Prefetch, Subquery, CharField, Value, Case, When, Min, prefetch_related_objects
 from decimal import Decimal
 from customers.models import Customer, CountryCodes
 from django.contrib.auth import get_user_model
@@ -16,6 +16,8 @@ from django.http import HttpResponse, HttpResponseRedirect, Http404, HttpRespons
 from django.conf import settings
 from django.utils.text import slugify
 from tasks.utilities.navigation import get_back_url
+from tasks.middleware.request_profiler import REQUEST_PROFILES
+from tasks.utilities.pagination import KeysetPaginator, keyset_pagination_enabled
 from email.utils import parseaddr
 from .models import Task, TaskName, Subtask, TaskName, TaskActivityLog, DeliveredTask, CurrencyRate, Project, Branch
 from .forms import (TaskForm, SubtaskForm, UpdateSubtaskForm, 
@@ -24,8 +26,12 @@ from .forms import (TaskForm, SubtaskForm, UpdateSubtaskForm,
 from payments.models import Payment, TaskPaymentStatus
 from payments.utils.payments_utils import update_payment_summary
 from .utils import *
+from .outbox import record_task_activity
+from .reports import (RevenueReport, QUARTER_MONTHS, get_stats_users, task_counters, task_available_years,
+                      my_task_tabs, my_task_counters)
 from .buttons_export import export_tasks_to_excel, export_tasks_to_pdf
 from custom_email.models import Email
+from custom_email.tasks.attachments import download_attachments
 import tldextract
 from tasks.decorators import disallow_groups
 from activity_logs.models import ActivityLog
@@ -35,7 +41,6 @@ import random
 from datetime import datetime, date
 from django.utils import timezone
 from django.utils.timezone import now
-from django.db.models.functions import ExtractYear
 import calendar
 import os
 
@@ -62,15 +67,45 @@ def get_customer_by_project(request):
 @require_POST
 @login_required
 def clear_task_notifications(request):
-    Notification.objects.filter(user=request.user, is_read=False).exclude(type__name='payment').update(is_read=True)
+    mark_notifications_read(Notification.objects.filter(user=request.user).exclude(type__name='payment'))
     return JsonResponse({'status': 'success'})
 
 @require_POST
 @login_required
 def clear_payment_notifications(request):
-    Notification.objects.filter(user=request.user, is_read=False, type__name='payment').update(is_read=True)
+    mark_notifications_read(Notification.objects.filter(user=request.user, type__name='payment'))
     return JsonResponse({'status': 'success'})
 
+@staff_member_required
+def request_profiles(request):
+    """
+    The request summaries kept by RequestProfilerMiddleware in this process,
+    aggregated per view, and the latest ones (?view=<dotted path> to filter).
+    """
+    profiles = list(REQUEST_PROFILES)
+    per_view = {}
+    for profile in profiles:
+        per_view.setdefault(profile['view'], []).append(profile)
+
+    views = []
+    for view, rows in per_view.items():
+        times = sorted(row['total_ms'] for row in rows)
+        views.append({
+            'view': view,
+            'requests': len(rows),
+            'avg_queries': round(sum(row['queries'] for row in rows) / len(rows), 1),
+            'max_queries': max(row['queries'] for row in rows),
+            'avg_db_ms': round(sum(row['db_ms'] for row in rows) / len(rows), 1),
+            'avg_ms': round(sum(times) / len(times), 1),
+            'p95_ms': times[int(len(times) * 0.95)] if len(times) > 1 else times[0],
+            'budget': settings.REQUEST_BUDGETS.get(view),
+        })
+    views.sort(key=lambda row: row['avg_ms'], reverse=True)
+
+    view = request.GET.get('view')
+    latest = [profile for profile in reversed(profiles) if not view or profile['view'] == view][:100]
+    return JsonResponse({'enabled': settings.REQUEST_PROFILING, 'views': views, 'latest': latest})
+
 def custom_permission_denied_view(request, exception=None):
     return render(request, '403.html', status=403)
 
@@ -113,96 +148,20 @@ def get_random_color():
 @disallow_groups(['Cashier'])
 @login_required
 def stats(request):
-    from django.db.models import Sum
-
-    year_number = datetime.now().year
-
-    users = User.objects.filter(
-        Q(groups__name__in=[
-            'Graphic', 'Laser', 'Outdoor', 'Typing', 'ManagerAssistant'
-        ]),
-        is_active=True
-    ).distinct()
-
-    user_statsusd = []
-    user_statslbp = []
-
-    for user in users:
-        usd_total = Task.objects.filter(
-            user=user,
-            created_at__year=year_number,
-            currency='USD'
-        ).aggregate(total=Sum('final_price'))['total'] or 0
-
-        lbp_total = Task.objects.filter(
-            user=user,
-            created_at__year=year_number,
-            currency='LBP'
-        ).aggregate(total=Sum('final_price'))['total'] or 0
-
-        user_statsusd.append({'user': user, 'final_price': round(usd_total, 2)})
-        user_statslbp.append({'user': user, 'final_price': round(lbp_total, 2)})
-
-    # Monthly totals
-    month_statsusd = [
-        {
-            'month': m,
-            'Amount': Task.objects.filter(
-                created_at__year=year_number,
-                created_at__month=m,
-                currency='USD'
-            ).aggregate(total=Sum('final_price'))['total'] or 0
-        } for m in range(1, 13)
-    ]
-
-    month_statslbp = [
-        {
-            'month': m,
-            'Amount': Task.objects.filter(
-                created_at__year=year_number,
-                created_at__month=m,
-                currency='LBP'
-            ).aggregate(total=Sum('final_price'))['total'] or 0
-        } for m in range(1, 13)
-    ]
-
-    usd_colors = [get_random_color() for _ in user_statsusd]
-    lbp_colors = [get_random_color() for _ in user_statslbp]
-
-    context = {
-        "year_number": year_number,
-        "user_statsusd": user_statsusd,
-        "user_statslbp": user_statslbp,
-        "month_statsusd": month_statsusd,
-        "month_statslbp": month_statslbp,
-        'usd_colors': usd_colors,
-        'lbp_colors': lbp_colors,
-        'nav_title': 'Statistics',
-    }
-
-    return render(request, 'tasks/stats/stats-year.html', context)
+    return render_year_stats(request, datetime.now().year)
 
 
 @disallow_groups(['Cashier'])
 @login_required
 def stats_month(request, month_number):
-    users = User.objects.filter(
-        Q(groups__name='Graphic') | Q(groups__name='Laser') | 
-        Q(groups__name='Outdoor') | Q(groups__name='Typing') | 
-        Q(groups__name='Outdoor') | Q(groups__name='ManagerAssistant') |
-        Q(groups__name='Typing'), is_active=True).distinct()
+    users = get_stats_users()
     user_statsusd = []
     user_statslbp = []
 
     if str(month_number) in [str(i) for i in range(1, 13)]:
-        for user in users:
-            tasksusd = Task.objects.filter(user=user, currency='USD', created_at__month=month_number)
-            total_usd = sum(task.final_price for task in tasksusd)
-            user_statsusd.append({'user': user, 'final_price': total_usd})
-
-            taskslbp = Task.objects.filter(user=user, currency='LBP', created_at__month=month_number)
-            total_lbp = sum(task.final_price for task in taskslbp)
-            user_statslbp.append({'user': user, 'final_price': total_lbp})
+        report = RevenueReport(months=[int(month_number)])
+        user_statsusd = report.user_stats(users, 'USD')
+        user_statslbp = report.user_stats(users, 'LBP')
 
     # ✅ Now it's safe to generate colors
     usd_colors = [get_random_color() for _ in user_statsusd]
@@ -221,84 +180,20 @@ def stats_month(request, month_number):
 @disallow_groups(['Cashier'])
 @login_required
 def stats_quarter(request, quarter_number):
-    from calendar import monthrange
-    from django.db.models import Sum
     year_number = datetime.now().year
     quarter_number = int(quarter_number)
-    month_map = {
-        1: [1, 2, 3],
-        2: [4, 5, 6],
-        3: [7, 8, 9],
-        4: [10, 11, 12],
-    }
-    months = month_map.get(quarter_number, [])
-
-    users = User.objects.filter(
-        Q(groups__name__in=[
-            'Graphic', 'Laser', 'Outdoor', 'Typing', 'ManagerAssistant'
-        ]),
-        is_active=True
-    ).distinct()
-
-    quarter_statsusd = []
-    quarter_statslbp = []
-
-    for user in users:
-        usd_total = Task.objects.filter(
-            user=user,
-            created_at__year=year_number,
-            created_at__month__in=months,
-            currency='USD'
-        ).aggregate(total=Sum('final_price'))['total'] or 0
-
-        lbp_total = Task.objects.filter(
-            user=user,
-            created_at__year=year_number,
-            created_at__month__in=months,
-            currency='LBP'
-        ).aggregate(total=Sum('final_price'))['total'] or 0
-
-        quarter_statsusd.append({
-            'user': user,
-            'total_final_price': round(usd_total, 2),
-        })
-        quarter_statslbp.append({
-            'user': user,
-            'total_price_with_vat_with_discount_designer': round(lbp_total, 2),
-        })
+    months = QUARTER_MONTHS.get(quarter_number, [])
 
-    # Month totals for each currency (like before)
-    month_usd = [
-        {
-            'month': month,
-            'Amount': Task.objects.filter(
-                created_at__year=year_number,
-                created_at__month=month,
-                currency='USD'
-            ).aggregate(total=Sum('final_price'))['total'] or 0
-        }
-        for month in months
-    ]
-
-    month_lbp = [
-        {
-            'month': month,
-            'Amount': Task.objects.filter(
-                created_at__year=year_number,
-                created_at__month=month,
-                currency='LBP'
-            ).aggregate(total=Sum('final_price'))['total'] or 0
-        }
-        for month in months
-    ]
+    users = get_stats_users()
+    report = RevenueReport(year=year_number, months=months) if months else None
 
     context = {
         "year_number": year_number,
         "quarter_number": quarter_number,
-        "quarter_statsusd": quarter_statsusd,
-        "quarter_statslbp": quarter_statslbp,
-        "month_usd": month_usd,
-        "month_lbp": month_lbp,
+        "quarter_statsusd": report.user_stats(users, 'USD', key='total_final_price') if report else [],
+        "quarter_statslbp": report.user_stats(users, 'LBP', key='total_price_with_vat_with_discount_designer') if report else [],
+        "month_usd": report.month_stats('USD') if report else [],
+        "month_lbp": report.month_stats('LBP') if report else [],
         'nav_title': 'Statistics',
     }
     return render(request, 'tasks/stats/stats-quarter.html', context)
@@ -306,58 +201,15 @@ def stats_quarter(request, quarter_number):
 @disallow_groups(['Cashier'])
 @login_required
 def stats_year(request, year_number):
-    from django.db.models import Sum
+    return render_year_stats(request, int(year_number))
 
-    year_number = int(year_number)
 
-    users = User.objects.filter(
-        Q(groups__name__in=[
-            'Graphic', 'Laser', 'Outdoor', 'Typing', 'ManagerAssistant'
-        ]),
-        is_active=True
-    ).distinct()
+def render_year_stats(request, year_number):
+    users = get_stats_users()
+    report = RevenueReport(year=year_number)
 
-    user_statsusd = []
-    user_statslbp = []
-
-    for user in users:
-        usd_total = Task.objects.filter(
-            user=user,
-            created_at__year=year_number,
-            currency='USD'
-        ).aggregate(total=Sum('final_price'))['total'] or 0
-
-        lbp_total = Task.objects.filter(
-            user=user,
-            created_at__year=year_number,
-            currency='LBP'
-        ).aggregate(total=Sum('final_price'))['total'] or 0
-
-        user_statsusd.append({'user': user, 'final_price': round(usd_total, 2)})
-        user_statslbp.append({'user': user, 'final_price': round(lbp_total, 2)})
-
-    # Monthly totals (for monthly bar charts)
-    month_statsusd = [
-        {
-            'month': m,
-            'Amount': Task.objects.filter(
-                created_at__year=year_number,
-                created_at__month=m,
-                currency='USD'
-            ).aggregate(total=Sum('final_price'))['total'] or 0
-        } for m in range(1, 13)
-    ]
-
-    month_statslbp = [
-        {
-            'month': m,
-            'Amount': Task.objects.filter(
-                created_at__year=year_number,
-                created_at__month=m,
-                currency='LBP'
-            ).aggregate(total=Sum('final_price'))['total'] or 0
-        } for m in range(1, 13)
-    ]
+    user_statsusd = report.user_stats(users, 'USD')
+    user_statslbp = report.user_stats(users, 'LBP')
 
     usd_colors = [get_random_color() for _ in user_statsusd]
     lbp_colors = [get_random_color() for _ in user_statslbp]
@@ -366,8 +218,8 @@ def stats_year(request, year_number):
         "year_number": year_number,
         "user_statsusd": user_statsusd,
         "user_statslbp": user_statslbp,
-        "month_statsusd": month_statsusd,
-        "month_statslbp": month_statslbp,
+        "month_statsusd": report.month_stats('USD'),
+        "month_statslbp": report.month_stats('LBP'),
         'usd_colors': usd_colors,
         'lbp_colors': lbp_colors,
         'nav_title': 'Statistics',
@@ -417,6 +269,17 @@ def export_pdf(request):
 
     return export_tasks_to_pdf(queryset)
 
+# Sorts on non-null Task columns, which cursor pagination can seek on (with id as tie-breaker)
+KEYSET_TASK_SORTS = {
+    'id', '-id',
+    'status', '-status',
+    'final_price', '-final_price',
+    'total_paid', '-total_paid',
+    'remaining', '-remaining',
+    'paid_status', '-paid_status',
+}
+
+
 @disallow_groups(['Cashier'])
 @login_required
 def all_tasks(request, query=None):
@@ -463,21 +326,15 @@ def all_tasks(request, query=None):
     # Handle different query types
     if query is None:
         query = 'undelivered'
-        tasks = tasks.filter(not_canceled).exclude(
-            id__in=DeliveredTask.objects.values_list('main_task_id', flat=True)
-        )
+        tasks = tasks.filter(not_canceled, delivered_at__isnull=True)
     elif query == 'finished':
-        tasks = tasks.filter(not_canceled, closed=True).exclude(
-            id__in=DeliveredTask.objects.values_list('main_task_id', flat=True)
-        )
+        tasks = tasks.filter(not_canceled, closed=True, delivered_at__isnull=True)
     elif query == 'today':
         tasks = tasks.filter(not_canceled, created_at__date=date.today())
     elif query == 'undelivered':
-        tasks = tasks.filter(not_canceled, not_closed).exclude(
-            id__in=DeliveredTask.objects.values_list('main_task_id', flat=True)
-        )
+        tasks = tasks.filter(not_canceled, not_closed, delivered_at__isnull=True)
     elif query == 'delivered':
-        tasks = tasks.filter(not_canceled, deliveredtask__is_delivered=True)
+        tasks = tasks.filter(not_canceled, is_delivered=True)
     elif query == 'cancel_request':
         tasks = tasks.filter(cancel_requested=True, canceled=False)
     elif query == 'canceled':
@@ -492,13 +349,8 @@ def all_tasks(request, query=None):
             Q(customer_name__customer_name__icontains=search_query)
         )
 
-    # Annotate total_paid and highlighted status
+    # Annotate highlighted status (total_paid is a stored column)
     tasks = tasks.annotate(
-        total_paid=Coalesce(
-            Sum('payments__amount'),
-            Decimal('0.00'),
-            output_field=DecimalField(max_digits=20, decimal_places=2)
-        ),
         is_highlighted=Exists(
             Subtask.objects.filter(
                 task=OuterRef('pk'),
@@ -518,6 +370,7 @@ def all_tasks(request, query=None):
         'assigned_employees__username', '-assigned_employees__username',
         'final_price', '-final_price',
         'total_paid', '-total_paid',
+        'remaining', '-remaining',
         'paid_status', '-paid_status',
     ]
     if sort_by not in allowed_sorts:
@@ -532,49 +385,26 @@ def all_tasks(request, query=None):
         tasks = tasks.order_by(sort_by)
 
     # Pagination
-    paginator = Paginator(tasks, per_page)
-    try:
-        tasks = paginator.page(page)
-    except PageNotAnInteger:
-        tasks = paginator.page(1)
-    except EmptyPage:
-        tasks = paginator.page(paginator.num_pages)
-
-    # Project Groups (exclude canceled and closed here)
-    project_groups = Project.objects.filter(
-        task__in=Task.objects.filter(year_filter, not_canceled, not_closed)
-    ).distinct().prefetch_related(
-        Prefetch('task_set',
-                queryset=Task.objects.filter(year_filter, not_canceled, not_closed)
-                                    .select_related('task_name', 'customer_name', 'user', 'created_by')
-                                    .prefetch_related('assigned_employees')
-                                    .order_by(sort_by)),  # Add sorting here
-        'customer'
-    ).order_by('-created_at')
-
-    # Dashboard counters - updated to exclude closed from undelivered
+    if keyset_pagination_enabled() and sort_by in KEYSET_TASK_SORTS:
+        paginator = KeysetPaginator(tasks, per_page, [sort_by])
+        tasks = paginator.get_page(after=request.GET.get('cursor'), before=request.GET.get('before'))
+    else:
+        paginator = Paginator(tasks, per_page)
+        try:
+            tasks = paginator.page(page)
+        except PageNotAnInteger:
+            tasks = paginator.page(1)
+        except EmptyPage:
+            tasks = paginator.page(paginator.num_pages)
+
+    # Dashboard counters (one query, cached until a task changes)
     today = date.today()
-    total_all = Task.objects.filter(year_filter, not_canceled).count()
-    finished_count_all = Task.objects.filter(year_filter, not_canceled, closed=True) \
-                                    .exclude(id__in=DeliveredTask.objects.values_list('main_task_id', flat=True)) \
-                                    .count()
-    pending_count_all = Task.objects.filter(year_filter, not_canceled, closed=False).count()
-    new_all = Task.objects.filter(year_filter, not_canceled, created_at__date=today).count()
-    undelivered_count_all = Task.objects.filter(year_filter, not_canceled, not_closed) \
-                                        .exclude(id__in=DeliveredTask.objects.values_list('main_task_id', flat=True)) \
-                                        .count()
-    delivered_count_all = Task.objects.filter(year_filter, not_canceled, deliveredtask__is_delivered=True).distinct().count()
-    canceled_count = Task.objects.filter(year_filter, canceled=True).count()
-    cancel_request_count = Task.objects.filter(year_filter, cancel_requested=True, canceled=False).count()
-
-    available_years = Task.objects.filter(is_quote=False) \
-                                .annotate(year=ExtractYear('created_at')) \
-                                .values_list('year', flat=True).distinct().order_by('-year')
+    counters = task_counters(current_year)
+    available_years = task_available_years()
     branches = Branch.objects.all()
 
     return render(request, 'tasks/all-tasks.html', {
         'tasks': tasks,
-        'project_groups': project_groups,
         'employees': employees,
         'selected_group': selected_group,
         'target_group_names': target_group_names,
@@ -585,19 +415,69 @@ def all_tasks(request, query=None):
         'current_year': current_year,
         'available_years': available_years,
         'today': today,
-        'total_all': total_all,
-        'finished_count_all': finished_count_all,
-        'pending_count_all': pending_count_all,
-        'new_all': new_all,
-        'undelivered_count_all': undelivered_count_all,
-        'delivered_count_all': delivered_count_all,
-        'canceled': canceled_count,
-        'cancel_request': cancel_request_count,
+        'total_all': counters['total_all'],
+        'finished_count_all': counters['finished_count_all'],
+        'pending_count_all': counters['pending_count_all'],
+        'new_all': counters['new_all'],
+        'undelivered_count_all': counters['undelivered_count_all'],
+        'delivered_count_all': counters['delivered_count_all'],
+        'canceled': counters['canceled_count'],
+        'cancel_request': counters['cancel_request_count'],
         'nav_title': 'All Tasks',
         'branches': branches,
         'selected_branch': selected_branch,
     })
 
+# Project groups of the all-tasks page, fetched when the section is expanded
+PROJECT_GROUPS_PER_PAGE = 10
+PROJECT_TASK_SORTS = KEYSET_TASK_SORTS | {
+    'order_number', '-order_number',
+    'task_name__name', '-task_name__name',
+    'customer_name__customer_name', '-customer_name__customer_name',
+}
+
+
+@disallow_groups(['Cashier'])
+@login_required
+def all_tasks_projects(request):
+    """
+    HTML fragment: one page of the projects with open tasks in the selected year,
+    each with its open tasks. Only the tasks of the projects on the page are loaded.
+    """
+    current_year = int(request.GET.get('year', now().year))
+    sort_by = request.GET.get('sort', '-id')
+    if sort_by not in PROJECT_TASK_SORTS:
+        sort_by = '-id'
+
+    # Open = not canceled and not closed
+    open_tasks = Q(task__is_quote=False, task__created_at__year=current_year, task__canceled=False, task__closed=False)
+    projects = Project.objects.annotate(open_task_count=Count('task', filter=open_tasks)) \
+                              .filter(open_task_count__gt=0) \
+                              .order_by('-created_at', '-id')
+
+    paginator = Paginator(projects, PROJECT_GROUPS_PER_PAGE)
+    project_groups = paginator.get_page(request.GET.get('page'))
+
+    prefetch_related_objects(project_groups.object_list, Prefetch(
+        'task_set',
+        queryset=Task.objects.filter(is_quote=False, created_at__year=current_year, canceled=False, closed=False)
+                             .select_related('task_name', 'customer_name', 'user', 'created_by')
+                             .prefetch_related('assigned_employees')
+                             .annotate(is_highlighted=Exists(
+                                 Subtask.objects.filter(task=OuterRef('pk'), is_highlighted=True, user=request.user)
+                             ))
+                             .order_by(sort_by),
+    ))
+
+    return render(request, 'tasks/partials/all-tasks/all-tasks-table-project.html', {
+        'project_groups': project_groups,
+        'sort_by': sort_by,
+        'current_year': current_year,
+        'search_query': request.GET.get('search', ''),
+        'per_page': request.GET.get('per_page', '10'),
+        'selected_group': request.GET.get('group_filter', ''),
+    })
+
 @disallow_groups(['Cashier'])
 @login_required
 def my_tasks(request, query=None):
@@ -605,111 +485,42 @@ def my_tasks(request, query=None):
     per_page = request.GET.get('per_page', '10')
     page = request.GET.get('page', 1)
 
-    tasks = Task.objects.prefetch_related('assigned_employees').select_related('task_name', 'customer_name', 'user', 'created_by', 'project').filter(
-        assigned_employees=user.id,
-        canceled=False
-    ).filter(
-        Q(closed=False) | # if not closed
-        Q(paid_status='U') | # or if not paid
-        Q(status='in_progress') | # or status is in progress
-        ~Q(id__in=DeliveredTask.objects.values_list('main_task_id', flat=True)) # or not delivered
-        
-    ).exclude(branch_id=1).distinct() # except that belongs to branch1
-
-    # Properly defined subquery using Exists
-    tasks = tasks.annotate(
-        is_highlighted=Exists(
-            Subtask.objects.filter(
-                task=OuterRef('pk'),
-                is_highlighted=True,
-                user=user
-            )
-        )
-    )
+    # One filter per tab (tasks.reports.my_task_tabs); the default tab is "pending"
+    tabs = my_task_tabs()
+    tab = query if query in tabs else 'pending'
+
+    tasks = Task.objects.filter(assigned_employees=user).filter(tabs[tab]) \
+                        .select_related('task_name', 'customer_name', 'user', 'created_by', 'project') \
+                        .prefetch_related('assigned_employees') \
+                        .annotate(
+                            is_highlighted=Exists(
+                                Subtask.objects.filter(
+                                    task=OuterRef('pk'),
+                                    is_highlighted=True,
+                                    user=user
+                                )
+                            )
+                        )
 
     #-------------------Dashboard counter -------------------------|
-    # 1- Total
-    total = Task.objects.prefetch_related('assigned_employees').filter(assigned_employees=request.user.id).filter(canceled=False).count()
-    
-    # 2- Finished
-    finished_count = Task.objects.prefetch_related('assigned_employees').filter(assigned_employees=request.user.id).filter(closed=True).filter(canceled=False).count()
-    
-    # 3- pending
-    unfinished_count = Task.objects.prefetch_related('assigned_employees').filter(
-        assigned_employees=request.user.id,
-        canceled=False
-    ).filter(
-        Q(closed=False) |
-        Q(paid_status='U') |
-        Q(status='in_progress') |
-        ~Q(id__in=DeliveredTask.objects.values_list('main_task_id', flat=True))
-    ).exclude(branch_id=1).distinct().count()
-
-    # 4- Today
-    today = date.today()
-    new = Task.objects.filter(assigned_employees=request.user.id).filter(canceled=False).filter(created_at__date=today).count()
-
-    # 5- Closed Waiting Delivery
-    close_waiting_delivery_count = Task.objects.prefetch_related('assigned_employees').filter(assigned_employees=request.user,canceled=False, closed=True).exclude(id__in=DeliveredTask.objects.values_list('main_task_id', flat=True)).count()
+    # total, finished, pending, today, closed waiting delivery and unpaid in one cached query
+    counters = my_task_counters(user)
 
-    # 3- Unpaid
-    unpaid_count = Task.objects.prefetch_related('assigned_employees').filter(assigned_employees=request.user.id, canceled=False, closed=False, paid_status='U').count()
-    
-    if query == 'finished':
-        tasks = Task.objects.prefetch_related(
-            'assigned_employees'
-            ).select_related(
-            'task_name', 'customer_name', 'user', 'created_by', 'project'
-            ).filter(assigned_employees=request.user.id).filter(closed=True).filter(canceled=False)
-    elif query == 'today':
-        today = date.today()
-        tasks = Task.objects.prefetch_related(
-            'assigned_employees'
-            ).select_related(
-            'task_name', 'customer_name', 'user', 'created_by', 'project'
-            ).filter(assigned_employees=request.user.id).filter(canceled=False).filter(created_at__date=today)
-    elif query == 'all':
-        tasks = Task.objects.prefetch_related(
-            'assigned_employees'
-            ).select_related(
-            'task_name', 'customer_name', 'user', 'created_by', 'project'
-            ).filter(assigned_employees=request.user.id).filter(canceled=False)
-    elif query == 'pending':
-        tasks = Task.objects.prefetch_related(
-            'assigned_employees'
-        ).select_related(
-            'task_name', 'customer_name', 'user', 'created_by', 'project'
-        ).filter(
-            assigned_employees=request.user.id,
-            canceled=False
-        ).filter(
-            Q(closed=False) |
-            Q(paid_status='U') |
-            Q(status='in_progress') |
-            ~Q(id__in=DeliveredTask.objects.values_list('main_task_id', flat=True))
-        ).exclude(branch_id=1).distinct()
-
-    elif query == 'closed-waiting-delivery':
-        tasks = Task.objects.prefetch_related('assigned_employees').select_related('task_name', 'customer_name', 'user', 'created_by', 'project').filter(assigned_employees=request.user.id,canceled=False, closed=True).exclude(id__in=DeliveredTask.objects.values_list('main_task_id', flat=True))
-
-    elif query == 'unpaid':
-        tasks = Task.objects.prefetch_related('assigned_employees').select_related('task_name', 'customer_name', 'user', 'created_by', 'project').filter(assigned_employees=request.user.id,canceled=False, closed=False, paid_status='U')
-        
-    paginator = Paginator(tasks, per_page)
-    try:
-        tasks = paginator.page(page)
-    except PageNotAnInteger:
-        tasks = paginator.page(1)
-    except EmptyPage:
-        tasks = paginator.page(paginator.num_pages)
+    if keyset_pagination_enabled():
+        paginator = KeysetPaginator(tasks, per_page, ['-id'])
+        tasks = paginator.get_page(after=request.GET.get('cursor'), before=request.GET.get('before'))
+    else:
+        paginator = Paginator(tasks, per_page)
+        try:
+            tasks = paginator.page(page)
+        except PageNotAnInteger:
+            tasks = paginator.page(1)
+        except EmptyPage:
+            tasks = paginator.page(paginator.num_pages)
 
     context = {
-        'tasks':tasks, 'total':total, 
-        'finished_count':finished_count, 
-        'unpaid_count': unpaid_count,
-        'unfinished_count':unfinished_count, 
-        'new':new, 
-        'close_waiting_delivery_count':close_waiting_delivery_count,
+        'tasks': tasks,
+        **counters,
         'nav_title': 'My Tasks',
     }
     return render(request, 'tasks/my-tasks.html', context)
@@ -752,7 +563,7 @@ def add_task_view(request):
 
                     
 
-                    TaskActivityLog.objects.create(
+                    record_task_activity(
                         task=task,
                         user=request.user,
                         action=action,
@@ -787,17 +598,27 @@ def create_task_from_email(request, email_id):
     customers = Customer.objects.all()
     tasknames = TaskName.objects.all()
     country_codes = CountryCodes.objects.all()
+    if email.has_attachments:
+        try:
+            # The task links the attachments: wait for a prefetch that holds some of them
+            download_attachments([email], wait=True)
+        except Exception as e:
+            messages.warning(request, f"⚠️ Could not download the email attachments: {e}")
     attachments = email.attachment_set.all()
+    attachments_pending = any(a.is_downloading for a in attachments)
 
-    # ✅ Filter out useless attachments
+    # ✅ Filter out useless (and not downloaded) attachments
     valid_attachments = [
         a for a in attachments
-        if not is_useless_attachment(a.file.path, a.filename or os.path.basename(a.file.name))
+        if a.file and not attachment_is_useless(a)
     ]
 
     if request.method == 'POST':
         form = TaskForm(request.POST, request.FILES)
-        if form.is_valid():
+        if attachments_pending:
+            # Creating the task now would leave the missing attachments out of it
+            messages.error(request, "The email attachments are still downloading, please submit again in a moment.")
+        elif form.is_valid():
             try:
                 with transaction.atomic():
                     task = form.save(commit=False)
@@ -807,9 +628,9 @@ def create_task_from_email(request, email_id):
 
                     # ✅ Link filtered attachment(s)
                     if len(valid_attachments) > 1:
-                        zip_file, zip_name = zip_email_attachments(email)
-                        if zip_file:
-                            task.file_name.save(zip_name, zip_file, save=False)
+                        zip_path, zip_name = zip_email_attachments(email)
+                        if zip_path:
+                            task.file_name = zip_path
                     elif len(valid_attachments) == 1:
                         task.file_name = valid_attachments[0].file
 
@@ -827,7 +648,7 @@ def create_task_from_email(request, email_id):
                     email.save()
 
                     # Log the action
-                    TaskActivityLog.objects.create(
+                    record_task_activity(
                         task=task,
                         user=request.user,
                         action=f"Task created from email by {request.user.get_full_name()}",
@@ -964,7 +785,7 @@ def update_task_view(request, pk):
                         log_parts.append(f"changed Cutomer from {old_customer} to {task.customer_name}")
 
                     if len(log_parts) > 1:
-                        TaskActivityLog.objects.create(
+                        record_task_activity(
                             task=task,
                             user=request.user,
                             action=', '.join(log_parts),
@@ -1004,7 +825,7 @@ def task_detail(request, pk):
     # task = get_object_or_404(Task.objects.prefetch_related('payments', 'payment_status'), pk=pk)
     task = Task.objects.select_related('payment_status').prefetch_related('payments').get(id=pk)
 
-    total_paid = task.payments.aggregate(total=Sum('amount'))['total'] or 0
+    total_paid = task.total_paid
     balance = task.final_price - total_paid
     print('is paid', task.is_paid)
     close_task_form = CloseTaskForm()
@@ -1022,7 +843,7 @@ def task_detail(request, pk):
     pm_logs = task.activity_logs.filter(action__icontains='as project manager')
     subtask_form = SubtaskForm(task=task)
 
-    Notification.objects.filter(user=request.user, task=task, is_read=False).update(is_read=True)
+    mark_notifications_read(Notification.objects.filter(user=request.user, task=task))
 
     user_subtasks = subtasks.filter(user=request.user)
     if user_subtasks.exists():
@@ -1108,7 +929,7 @@ def add_subtask_modal(request, main_task_id):
                 messages.warning(request, f"Notification failed: {e}")
 
             # Log the action
-            TaskActivityLog.objects.create(
+            record_task_activity(
                 task=main_task,
                 user=request.user,
                 action=f"assigned {subtask.user.get_full_name()} operator to subtask",
@@ -1139,7 +960,8 @@ def update_subtask_modal(request, main_task_id):
         try:
             with transaction.atomic():
                 subtask_id = request.POST.get('subtask_id')
-                subtask = get_object_or_404(Subtask, id=subtask_id, task=main_task)
+                # Through the related manager so the signals refresh main_task's subtask counters
+                subtask = get_object_or_404(main_task.subtask_set, id=subtask_id)
 
                 # Capture old values BEFORE form binds
                 was_done = subtask.is_done
@@ -1195,7 +1017,7 @@ def update_subtask_modal(request, main_task_id):
                     if just_completed and (final_location or other_location):
                         location_info = f", location set to: {main_task.resolved_final_location}"
 
-                    TaskActivityLog.objects.create(
+                    record_task_activity(
                         task=main_task,
                         user=request.user,
                         action=f"Updated subtask: {updated_subtask.name}{price_info}{done_info}{location_info}",
@@ -1278,7 +1100,7 @@ def close_task_modal(request, pk):
                 resolved_location = task.resolved_final_location or "Not specified"
 
                 # Log the action with location
-                TaskActivityLog.objects.create(
+                record_task_activity(
                     task=task,
                     user=request.user,
                     action=f"Task closed by: {request.user.get_full_name()}, Final location: {resolved_location}",
@@ -1322,7 +1144,7 @@ def undo_close_task_modal(request, pk):
         task.save()
 
         # Log the action with location
-        TaskActivityLog.objects.create(
+        record_task_activity(
             task=task,
             user=request.user,
             action=f"Task unclosed by: {request.user.get_full_name()}",
@@ -1358,7 +1180,7 @@ def send_cancel_request_modal(request, pk):
             subtask.cancel_requested = True
             form.save()
 
-            TaskActivityLog.objects.create(
+            record_task_activity(
                 task=task,
                 user=user,
                 action="Cancel request submitted by operator",
@@ -1389,7 +1211,7 @@ def undo_cancel_subtask_request_modal(request, pk):
         subtask.cancel_subtask_reason  = ''
         subtask.save()
 
-        TaskActivityLog.objects.create(
+        record_task_activity(
             task=task,
             user=user,
             action="Cancel request undone by operator",
@@ -1410,7 +1232,7 @@ def approve_cancel_request_modal(request, pk):
     subtask_id = request.POST.get('subtask_id')
     user = request.user
     task = get_object_or_404(Task, id=pk)
-    subtask = get_object_or_404(Subtask, id=subtask_id, task=task)
+    subtask = get_object_or_404(task.subtask_set, id=subtask_id)
 
     # Permission check: task creator or user in Developer/Manager groups
     if not (
@@ -1426,20 +1248,19 @@ def approve_cancel_request_modal(request, pk):
         subtask.cancel_requested = False
         subtask.save()
 
-        TaskActivityLog.objects.create(
+        record_task_activity(
             task=task,
             user=user,
             action="Cancel request approved",
             note=f"Subtask '{subtask}' has been canceled."
         )
 
-        # Check if it's the only subtask for the task
-        active_subtasks = task.subtask_set.filter(is_canceled=False, is_closed=False)
-        if active_subtasks.count() == 0:
+        # Check if it's the only subtask for the task (the signals refreshed task's counters)
+        if task.canceled_subtask_count == task.subtask_count:
             task.canceled = True
             task.status= 'canceled'
             task.save()
-            TaskActivityLog.objects.create(
+            record_task_activity(
                 task=task,
                 user=user,
                 action="Main task canceled due to single subtask cancellation",
@@ -1470,7 +1291,7 @@ def cancel_task_modal(request, pk):
             task.status = 'canceled'
             task.save()
 
-            TaskActivityLog.objects.create(
+            record_task_activity(
                 task=task,
                 user=user,
                 action="Task has been canceled",
@@ -1498,12 +1319,13 @@ def deliver_job(request, job_id):
                     delivered_form.main_task = task
                     delivered_form.created_by = request.user
                     delivered_form.is_delivered = True
+                    # The DeliveredTask signal also sets task.delivered_at / is_delivered
                     delivered_form.save()
 
                     task.status = 'delivered'
                     task.save()
 
-                    TaskActivityLog.objects.create(
+                    record_task_activity(
                         task=task,
                         user=request.user,
                         action=f"Job has been delivered by {delivered_form.delivered_by} to {delivered_form.received_person}",